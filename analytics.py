@@ -0,0 +1,80 @@
+"""This module contains RankAnalytics class."""
+import numpy as np
+
+# The rank is also compared with the rank this many years before.
+LOOKBACK_YEARS = 10
+# Columns that can be sorted, the highest value comes first unless ascending.
+COLUMNS = ('value', 'change', 'change_n', 'delta', 'gap', 'percentile')
+
+
+class RankAnalytics:
+    """This class computes how the ranks and values move over the years, for every
+    country, year and sex at once from the arrays of a RankCube:
+
+    change      places gained since the previous year (positive is up)
+    change_n    places gained since lookback years before
+    delta       life expectancy gained since the previous year
+    gap         life expectancy of females minus males
+    percentile  share of the ranked countries that are ranked below, 100 is the best
+
+    An array is NaN where the country has no value in either year. Each column is
+    sorted once, so the table can be sorted by any of them without computing anything.
+    """
+    def __init__(self, rank_cube, lookback=LOOKBACK_YEARS):
+        self.rank_cube = rank_cube
+        self.lookback = lookback
+        values = rank_cube.values
+        rank = np.where(rank_cube.rank > 0, rank_cube.rank, np.nan).astype(np.float32)
+        self.has_value = rank_cube.rank > 0
+
+        self.columns = {'value': values}
+        self.columns['change'] = self.years_ago(rank, 1) - rank
+        self.columns['change_n'] = self.years_ago(rank, lookback) - rank
+        self.columns['delta'] = values - self.years_ago(values, 1)
+        if 'Female' in rank_cube.sexes and 'Male' in rank_cube.sexes:
+            gap = values[:, :, rank_cube.sexes.index('Female')] \
+                - values[:, :, rank_cube.sexes.index('Male')]
+        else:
+            gap = np.full(values.shape[:2], np.nan, dtype=np.float32)
+        self.columns['gap'] = np.broadcast_to(gap[:, :, np.newaxis], values.shape)
+        counts = rank_cube.counts[np.newaxis].astype(np.float32)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percentile = np.where(counts > 1, 100 * (counts - rank) / (counts - 1), 100)
+        self.columns['percentile'] = np.where(np.isnan(rank), np.nan, percentile)
+
+        # orders[column][:, y, s] lists the countries from the highest value to the
+        # lowest with NaN at the end, known[column][y, s] is the number without NaN
+        self.orders = {'value': rank_cube.order}
+        self.known = {'value': rank_cube.counts}
+        for column in COLUMNS[1:]:
+            self.orders[column] = np.argsort(-self.columns[column], axis=0, kind='stable')
+            self.known[column] = np.count_nonzero(~np.isnan(self.columns[column]), axis=0)
+
+    def years_ago(self, array, years):
+        """Return the array shifted along the years, so each year holds the values
+        of the given number of years before, or NaN if that year isn't in the data."""
+        cube_years = self.rank_cube.years
+        shifted = np.full(array.shape, np.nan, dtype=np.float32)
+        before = np.searchsorted(cube_years, cube_years - years)
+        found = (before < len(cube_years)) \
+            & (cube_years[np.minimum(before, len(cube_years) - 1)] == cube_years - years)
+        shifted[:, found] = array[:, before[found]]
+        return shifted
+
+    def ranking(self, column, year, sex="Both sexes", ascending=False):
+        """Return the indexes of the countries ranked in the year sorted by the column,
+        the ones whose column is NaN come last in both directions."""
+        y, s = self.rank_cube.position(year, sex)
+        order = self.orders[column][:, y, s]
+        known = order[:self.known[column][y, s]]
+        unknown = order[self.known[column][y, s]:]
+        if ascending:
+            known = known[::-1]
+        known = known[self.has_value[known, y, s]]
+        unknown = unknown[self.has_value[unknown, y, s]]
+        return np.concatenate([known, unknown])
+
+    def rows(self, indexes, year, sex="Both sexes"):
+        """Return the values of every column of the countries in the year as lists."""
+        y, s = self.rank_cube.position(year, sex)
+        return {column: array[indexes, y, s].tolist() for column, array in self.columns.items()}
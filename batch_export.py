@@ -0,0 +1,264 @@
+"""Export the rankings and the charts of every country without the user interface.
+
+Run it with python batch_export.py OUTPUT_DIR [--offline] [--formats png,svg]
+[--workers N] [--force] [--indicator CODE]. It loads the data of the indicator (life
+expectancy by default) like the application does, writes the
+ranking of every year and sex to rankings.csv and rankings.json and renders the line
+chart and the bar chart of each year of every country, in processes that use the Agg
+backend. The files go in a directory named after the code of the indicator in
+OUTPUT_DIR, so the exports of several indicators can share it. The hash of the inputs
+of every output is kept in manifest.json, outputs whose inputs haven't changed are
+skipped unless --force is given.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from dataset import load_indicator_data
+from http_cache import HttpCache
+from indicators import DEFAULT_INDICATOR, INDICATORS, LIFE_EXPECTANCY
+from rank_cube import RankCube
+from series_store import SeriesStore
+
+# Changing the look of the charts must change this so they are exported again.
+CHART_VERSION = 1
+CHART_SIZE = (8, 4.6)
+CHART_DPI = 100
+COLORS = {'Both sexes': "Green", 'Female': "Red", 'Male': "Blue"}
+MANIFEST = 'manifest.json'
+
+# figures of the worker process, they are made once and reused for every country
+_figures = {}
+
+
+def file_name(country):
+    """Return a name of the country that can be used in a path."""
+    return ''.join(char if char.isalnum() else '_' for char in country.strip()).strip('_')
+
+
+def digest(*parts):
+    """Return the sha256 of the parts, arrays are hashed by their bytes."""
+    sha = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            sha.update(np.ascontiguousarray(part).tobytes())
+        else:
+            sha.update(repr(part).encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def ranking_rows(rank_cube):
+    """Yield (year, sex, rank, code, country, value) of every ranked country."""
+    for year in rank_cube.years:
+        for sex in rank_cube.sexes:
+            ranks, countries, values = rank_cube.table(year, sex)
+            codes = rank_cube.codes[rank_cube.ranking(year, sex)]
+            for rank, code, country, value in zip(ranks.tolist(), codes, countries,
+                                                  values.tolist()):
+                yield int(year), sex, rank, code, country.strip(), round(value, 3)
+
+
+def export_rankings(rank_cube, directory):
+    """Write the ranking of every year and sex as csv and json."""
+    rows = list(ranking_rows(rank_cube))
+    columns = ['Year', 'Sex', 'Rank', 'Code', 'Country', 'Value']
+    with open(os.path.join(directory, 'rankings.csv'), 'w', newline='',
+              encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    with open(os.path.join(directory, 'rankings.json'), 'w', encoding='utf-8') as json_file:
+        json.dump([dict(zip(columns, row)) for row in rows], json_file)
+    return ['rankings.csv', 'rankings.json']
+
+
+def chart_figures():
+    """Return the line and bar figures of this process, made the first time."""
+    if not _figures:
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        for name in ('line', 'bar'):
+            figure = Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+            FigureCanvasAgg(figure)
+            _figures[name] = figure
+    return _figures['line'], _figures['bar']
+
+
+def render_country(task):
+    """Render the line chart and the bar chart of each year of one country
+    and return the paths written, relative to the output directory.
+
+    It runs in a worker process, task is a dict made by country_tasks.
+    """
+    line_figure, bar_figure = chart_figures()
+    country, table, indicator = task['country'], task['table'], task['indicator']
+    earliest, latest = task['years']
+    low, high = task['limits']
+    sexes = [sex for sex in COLORS if sex in table.columns]
+    directory = os.path.join(task['directory'], 'charts', task['name'])
+    os.makedirs(directory, exist_ok=True)
+    written = []
+
+    line_figure.clear()
+    axes = line_figure.add_subplot()
+    for sex in sexes:
+        axes.plot(table.index, table[sex], color=COLORS[sex], label=sex)
+    axes.set_xticks(np.arange(earliest, latest, 5))
+    axes.tick_params(axis='x', labelrotation=90)
+    axes.set_xlim(earliest, latest)
+    axes.set_ylim(low, high)
+    axes.set_xlabel("Year")
+    axes.set_ylabel(indicator.label)
+    axes.grid(True)
+    axes.legend()
+    axes.set_title(f"{indicator.name} in\n {country}\n from {earliest} to {latest}", pad=12)
+    line_figure.tight_layout()
+    for chart_format in task['formats']:
+        path = os.path.join(directory, f'line.{chart_format}')
+        line_figure.savefig(path)
+        written.append(path)
+
+    # the bars are made once and only their heights, labels and title change each year
+    bar_figure.clear()
+    axes = bar_figure.add_subplot()
+    positions = np.arange(len(sexes))
+    bars = axes.bar(positions, np.zeros(len(sexes)), color=[COLORS[sex] for sex in sexes],
+                    edgecolor="black")
+    axes.set_xticks(positions, sexes)
+    axes.set_ylim(low, high)
+    axes.set_xlabel("Sex")
+    axes.set_ylabel(indicator.label)
+    axes.grid(True)
+    axes.set_axisbelow(True)
+    labels = []
+    for year, values in zip(table.index, table[sexes].to_numpy()):
+        for rect, value in zip(bars, values):
+            rect.set_height(0 if np.isnan(value) else value)
+        for label in labels:
+            label.remove()
+        labels = axes.bar_label(bars, labels=["No data" if np.isnan(value)
+                                              else f"{value:.{indicator.digits}f}"
+                                              for value in values])
+        axes.set_title(f"{indicator.name} in \n{country} in {year}")
+        for chart_format in task['formats']:
+            path = os.path.join(directory, f'bar_{year}.{chart_format}')
+            bar_figure.savefig(path)
+            written.append(path)
+    return [os.path.relpath(path, task['directory']) for path in written]
+
+
+def country_tasks(series_store, directory, formats, indicator=LIFE_EXPECTANCY):
+    """Yield (key, input hash, task) of every country."""
+    years = (series_store.earliest_year, series_store.latest_year)
+    limits = (series_store.min_value, series_store.max_value)
+    for country in series_store.countries:
+        table = series_store.series(country)
+        key = f"charts/{file_name(country)}"
+        inputs = digest(CHART_VERSION, CHART_SIZE, CHART_DPI, sorted(formats), country,
+                        indicator.code, indicator.label, years, limits, list(table.columns),
+                        table.index.to_numpy(), table.to_numpy())
+        yield key, inputs, {'country': country, 'name': file_name(country), 'table': table,
+                            'years': years, 'limits': limits, 'formats': formats,
+                            'directory': directory, 'indicator': indicator}
+
+
+def up_to_date(directory, entry, inputs):
+    """Return True if the outputs of a manifest entry were made from the same inputs
+    and are all still there."""
+    return entry is not None and entry['inputs'] == inputs and all(
+        os.path.exists(os.path.join(directory, path)) for path in entry['outputs'])
+
+
+def load_manifest(directory):
+    """Return the manifest of a previous export, or an empty one."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    """Write the manifest, replacing the old one only once it is complete."""
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def export(directory, cache=None, formats=('png',), workers=None, force=False,
+           indicator=LIFE_EXPECTANCY):
+    """Export the rankings and the charts of the indicator into its own directory in the
+    directory and return (number of outputs exported, number skipped)."""
+    # every indicator has its own outputs and manifest
+    directory = os.path.join(directory, indicator.code)
+    os.makedirs(directory, exist_ok=True)
+    life_exp_data = load_indicator_data(indicator, cache)
+    rank_cube = RankCube(life_exp_data)
+    series_store = SeriesStore(life_exp_data, max_size=0)
+    manifest = {} if force else load_manifest(directory)
+    exported = skipped = 0
+
+    inputs = digest(indicator.code, rank_cube.years, rank_cube.sexes, list(rank_cube.countries),
+                    list(rank_cube.codes), rank_cube.values)
+    if up_to_date(directory, manifest.get('rankings'), inputs):
+        skipped += 1
+    else:
+        manifest['rankings'] = {'inputs': inputs,
+                                'outputs': export_rankings(rank_cube, directory)}
+        exported += 1
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for key, inputs, task in country_tasks(series_store, directory, list(formats),
+                                                   indicator):
+                if up_to_date(directory, manifest.get(key), inputs):
+                    skipped += 1
+                    continue
+                futures[executor.submit(render_country, task)] = key, inputs, task['country']
+            for done, future in enumerate(as_completed(futures), 1):
+                key, inputs, country = futures[future]
+                manifest[key] = {'inputs': inputs, 'outputs': future.result()}
+                exported += 1
+                print(f"[{done}/{len(futures)}] {country.strip()}", flush=True)
+    finally:
+        # the charts that are done are not exported again by the next run
+        save_manifest(directory, manifest)
+    return exported, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the rankings of an indicator "
+                                                 "and the charts of every country.")
+    parser.add_argument('directory', help="directory the files of the indicator are "
+                                          "written to a directory in")
+    parser.add_argument('--offline', action='store_true',
+                        help="use the cached data without using the network")
+    parser.add_argument('--formats', default='png',
+                        help="comma separated chart formats, e.g. png,svg")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of rendering processes, the number of cores by default")
+    parser.add_argument('--force', action='store_true',
+                        help="export everything even if the inputs haven't changed")
+    parser.add_argument('--indicator', choices=list(INDICATORS), default=DEFAULT_INDICATOR,
+                        help="code of the indicator, life expectancy by default")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    exported, skipped = export(args.directory, HttpCache(offline=args.offline),
+                               args.formats.split(','), args.workers, args.force,
+                               INDICATORS[args.indicator])
+    print(f"Exported {exported}, skipped {skipped} unchanged "
+          f"in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
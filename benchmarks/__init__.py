@@ -0,0 +1,2 @@
+"""Benchmarks of the data pipeline, the ranking page, the detail windows and
+the rendering of the figures. Run them with python -m benchmarks.run."""
@@ -0,0 +1,550 @@
+"""Run the benchmarks and compare them with the stored baseline.
+
+python -m benchmarks.run [--scales fixture,1,10] [--repeat 3] [--only update_table]
+                         [--save-baseline] [--tolerance 0.25]
+
+Every benchmark runs offline. The csv files are served by stub_server.py, the
+fixtures come from benchmarks/fixtures and the scaled datasets are written by
+benchmarks.synthetic the first time they are used. The time is the best of the repeats
+and the peak memory is measured with tracemalloc in one more run, it counts the
+allocations of Python and numpy but not the buffers of the pandas csv parser.
+Without a display the tkinter widgets are replaced by small stand-ins, run the
+benchmarks under xvfb-run to measure the real widgets. The figures are always
+rendered with Agg.
+
+The exit status is 1 when a benchmark is slower or uses more memory than its baseline
+by more than the tolerance.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import tkinter as tk
+from tkinter import ttk
+from types import SimpleNamespace
+import sdmx
+from benchmarks import synthetic
+from indicators import LIFE_EXPECTANCY
+from stub_server import StubServer
+
+# Factors of (countries, years, sexes) of each scale, 1 is about the size of the real data.
+SCALES = {'fixture': None,
+          '1': (1, 1, 1),
+          '10': (10, 1, 1),
+          '100': (10, 10, 1),
+          '1000': (10, 25, 4)}
+DEFAULT_SCALES = 'fixture,1,10'
+DEFAULT_REPEAT = 3
+# Allowed slowdown or memory growth compared with the baseline.
+DEFAULT_TOLERANCE = 0.25
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# The scaled datasets are big, they are kept here between runs.
+DATA_DIR = os.environ.get('LIFE_EXP_BENCH_DIR',
+                          os.path.join(tempfile.gettempdir(), 'life_exp_benchmarks'))
+# Number of countries and years drawn by the rendering benchmarks.
+RENDER_COUNT = 20
+
+
+class Variable:
+    """Stand-in for a tkinter variable."""
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class Label:
+    """Stand-in for a ttk label."""
+    def __init__(self):
+        self.options = {}
+
+    def config(self, **options):
+        self.options.update(options)
+
+
+class Treeview:
+    """Stand-in for a ttk treeview, it keeps the items and their order."""
+    def __init__(self):
+        self.items = {}
+        self.children = ()
+
+    def insert(self, parent, index, iid, values):
+        self.items[iid] = values
+
+    def item(self, iid, values=None):
+        if values is not None:
+            self.items[iid] = values
+        return {'values': self.items[iid]}
+
+    def set_children(self, parent, *iids):
+        self.children = iids
+
+    def heading(self, column, text):
+        pass
+
+    def focus(self, iid):
+        pass
+
+    def selection_set(self, iid):
+        pass
+
+    def see(self, iid):
+        pass
+
+
+class Widgets:
+    """Makes real tkinter widgets when there is a display and stand-ins when there isn't."""
+    def __init__(self):
+        try:
+            self.root = tk.Tk()
+            self.root.withdraw()
+        except tk.TclError:
+            self.root = None
+        self.mode = 'tk' if self.root is not None else 'stub'
+
+    def variable(self, value):
+        if self.root is None:
+            return Variable(value)
+        variable = tk.IntVar(self.root) if isinstance(value, int) else tk.StringVar(self.root)
+        variable.set(value)
+        return variable
+
+    def label(self):
+        return Label() if self.root is None else ttk.Label(self.root)
+
+    def treeview(self):
+        if self.root is None:
+            return Treeview()
+        return ttk.Treeview(self.root, columns=('rank', 'country', 'life_exp'), show='headings')
+
+    def update(self):
+        """Let tkinter process the pending work, e.g. redrawing the treeview."""
+        if self.root is not None:
+            self.root.update()
+
+    def destroy(self):
+        if self.root is not None:
+            self.root.destroy()
+
+
+class Dataset:
+    """The csv files of one scale, served by a local stand-in of the servers, and the
+    objects built from them, which are only made when a benchmark needs them."""
+    def __init__(self, scale):
+        if SCALES[scale] is None:
+            self.directory = synthetic.FIXTURE_DIR
+        else:
+            self.directory = os.path.join(DATA_DIR, scale)
+            synthetic.write_dataset(self.directory, SCALES[scale])
+        self.server = StubServer(self.directory).start()
+        self.life_expectancy_url = sdmx.data_url(base=self.server.sdmx_base)
+        self.country_name_url = self.server.country_url
+        self._built = None
+
+    def build(self):
+        """Return the cleaned data, its rank cube and series store."""
+        # pylint: disable=import-outside-toplevel
+        from dataset import load_life_exp_data
+        from rank_cube import RankCube
+        from series_store import SeriesStore
+        if self._built is None:
+            data = load_life_exp_data()
+            self._built = data, RankCube(data), SeriesStore(data)
+        return self._built
+
+    def warm_up(self):
+        """Let the server answer the query of the countries once, its answers are kept,
+        so the benchmarks measure the client instead of the stand-in filtering the csv."""
+        # pylint: disable=import-outside-toplevel
+        from dataset import COUNTRY_NAME_COLUMNS, country_alpha_codes, download_csv_from_url
+        codes = country_alpha_codes(download_csv_from_url(self.country_name_url,
+                                                          columns=COUNTRY_NAME_COLUMNS))
+        self.server.recording.query(set(codes))
+
+    def close(self):
+        self.server.stop()
+
+
+def use_urls(dataset):
+    """Point the data modules at the local server."""
+    import dataset as data_module  # pylint: disable=import-outside-toplevel
+    sdmx.SDMX_BASE = dataset.server.sdmx_base
+    data_module.COUNTRY_NAME_URL = dataset.country_name_url
+
+
+def parse_csv(dataset, widgets):
+    """download_csv_from_url parsing the life expectancy csv."""
+    # pylint: disable=import-outside-toplevel
+    from dataset import LIFE_EXPECTANCY_COLUMNS, download_csv_from_url
+    return lambda: download_csv_from_url(dataset.life_expectancy_url,
+                                         columns=LIFE_EXPECTANCY_COLUMNS)
+
+
+def parse_csv_filtered(dataset, widgets):
+    """download_csv_from_url parsing the csv and keeping only the countries."""
+    # pylint: disable=import-outside-toplevel
+    from dataset import (COUNTRY_NAME_COLUMNS, LIFE_EXPECTANCY_COLUMNS,
+                         country_alpha_codes, download_csv_from_url)
+    codes = country_alpha_codes(download_csv_from_url(dataset.country_name_url,
+                                                      columns=COUNTRY_NAME_COLUMNS))
+
+    def only_countries(chunk):
+        return chunk[chunk.REF_AREA.isin(codes)]
+    return lambda: download_csv_from_url(dataset.life_expectancy_url,
+                                         columns=LIFE_EXPECTANCY_COLUMNS,
+                                         row_filter=only_countries)
+
+
+def download_flaky(dataset, widgets):
+    """download_csv_from_url of the country codes and the life expectancy csv while the
+    server breaks every second body and fails every third request, so the body is
+    resumed twice and one request is retried. The waits before retrying are left out."""
+    # pylint: disable=import-outside-toplevel
+    import transport
+    from dataset import COUNTRY_NAME_COLUMNS, LIFE_EXPECTANCY_COLUMNS, download_csv_from_url
+    dataset.warm_up()
+
+    def run():
+        backoff = transport.BACKOFF
+        transport.BACKOFF = 0
+        dataset.server.inject(fail_every=3, cut_every=2)
+        try:
+            download_csv_from_url(dataset.country_name_url, columns=COUNTRY_NAME_COLUMNS)
+            download_csv_from_url(dataset.life_expectancy_url, columns=LIFE_EXPECTANCY_COLUMNS)
+        finally:
+            dataset.server.inject()
+            transport.BACKOFF = backoff
+    return run
+
+
+def pipeline_cold(dataset, widgets):
+    """download_and_clean_data with an empty cache: download, clean, rank, save the snapshot."""
+    # pylint: disable=import-outside-toplevel
+    from download_data import DownloadData
+    from http_cache import HttpCache
+    dataset.warm_up()
+    loader = SimpleNamespace(cache=HttpCache(tempfile.mkdtemp(prefix='life_exp_cache_')),
+                             progress=None)
+    return functools.partial(DownloadData.download_and_clean_data, loader)
+
+
+def pipeline_snapshot(dataset, widgets):
+    """download_and_clean_data when the cache and its snapshot are fresh."""
+    # pylint: disable=import-outside-toplevel
+    from download_data import DownloadData
+    run = pipeline_cold(dataset, widgets)
+    run()
+    return functools.partial(DownloadData.download_and_clean_data, run.args[0])
+
+
+def detail_stub(dataset, widgets):
+    """Return an object with the state and methods that DetailPlot's updates use."""
+    from detail import DetailPlot  # pylint: disable=import-outside-toplevel
+
+    class Detail:  # pylint: disable=too-few-public-methods
+        update_rank = DetailPlot.update_rank
+        update_data = DetailPlot.update_data
+        init_plots = DetailPlot.init_plots
+        plot_line = DetailPlot.plot_line
+        plot_bar = DetailPlot.plot_bar
+
+    _, rank_cube, series_store = dataset.build()
+    detail = Detail()
+    detail.indicator = LIFE_EXPECTANCY
+    detail.rank_cube = rank_cube
+    detail.series_store = series_store
+    detail.country_name = widgets.variable(str(rank_cube.countries[0]))
+    detail.year = widgets.variable(int(rank_cube.years[-1]))
+    detail.message = widgets.label()
+    detail.data_country = None
+    detail.latest_year = series_store.latest_year
+    detail.earliest_year = series_store.earliest_year
+    detail.min_value = series_store.min_value
+    detail.max_value = series_store.max_value
+    detail.sexes = ['Both sexes', 'Female', 'Male']
+    detail.sex_filters = list(detail.sexes)
+    detail.colors = {'Male': "Blue", "Female": "Red", "Both sexes": "Green"}
+    detail.colors_in_plot = [detail.colors[sex] for sex in detail.sex_filters]
+    return detail
+
+
+def update_rank(dataset, widgets):
+    """DetailPlot.update_rank for every country in every year."""
+    detail = detail_stub(dataset, widgets)
+    years = [int(year) for year in detail.rank_cube.years]
+
+    def run():
+        for country in detail.rank_cube.countries:
+            detail.country_name.set(str(country))
+            for year in years:
+                detail.year.set(year)
+                detail.update_rank()
+    return run
+
+
+def update_data(dataset, widgets):
+    """DetailPlot.update_data for every country, with a new series store."""
+    from series_store import SeriesStore  # pylint: disable=import-outside-toplevel
+    detail = detail_stub(dataset, widgets)
+    detail.series_store = SeriesStore(dataset.build()[0])
+
+    def run():
+        for country in detail.rank_cube.countries:
+            detail.country_name.set(str(country))
+            detail.update_data()
+    return run
+
+
+def ranking_stub(dataset, widgets):
+    """Return an object with the state and methods that RankingPage's updates use."""
+    # pylint: disable=import-outside-toplevel
+    from analytics import RankAnalytics
+    from ranking_page import RankingPage
+    from search_index import SearchIndex
+
+    class Ranking:  # pylint: disable=too-few-public-methods
+        update_table = RankingPage.update_table
+        show_sort_heading = RankingPage.show_sort_heading
+        alert = RankingPage.alert
+
+    _, rank_cube, _ = dataset.build()
+    ranking = Ranking()
+    ranking.indicator = LIFE_EXPECTANCY
+    ranking.rank_cube = rank_cube
+    ranking.analytics = RankAnalytics(rank_cube)
+    ranking.search_index = SearchIndex(rank_cube.countries, rank_cube.codes)
+    ranking.sex = widgets.variable("Both sexes")
+    ranking.sort_column = 'value'
+    ranking.headings = {}
+    ranking.year = widgets.variable(int(rank_cube.years[-1]))
+    ranking.ascending = widgets.variable(0)
+    ranking.user_input = widgets.variable('')
+    ranking.label_table_title = widgets.label()
+    ranking.label_alert = widgets.label()
+    ranking.table = widgets.treeview()
+    ranking.row_values = {}
+    ranking.row_order = []
+    ranking.row_set = set()
+    ranking.shown = None
+    return ranking
+
+
+def update_table(dataset, widgets):
+    """RankingPage.update_table for every year in both sort orders, into an empty table,
+    then sorted by each analytics column in the latest year."""
+    from analytics import COLUMNS  # pylint: disable=import-outside-toplevel
+    ranking = ranking_stub(dataset, widgets)
+    years = [int(year) for year in ranking.rank_cube.years]
+
+    def run():
+        for year in years:
+            ranking.year.set(year)
+            for ascending in (0, 1):
+                ranking.ascending.set(ascending)
+                ranking.update_table()
+        for column in COLUMNS:
+            ranking.sort_column = column
+            ranking.update_table()
+        widgets.update()
+    return run
+
+
+def alert(dataset, widgets):
+    """RankingPage.alert for the name of every country, its code, lower case
+    names and misspelt names that need the fuzzy search."""
+    ranking = ranking_stub(dataset, widgets)
+    ranking.update_table()
+    names = [str(country).strip() for country in ranking.rank_cube.countries]
+    queries = (names + [str(code) for code in ranking.rank_cube.codes]
+               + [name.lower() for name in names] + [name[1:] + 'x' for name in names])
+
+    def run():
+        for query in queries:
+            ranking.user_input.set(query)
+            ranking.alert()
+    return run
+
+
+def render_stub(dataset, widgets):
+    """Return a detail stub drawing on Agg figures of the size of a detail window."""
+    # pylint: disable=import-outside-toplevel
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    detail = detail_stub(dataset, widgets)
+    for name, axes in (('line', 'axes_line'), ('bar', 'axes_year')):
+        figure = Figure(figsize=(8, 4.6))
+        setattr(detail, f'fig_canvas_{name}', FigureCanvasAgg(figure))
+        setattr(detail, axes, figure.add_subplot())
+    detail.init_plots()
+    return detail
+
+
+def render_line(dataset, widgets):
+    """DetailPlot.plot_line for RENDER_COUNT countries, each one drawn with Agg."""
+    detail = render_stub(dataset, widgets)
+    countries = [str(country) for country in detail.rank_cube.countries[:RENDER_COUNT]]
+    for country in countries:
+        detail.series_store.series(country)
+
+    def run():
+        for country in countries:
+            detail.country_name.set(country)
+            detail.plot_line()
+    return run
+
+
+def render_bar(dataset, widgets):
+    """DetailPlot.plot_bar for the last RENDER_COUNT years, each one drawn with Agg."""
+    detail = render_stub(dataset, widgets)
+    years = [int(year) for year in detail.rank_cube.years[-RENDER_COUNT:]]
+
+    def run():
+        for year in years:
+            detail.year.set(year)
+            detail.plot_bar()
+    return run
+
+
+BENCHMARKS = {
+    'parse_csv': parse_csv,
+    'parse_csv_filtered': parse_csv_filtered,
+    'download_flaky': download_flaky,
+    'pipeline_cold': pipeline_cold,
+    'pipeline_snapshot': pipeline_snapshot,
+    'update_rank': update_rank,
+    'update_data': update_data,
+    'update_table': update_table,
+    'alert': alert,
+    'render_line': render_line,
+    'render_bar': render_bar,
+}
+
+
+def measure(setup, repeat):
+    """Return the best time in seconds of repeat runs and the peak traced memory
+    in bytes of one more run. setup() is called before each run and isn't measured."""
+    best = float('inf')
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    run = setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(scales, repeat, only=None):
+    """Run the benchmarks at each scale and return {name@scale: result}."""
+    results = {}
+    widgets = Widgets()
+    original = tempfile.tempdir
+    # the caches of the pipeline benchmarks are removed at the end
+    tempfile.tempdir = tempfile.mkdtemp(prefix='life_exp_benchmarks_')
+    try:
+        for scale in scales:
+            dataset = Dataset(scale)
+            use_urls(dataset)
+            try:
+                for name, benchmark in BENCHMARKS.items():
+                    if only and only not in name:
+                        continue
+                    seconds, peak = measure(functools.partial(benchmark, dataset, widgets),
+                                            repeat)
+                    key = f"{name}@{scale}"
+                    results[key] = {'seconds': seconds, 'peak_bytes': peak,
+                                    'mode': widgets.mode}
+                    print(f"{key:<28} {seconds * 1000:10.1f} ms {peak / 1e6:10.1f} MB",
+                          flush=True)
+            finally:
+                dataset.close()
+    finally:
+        shutil.rmtree(tempfile.tempdir, ignore_errors=True)
+        tempfile.tempdir = original
+        widgets.destroy()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each result against the baseline and return the names of the regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'time':>10} {'baseline':>10} {'peak':>10} {'baseline':>10}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None or base.get('mode') != result['mode']:
+            print(f"{key:<28} {result['seconds'] * 1000:8.1f}ms {'-':>10} "
+                  f"{result['peak_bytes'] / 1e6:8.1f}MB {'-':>10}")
+            continue
+        time_ratio = result['seconds'] / base['seconds']
+        peak_ratio = result['peak_bytes'] / max(base['peak_bytes'], 1)
+        flag = ''
+        if time_ratio > 1 + tolerance or peak_ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:<28} {result['seconds'] * 1000:8.1f}ms {time_ratio:9.2f}x "
+              f"{result['peak_bytes'] / 1e6:8.1f}MB {peak_ratio:9.2f}x{flag}")
+    return regressions
+
+
+def load_baseline(path):
+    """Return the stored results, or an empty dict if there is no baseline."""
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)['results']
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    """Store the results, merged with the stored results of the benchmarks that didn't run."""
+    merged = load_baseline(path)
+    merged.update(results)
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'results': dict(sorted(merged.items()))}, baseline_file, indent=2)
+        baseline_file.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the life expectancy app.")
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help=f"comma separated scales out of {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--only', help="run only the benchmarks whose name contains this")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    scales = args.scales.split(',')
+    for scale in scales:
+        if scale not in SCALES:
+            parser.error(f"unknown scale {scale}")
+    results = run_benchmarks(scales, args.repeat, args.only)
+    regressions = compare(results, load_baseline(args.baseline), args.tolerance)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\nSaved the baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmarks are slower or use more memory than the baseline")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""This module writes csv files in the format of the two data sources,
+with any number of countries, years and sexes.
+
+Run python -m benchmarks.synthetic to write the fixtures again.
+"""
+import csv
+import itertools
+import os
+import random
+import string
+
+# Number of countries, years and sexes of the real data, scaled by the benchmarks.
+BASE_COUNTRIES = 200
+BASE_YEARS = 72
+BASE_SEXES = 3
+FIRST_YEAR = 1950
+# Header of the life expectancy csv from the UNICEF server.
+LIFE_EXPECTANCY_HEADER = ["DATAFLOW", "REF_AREA", "Geographic area", "INDICATOR", "Indicator",
+                          "SEX", "Sex", "TIME_PERIOD", "Time period", "OBS_VALUE",
+                          "Observation Value", "UNIT_MEASURE", "Unit of measure"]
+# The sexes of the real data, more are named Group 4, Group 5 ...
+SEXES = [("_T", "Total"), ("F", "Female"), ("M", "Male")]
+# Rows of regions that aren't countries, the pipeline filters them out.
+AGGREGATES = [("UNICEF_EAP", "East Asia and Pacific"), ("WB_HI", "High income"),
+              ("ZZZ", "Other, non specified")]
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def countries(number):
+    """Return number (alpha-3 code, name) pairs, some names have a part in
+    parentheses like the real ones."""
+    codes = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+    result = []
+    for i, code in zip(range(number), codes):
+        name = f"Country {code}"
+        if i % 7 == 0:
+            name += " (Republic of)"
+        result.append((code, name))
+    return result
+
+
+def sexes(number):
+    """Return number (code, label) pairs of sexes."""
+    return (SEXES + [(f"G{i}", f"Group {i}") for i in range(len(SEXES) + 1, number + 1)])[:number]
+
+
+def write_life_expectancy_csv(path, num_countries=BASE_COUNTRIES, num_years=BASE_YEARS,
+                              num_sexes=BASE_SEXES, seed=0):
+    """Write a life expectancy csv and return the number of rows.
+
+    A few values are missing so some countries aren't ranked in some years.
+    """
+    rng = random.Random(seed)
+    areas = countries(num_countries) + AGGREGATES
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(LIFE_EXPECTANCY_HEADER)
+        for code, name in areas:
+            base = rng.uniform(30, 60)
+            for year in range(FIRST_YEAR, FIRST_YEAR + num_years):
+                if rng.random() < 0.01:
+                    continue
+                for sex_code, sex in sexes(num_sexes):
+                    value = round(base + (year - FIRST_YEAR) * 0.3 + rng.uniform(0, 5), 3)
+                    writer.writerow(["UNICEF:DM(1.0)", code, name, "DM_LIFE_EXP",
+                                     "Life expectancy at birth", sex_code, sex, year, year,
+                                     value, value, "YR", "Years"])
+                    rows += 1
+    return rows
+
+
+def write_country_codes_csv(path, num_countries=BASE_COUNTRIES):
+    """Write a country codes csv in the format of the gist, with spaces after the commas."""
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        csv_file.write("Country,Alpha-2 code,Alpha-3 code,Numeric code,"
+                       "Latitude (average),Longitude (average)\n")
+        for i, (code, name) in enumerate(countries(num_countries)):
+            csv_file.write(f'"{name}", "{code[:2]}", "{code}", "{i}", "0", "0"\n')
+
+
+def write_dataset(directory, scale=(1, 1, 1), seed=0):
+    """Write both csv files scaled by (countries, years, sexes) into the directory
+    and return their paths. Files that already exist are kept."""
+    countries_scale, years_scale, sexes_scale = scale
+    num_countries = BASE_COUNTRIES * countries_scale
+    os.makedirs(directory, exist_ok=True)
+    life_expectancy = os.path.join(directory, 'life_expectancy.csv')
+    country_codes = os.path.join(directory, 'country_codes.csv')
+    if not os.path.exists(life_expectancy):
+        write_life_expectancy_csv(life_expectancy, num_countries, BASE_YEARS * years_scale,
+                                  BASE_SEXES * sexes_scale, seed)
+    if not os.path.exists(country_codes):
+        write_country_codes_csv(country_codes, num_countries)
+    return life_expectancy, country_codes
+
+
+if __name__ == '__main__':
+    # the fixtures are small, the benchmarks make the bigger datasets when they run
+    write_life_expectancy_csv(os.path.join(FIXTURE_DIR, 'life_expectancy.csv'), 12, BASE_YEARS)
+    write_country_codes_csv(os.path.join(FIXTURE_DIR, 'country_codes.csv'), 12)
@@ -0,0 +1,146 @@
+"""This module contains ComparisonPlot class."""
+import tkinter as tk
+from tkinter import ttk
+import matplotlib
+import numpy as np
+from figure_pool import FigurePool
+from indicators import LIFE_EXPECTANCY
+from scheduler import EventCoalescer, THROTTLE_DELAY
+matplotlib.use('TkAgg')
+
+# Width of the group of bars of one country in the bar graph.
+GROUP_WIDTH = 0.8
+# Color of the bars of each sex, the same as in the detail window.
+SEX_COLORS = {"Both sexes": "Green", "Female": "Red", 'Male': "Blue"}
+# Color of the bars of any other sex.
+OTHER_COLOR = "Gray"
+
+
+class ComparisonPlot(ttk.Frame):
+    """A frame comparing the life exp of several countries in one figure,
+    their trends as lines in the left graph and their values in the selected
+    year as grouped bars in the right graph, drawn on a single canvas."""
+    def __init__(self, parent, rank_cube, countries, selected_year, figure_pool=None,
+                 indicator=LIFE_EXPECTANCY, selected_sex=None):
+        super().__init__(parent)
+
+        parent.grid_rowconfigure(0, weight=1)
+        parent.grid_columnconfigure(0, weight=1)
+        self.root = parent
+
+        self.rank_cube = rank_cube
+        self.indicator = indicator
+        self.figure_pool = figure_pool if figure_pool is not None else FigurePool()
+        self.countries = list(countries)
+        # one slice of the cube holds every value of the compared countries
+        indexes = [rank_cube.index_of(country) for country in self.countries]
+        self.values = rank_cube.values[indexes]
+        self.years = rank_cube.years
+        # the usual sexes first, then any other the indicator has
+        self.sexes = [sex for sex in SEX_COLORS if sex in rank_cube.sexes] \
+            + [sex for sex in rank_cube.sexes if sex not in SEX_COLORS]
+
+        self.year = tk.IntVar()
+        self.year.set(selected_year)
+        self.sex = tk.StringVar()
+        # the sex selected in the ranking page, or the first one of the indicator
+        self.sex.set(selected_sex if selected_sex in self.sexes else self.sexes[0])
+
+        self.scheduler = EventCoalescer(self)
+        self.update_year_later = self.scheduler.register('year', self.update_year,
+                                                         THROTTLE_DELAY, 'throttle')
+
+        self.create_widgets()
+        self.init_plots()
+        self.update_lines()
+        self.update_year()
+
+    def create_widgets(self):
+        """Create all widgets of the frame."""
+        self.frame_filter = ttk.LabelFrame(self, text="FILTERS")
+        self.frame_filter.grid(row=0, column=0, sticky="NEW", padx=10, pady=10)
+        sex_label = ttk.Label(self.frame_filter, text="Sex of the trend : ")
+        sex_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        for row, sex in enumerate(self.sexes, start=1):
+            radio = ttk.Radiobutton(self.frame_filter, text=sex, value=sex,
+                                    variable=self.sex, command=self.update_lines)
+            radio.grid(row=row, column=0, padx=5, pady=5, sticky="w")
+
+        self.year_slider = tk.Scale(self, from_=self.years[0], to=self.years[-1],
+                                    orient='vertical', variable=self.year,
+                                    command=self.update_year_later)
+        self.year_slider.grid(row=0, column=2, rowspan=2, sticky="NS", padx=10, pady=10)
+
+        # one figure with both graphs
+        self.figure, self.canvas = self.figure_pool.acquire(self, layout='constrained')
+        self.axes_line, self.axes_bar = self.figure.subplots(1, 2)
+        self.canvas.get_tk_widget().grid(row=0, column=1, rowspan=2, sticky=tk.NSEW,
+                                         padx=10, pady=10)
+
+        self.button_close = ttk.Button(self, text="Close", command=self.close)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.button_close.grid(row=1, column=0, padx=10, pady=10, sticky="se")
+
+        self.rowconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(1, weight=1)
+
+    def close(self):
+        """Give the figure back to the pool and close the window."""
+        self.scheduler.cancel_all()
+        self.figure_pool.release(self.figure, self.canvas)
+        self.root.destroy()
+
+    def init_plots(self):
+        """Create one line per country and one bar per country and sex once."""
+        colors = matplotlib.colormaps['tab10' if len(self.countries) <= 10 else 'tab20']
+        self.colors = [colors(i % colors.N) for i in range(len(self.countries))]
+        min_value = np.nanmin(self.values)
+        max_value = np.nanmax(self.values)
+
+        s = self.rank_cube.sexes.index(self.sex.get())
+        self.lines = [self.axes_line.plot(self.years, self.values[i, :, s], label=country,
+                                          color=self.colors[i])[0]
+                      for i, country in enumerate(self.countries)]
+        self.axes_line.set_xlim(self.years[0], self.years[-1])
+        self.axes_line.set_ylim(min_value, max_value)
+        self.axes_line.set_xlabel("Year")
+        self.axes_line.set_ylabel(self.indicator.label)
+        self.axes_line.grid(True)
+        self.axes_line.legend(fontsize='small')
+
+        # bars of a country are next to each other, one for each sex
+        width = GROUP_WIDTH / len(self.sexes)
+        positions = np.arange(len(self.countries))
+        self.bars = {}
+        for j, sex in enumerate(self.sexes):
+            offsets = positions - GROUP_WIDTH / 2 + width * (j + 0.5)
+            self.bars[sex] = self.axes_bar.bar(offsets, np.zeros(len(self.countries)), width,
+                                               label=sex, edgecolor="black",
+                                               color=SEX_COLORS.get(sex, OTHER_COLOR))
+        self.axes_bar.set_xticks(positions, self.countries, rotation=30, ha='right')
+        self.axes_bar.set_ylim(min_value, max_value)
+        self.axes_bar.set_ylabel(self.indicator.label)
+        self.axes_bar.grid(True, axis='y')
+        self.axes_bar.set_axisbelow(True)
+        self.axes_bar.legend(fontsize='small')
+
+    def update_lines(self):
+        """Show the trend of the selected sex of every country."""
+        s = self.rank_cube.sexes.index(self.sex.get())
+        for i, line in enumerate(self.lines):
+            line.set_ydata(self.values[i, :, s])
+        self.axes_line.set_title(f"{self.indicator.name} of {self.sex.get()}\n"
+                                 f"from {self.years[0]} to {self.years[-1]}")
+        self.canvas.draw_idle()
+
+    def update_year(self, event=None):
+        """Show the values of the selected year in the bar graph."""
+        y = int(np.searchsorted(self.years, self.year.get()))
+        y = min(y, len(self.years) - 1)
+        for sex, bars in self.bars.items():
+            heights = np.nan_to_num(self.values[:, y, self.rank_cube.sexes.index(sex)])
+            for rect, height in zip(bars, heights):
+                rect.set_height(height)
+        self.axes_bar.set_title(f"{self.indicator.name} in {self.years[y]}")
+        self.canvas.draw_idle()
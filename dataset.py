@@ -0,0 +1,338 @@
+"""This module contains functions for downloading and cleaning the life expectancy data
+and the other indicators.
+
+It doesn't use tkinter, so the data can be prepared and tested without a display.
+"""
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import pandas as pd
+import requests
+import instrumentation
+import sdmx
+import transport
+from http_cache import CacheMiss
+from indicators import LIFE_EXPECTANCY
+from snapshot import load_snapshot, save_snapshot, source_key
+
+# Get life expectancy value of every area, the data is downloaded with a query that
+# only asks for the countries (sdmx.data_url), this url names the source in the progress.
+LIFE_EXPECTANCY_URL = sdmx.data_url()
+# Use ref_area to compare with alpha-code of countries from below source
+COUNTRY_NAME_URL = os.environ.get(
+    'LIFE_EXP_COUNTRY_URL',
+    "https://gist.githubusercontent.com/tadast/8827699/raw/f5cac3d42d16b78348610fc4ec301e9"
+    "234f82821/countries_codes_and_coordinates.csv")
+# Only these columns of the life expectancy dataset, and of every other indicator,
+# are parsed, with compact types.
+LIFE_EXPECTANCY_COLUMNS = {"REF_AREA": "category", "Geographic area": "category",
+                           "Sex": "category", "TIME_PERIOD": "int16",
+                           "OBS_VALUE": "float32"}
+# Only the alpha-3 code is needed from the country codes dataset.
+COUNTRY_NAME_COLUMNS = {"Alpha-3 code": str}
+# Number of csv rows parsed at a time when the rows are filtered while parsing.
+CSV_ROWS = 50_000
+# Part of the progress bar given to the downloads, the rest is for cleaning the data.
+DOWNLOAD_SHARE = 0.9
+
+
+class DownloadProgress:
+    """Keep track of the bytes received by each download and the current phase.
+
+    Downloads update it from worker threads and the ui reads it, so every access
+    goes through a lock.
+    """
+    def __init__(self, sources):
+        self._lock = Lock()
+        self._received = {source: 0 for source in sources}
+        self._total = {source: None for source in sources}
+        self.phase = "Downloading"
+
+    def update(self, source, received, total):
+        """Record the number of bytes received so far and the expected size."""
+        with self._lock:
+            self._received[source] = received
+            self._total[source] = total
+
+    def set_phase(self, phase):
+        """Change the phase text shown to the user."""
+        with self._lock:
+            self.phase = phase
+
+    def is_determinate(self):
+        """Return True if the size of every download is known."""
+        with self._lock:
+            return all(total is not None for total in self._total.values())
+
+    def received(self):
+        """Return the total number of bytes received by all downloads."""
+        with self._lock:
+            return sum(self._received.values())
+
+    def fraction(self):
+        """Return the overall progress between 0 and 1."""
+        with self._lock:
+            if self.phase != "Downloading":
+                return 1.0 if self.phase == "Done" else DOWNLOAD_SHARE
+            if any(total is None for total in self._total.values()):
+                return 0.0
+            total = sum(self._total.values())
+            received = sum(self._received.values())
+            return DOWNLOAD_SHARE * min(received / total, 1.0) if total else 0.0
+
+
+def load_life_exp_data(cache=None, progress=None):
+    """Download the country codes, then the life expectancy of those countries only,
+    and return the cleaned life exp data."""
+    return load_indicator_data(LIFE_EXPECTANCY, cache, progress)
+
+
+@instrumentation.timed('load_indicator_data')
+def load_indicator_data(indicator=LIFE_EXPECTANCY, cache=None, progress=None):
+    """Download the country codes, then the indicator of those countries only,
+    and return the cleaned data.
+
+    When the country codes are cached but have to be revalidated, the indicator of the
+    cached codes is downloaded at the same time and only downloaded again if the codes
+    have changed, so only a launch without cached codes waits for them first.
+
+    progress is a DownloadProgress of the source_urls of the indicator, which is updated
+    while downloading and cleaning. With a cache, the cleaned data is saved as a snapshot
+    of the indicator keyed by the cached sources, while the sources stay fresh later
+    launches map it in without network or parsing.
+    """
+    if progress is None:
+        progress = DownloadProgress(source_urls(indicator))
+
+    def download_country_codes():
+        return country_alpha_codes(download_csv_from_url(
+            COUNTRY_NAME_URL, cache,
+            lambda received, total: progress.update(COUNTRY_NAME_URL, received, total),
+            COUNTRY_NAME_COLUMNS))
+
+    entry = cache.get(COUNTRY_NAME_URL) if cache is not None else None
+    if entry is None or cache.offline or cache.is_fresh(entry):
+        # the codes are read from the disk, or nothing can be asked for before they arrive
+        return load_countries_data(indicator, download_country_codes(), cache, progress)
+    held_codes = country_alpha_codes(read_csv(entry.path, COUNTRY_NAME_COLUMNS))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        codes_future = executor.submit(download_country_codes)
+        data_future = executor.submit(load_countries_data, indicator, held_codes, cache,
+                                      progress)
+        country_codes = codes_future.result()
+        if set(country_codes) == set(held_codes):
+            return data_future.result()
+        # the data of the old codes is of no use, wait for it to finish before asking again
+        data_future.exception()
+    return load_countries_data(indicator, country_codes, cache, progress)
+
+
+def load_countries_data(indicator, country_codes, cache=None, progress=None):
+    """Return the cleaned data of the indicator of the countries, from the snapshot if
+    the downloaded observations are still fresh."""
+    indicator_url, _ = source_urls(indicator)
+    url = sdmx.data_url(country_codes, indicator=indicator)
+    if cache is not None:
+        snapshot_directory = os.path.join(cache.directory, 'snapshots', indicator.code)
+        # the url lists the countries, so it is all the snapshot depends on
+        key = source_key(cache, [url])
+        life_exp_data = load_snapshot(key, snapshot_directory) if key else None
+        if life_exp_data is not None:
+            progress.set_phase("Done")
+            return life_exp_data
+    observations = download_observations(
+        country_codes, cache,
+        lambda received, total: progress.update(indicator_url, received, total), indicator)
+    progress.set_phase("Cleaning")
+    # the server only sends the countries asked for, the codes are checked again anyway
+    life_exp_data = clean_life_exp_data(observations, country_codes)
+    if cache is not None:
+        key = source_key(cache, [url])
+        if key:
+            save_snapshot(life_exp_data, key, snapshot_directory)
+            cache.evict(keep=snapshot_directory)
+    progress.set_phase("Done")
+    return life_exp_data
+
+
+def source_urls(indicator=LIFE_EXPECTANCY):
+    """Return the urls naming the sources of the indicator in a DownloadProgress."""
+    return [sdmx.data_url(indicator=indicator), COUNTRY_NAME_URL]
+
+
+def download_observations(country_codes, cache=None, progress=None, indicator=LIFE_EXPECTANCY):
+    """Return the observations of the indicator of the countries.
+
+    The first download asks for the whole history of the countries. When the cached
+    copy has to be revalidated, only the observations updated since it was last
+    checked are asked for and merged into it, instead of downloading it again.
+    """
+    url = sdmx.data_url(country_codes, indicator=indicator)
+    entry = cache.get(url) if cache is not None else None
+    if entry is None or cache.offline or cache.is_fresh(entry):
+        return download_csv_from_url(url, cache, progress, LIFE_EXPECTANCY_COLUMNS)
+    held = read_csv(entry.path, LIFE_EXPECTANCY_COLUMNS)
+    updates_url = sdmx.data_url(country_codes, indicator=indicator,
+                                updated_after=entry.meta['checked'] - sdmx.UPDATE_OVERLAP)
+    try:
+        changes = download_csv_from_url(updates_url, None, progress, LIFE_EXPECTANCY_COLUMNS)
+    except requests.HTTPError as error:
+        status = error.response.status_code
+        if status in transport.RETRY_STATUSES or status >= 500:
+            # the server is still busy after the retries, ask again at the next refresh
+            return held
+        if status != 404:
+            # the server doesn't support updatedAfter, download everything again
+            return download_csv_from_url(url, cache, progress, LIFE_EXPECTANCY_COLUMNS)
+        # SDMX servers answer 404 when no observation matches the query
+        changes = held.iloc[:0]
+    except requests.RequestException:
+        # use the old copy rather than nothing when the server can't be reached
+        return held
+    if changes.empty:
+        cache.revalidated(url, entry, {})
+        return held
+    merged = sdmx.merge_observations(held, changes, LIFE_EXPECTANCY_COLUMNS)
+    cache.put(url, merged.to_csv(index=False).encode('utf-8'))
+    return merged
+
+
+def country_alpha_codes(country_info):
+    """Return the alpha-3 codes of the countries without the quotes around them."""
+    return country_info['Alpha-3 code'].str.strip('" ')
+
+
+@instrumentation.timed('clean_life_exp_data', 'cleaning')
+def clean_life_exp_data(life_expectancy, country_codes=None):
+    """Organize the parsed life expectancy data to make it suitable for the program use.
+
+    Return a dataframe with REF_AREA, Country and Sex as categories, Year as int16
+    and Value as float32. Every string operation works on the categories instead of
+    the rows. If country_codes is given, the areas that aren't in it are removed.
+    """
+    if country_codes is not None:
+        life_expectancy = life_expectancy[life_expectancy.REF_AREA.isin(country_codes)]
+    # Rename columns and reverb "Total" to "Both sexes"
+    life_expectancy = life_expectancy.rename(columns={"Geographic area": "Country",
+                                                      "TIME_PERIOD": "Year",
+                                                      "OBS_VALUE": "Value"})
+    life_expectancy = life_expectancy.astype({"REF_AREA": "category", "Country": "category",
+                                              "Sex": "category", "Year": "int16",
+                                              "Value": "float32"})
+    # eliminate "Other, non specified"
+    life_expectancy = life_expectancy[life_expectancy.Country != "Other, non specified"]
+    sex = life_expectancy.Sex.cat.rename_categories(
+        lambda name: "Both sexes" if name == "Total" else name)
+    # remove bracket off the country name, the text in the brackets is incomplete.
+    # Two names may become the same, so the new names are factorized again.
+    country = life_expectancy.Country.cat.remove_unused_categories()
+    new_names = country.cat.categories.str.split("(", n=1).str[0]
+    new_codes, unique_names = pd.factorize(new_names, sort=True)
+    codes = country.cat.codes.to_numpy()
+    country = pd.Categorical.from_codes(new_codes[codes], categories=unique_names)
+    return pd.DataFrame({"REF_AREA": life_expectancy.REF_AREA.cat.remove_unused_categories(),
+                         "Country": country,
+                         "Sex": sex.cat.remove_unused_categories(),
+                         "Year": life_expectancy.Year,
+                         "Value": life_expectancy.Value},
+                        index=life_expectancy.index)
+
+
+@instrumentation.timed('download_csv_from_url', 'network')
+def download_csv_from_url(url, cache=None, progress=None, columns=None, row_filter=None):
+    """Return the dataframe of csv file from the given url.
+
+    If a cache is given, a fresh cached copy is read from the disk, a stale one is
+    revalidated with a conditional GET and only downloaded again when it has changed.
+    In offline mode the network is never used.
+
+    The response is read in chunks and fed straight into the csv parser,
+    progress(received, total) is called after each chunk, total is None when the
+    server doesn't send Content-Length. columns maps the names of the only columns
+    to parse to their dtypes and row_filter(dataframe) drops unwanted rows while parsing.
+    """
+    if progress is None:
+        def progress(received, total):
+            pass
+
+    if cache is None:
+        response = transport.get(url)
+        response.raise_for_status()
+        return read_csv(ResponseStream(transport.iter_body(response, progress)), columns,
+                        row_filter)
+
+    entry = cache.get(url)
+    if entry is not None and (cache.offline or cache.is_fresh(entry)):
+        progress(entry.meta['size'], entry.meta['size'])
+        return read_csv(entry.path, columns, row_filter)
+    if cache.offline:
+        raise CacheMiss(f"{url} is not in the cache and the application is offline.")
+    try:
+        response = transport.get(url, cache.validators(entry))
+    except requests.RequestException:
+        # use the old copy rather than nothing when the server can't be reached
+        if entry is None:
+            raise
+        progress(entry.meta['size'], entry.meta['size'])
+        return read_csv(entry.path, columns, row_filter)
+    if response.status_code == 304 and entry is not None:
+        cache.revalidated(url, entry, response.headers)
+        progress(entry.meta['size'], entry.meta['size'])
+        return read_csv(entry.path, columns, row_filter)
+    if entry is not None and (response.status_code in transport.RETRY_STATUSES
+                              or response.status_code >= 500):
+        # the server is still busy after the retries, the old copy stays stale so it
+        # is asked for again at the next refresh
+        response.close()
+        progress(entry.meta['size'], entry.meta['size'])
+        return read_csv(entry.path, columns, row_filter)
+    response.raise_for_status()
+    # the body is written to the cache while it is being parsed
+    chunks = cache.store(url, transport.iter_body(response, progress), response.headers)
+    return read_csv(ResponseStream(chunks), columns, row_filter)
+
+
+def read_csv(source, columns=None, row_filter=None):
+    """Parse a csv file or a binary stream into a dataframe.
+
+    Only the given columns are parsed. When there is a row filter, the csv is parsed
+    CSV_ROWS rows at a time and each part is filtered before the next one is parsed.
+    """
+    usecols = list(columns) if columns is not None else None
+    if row_filter is None:
+        return pd.read_csv(source, usecols=usecols, dtype=columns)
+    # categories of each part would differ, so they are only made after joining the parts
+    dtype = {name: (str if kind == "category" else kind) for name, kind in columns.items()}\
+        if columns is not None else None
+    parts = [row_filter(part) for part in pd.read_csv(source, usecols=usecols, dtype=dtype,
+                                                     chunksize=CSV_ROWS)]
+    data = pd.concat(parts, ignore_index=True)
+    if columns is not None:
+        data = data.astype(columns)
+    # keep the columns in the order given
+    return data[usecols] if usecols is not None else data
+
+
+class ResponseStream(io.RawIOBase):
+    """A read only binary file made from an iterable of bytes chunks,
+    so a response can be parsed without keeping the whole body in memory."""
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Fill the buffer with the next bytes and return how many were written."""
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
@@ -3,16 +3,28 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter.messagebox import showinfo
 import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import instrumentation
+from figure_pool import FigurePool
+from indicators import LIFE_EXPECTANCY
+from playback import Playback
+from rank_cube import RankCube
+from scheduler import EventCoalescer, THROTTLE_DELAY
+from series_store import SeriesStore
 matplotlib.use('TkAgg')
 
+# Color of the bars and lines of each sex, the same as in the comparison window.
+SEX_COLORS = {"Both sexes": "Green", "Female": "Red", 'Male': "Blue"}
+# Color of any other sex an indicator has.
+OTHER_COLOR = "Gray"
+
 
 class DetailPlot(ttk.Frame):
-    """A class that a frame showing the plot of the details of life exp in each country."""
-    def __init__(self, parent, life_exp_data, selected_country, selected_year):
+    """A class that a frame showing the plot of the details of life exp in each country,
+    or of the indicator the data is of."""
+    def __init__(self, parent, life_exp_data, selected_country, selected_year, rank_cube=None,
+                 series_store=None, task_runner=None, figure_pool=None,
+                 indicator=LIFE_EXPECTANCY):
         super().__init__(parent)
 
         parent.grid_rowconfigure(0, weight=1)
@@ -20,14 +32,28 @@ class DetailPlot(ttk.Frame):
         self.root = parent
 
         self.life_exp_data = life_exp_data
+        # the names and units in the plots come from the indicator
+        self.indicator = indicator
+        self.rank_cube = rank_cube if rank_cube is not None else RankCube(life_exp_data)
+        # pivot tables and statistics shared by every detail window
+        self.series_store = series_store if series_store is not None \
+            else SeriesStore(life_exp_data)
         self.selected_country = selected_country
         self.selected_year = selected_year
 
         # Store info used in plot
-        self.latest_year = self.life_exp_data.Year.max()
-        self.earliest_year = self.life_exp_data.Year.min()
-        self.min_value = self.life_exp_data.Value.min()
-        self.max_value = self.life_exp_data.Value.max()
+        self.latest_year = self.series_store.latest_year
+        self.earliest_year = self.series_store.earliest_year
+        self.min_value = self.series_store.min_value
+        self.max_value = self.series_store.max_value
+        # country of the current one_country table
+        self.data_country = None
+        # tables of new countries are built by the task runner when there is one
+        self.task_runner = task_runner
+        self.data_task = None
+        self.bind('<Destroy>', self.cancel_data_task, add='+')
+        # figures and canvases come from a pool shared with the other windows
+        self.figure_pool = figure_pool if figure_pool is not None else FigurePool()
 
         # set variables for receiving the value from combobox in filters
         self.country_name = tk.StringVar()
@@ -35,27 +61,34 @@ class DetailPlot(ttk.Frame):
         self.year = tk.IntVar()
         self.year.set(self.selected_year)
 
+        # the sexes of the indicator, the usual ones first, then any other it has
+        self.colors = SEX_COLORS
+        self.sexes = [sex for sex in SEX_COLORS if sex in self.rank_cube.sexes] \
+            + [sex for sex in self.rank_cube.sexes if sex not in SEX_COLORS]
         # set variables for receiving the value from checkbox in filters
-        self.female = tk.StringVar()
-        self.male = tk.StringVar()
-        self.total = tk.StringVar()
-        self.total.set('Both sexes')
-        self.male.set('Male')
-        self.female.set('Female')
+        self.sex_variables = {}
+        for sex in self.sexes:
+            self.sex_variables[sex] = tk.StringVar()
+            self.sex_variables[sex].set(sex)
 
         # initialize the sexes that will appear on the graph (all)
-        self.sex_filters = ['Both sexes', 'Female', 'Male']
-        self.colors = {'Male': "Blue", "Female": "Red", "Both sexes": "Green"}
-        self.colors_in_plot = [self.colors['Both sexes'],
-                               self.colors['Female'],
-                               self.colors['Male']]
+        self.sex_filters = list(self.sexes)
+        self.colors_in_plot = [self.colors.get(sex, OTHER_COLOR) for sex in self.sex_filters]
 
         # set variables for receiving the value from RadioButton
         self.selected_option = tk.StringVar()
         self.selected_option.set('bar')  # show country in specific year in bar graph first
 
         # Find number of all countries for later uses in the app
-        self.num_country = len(set(self.life_exp_data.Country))
+        self.num_country = self.series_store.num_country
+
+        # bursts of events from the widgets are coalesced before the plots are updated
+        self.scheduler = EventCoalescer(self)
+        self.update_plots_later = self.scheduler.register('plots', self.update_plots)
+        self.update_year_later = self.scheduler.register('year', self.update_year,
+                                                         THROTTLE_DELAY, 'throttle')
+        # frames of the bar graph rendered ahead for playing the years and the slider
+        self.playback = Playback(self)
 
         # create all components and start plotting
         self.create_widgets()
@@ -71,6 +104,8 @@ class DetailPlot(ttk.Frame):
                                                   "the year you want to observe.\n"
                                                   "Use overall mode to see the trend "
                                                   "from 1950 to the latest year.\n"
+                                                  "Press Play to watch the years "
+                                                  "go by in the bar graph.\n"
                                                   "You can also choose the sex or "
                                                   "change country that you want "
                                                   "to observe in FILTERS."
@@ -85,26 +120,19 @@ class DetailPlot(ttk.Frame):
         country_label.grid(row=0, column=0)
         self.cb_country_filter = ttk.Combobox(self.frame_filter, state="readonly",
                                               textvariable=self.country_name)
-        self.cb_country_filter.bind('<<ComboboxSelected>>', self.update_plots)
-        country_list = list(set(self.life_exp_data.Country))
-        country_list.sort()
-        self.cb_country_filter['values'] = country_list
+        self.cb_country_filter.bind('<<ComboboxSelected>>', self.update_plots_later)
+        self.cb_country_filter['values'] = self.series_store.countries
         self.cb_country_filter.grid(row=0, column=1, padx=5, pady=5)
 
         sex_label = ttk.Label(self.frame_filter, text="Sex : ")
         sex_label.grid(row=1, column=0, padx=5, pady=5)
-        self.female_box = ttk.Checkbutton(self.frame_filter, text='Female',
-                                          onvalue="Female", offvalue='',
-                                          variable=self.female, command=self.update_sex)
-        self.male_box = ttk.Checkbutton(self.frame_filter, text='Male',
-                                        onvalue="Male", offvalue='',
-                                        variable=self.male, command=self.update_sex)
-        self.total_box = ttk.Checkbutton(self.frame_filter, text='Both sexes',
-                                         onvalue="Both sexes", offvalue='',
-                                         variable=self.total, command=self.update_sex)
-        self.female_box.grid(row=1, column=1, padx=2, pady=10, sticky="w")
-        self.male_box.grid(row=2, column=1, padx=2, pady=10, sticky="w")
-        self.total_box.grid(row=3, column=1, padx=2, pady=10, sticky="w")
+        self.sex_boxes = {}
+        for row, sex in enumerate(self.sexes, start=1):
+            self.sex_boxes[sex] = ttk.Checkbutton(self.frame_filter, text=sex,
+                                                  onvalue=sex, offvalue='',
+                                                  variable=self.sex_variables[sex],
+                                                  command=self.update_sex)
+            self.sex_boxes[sex].grid(row=row, column=1, padx=2, pady=10, sticky="w")
 
         # Create frame for mode filters
         self.frame_mode = ttk.LabelFrame(self, text="MODE")
@@ -118,6 +146,8 @@ class DetailPlot(ttk.Frame):
                                          command=self.show_line_graph)
         self.mode_bar.grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.mode_line.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.button_play = ttk.Button(self.frame_mode, text="Play", command=self.playback.toggle)
+        self.button_play.grid(row=2, column=0, padx=5, pady=5, sticky="w")
 
         # Create a year slider beside bar plot
         self.year_slider = tk.Scale(self,
@@ -125,40 +155,45 @@ class DetailPlot(ttk.Frame):
                                     to=self.latest_year,
                                     orient='vertical',
                                     variable=self.year,
-                                    command=self.update_plots
+                                    command=self.update_year_later
                                     )
         self.year_slider.grid(row=0, column=2, rowspan=7, sticky="NS", padx=10, pady=10)
 
-        # create Matplotlib figures and plotting axes
-        self.fig_line = Figure()
+        # get Matplotlib figures with canvases to host them and create plotting axes
+        self.fig_line, self.fig_canvas_line = self.figure_pool.acquire(self)
         self.axes_line = self.fig_line.add_subplot()
-        self.fig_bar = Figure()
+        self.fig_bar, self.fig_canvas_bar = self.figure_pool.acquire(self)
         self.axes_year = self.fig_bar.add_subplot()
+        self.init_plots()
 
-        # create canvases to host the figure
-        self.fig_canvas_line = FigureCanvasTkAgg(self.fig_line, master=self)
-
-        self.fig_canvas_bar = FigureCanvasTkAgg(self.fig_bar, master=self)
         self.fig_canvas_bar.get_tk_widget().grid(row=0, column=1, rowspan=7, sticky=tk.NSEW,
                                                  padx=10, pady=10)
+        self.fig_canvas_bar.get_tk_widget().bind('<Configure>', self.resize_bar, add='+')
 
         # create close button
-        self.button_close = ttk.Button(self, text="Close", command=self.root.destroy)
+        self.button_close = ttk.Button(self, text="Close", command=self.close)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.button_close.grid(row=6, column=0, padx=10, pady=10, sticky="e")
 
         # Create a description frame to inform rank of selected country in the selected year
         self.description_frame = ttk.LabelFrame(self, text="COUNTRY DESCRIPTION")
+        self.message = ttk.Label(self.description_frame)
         self.update_rank()
-        self.message = ttk.Label(self.description_frame,
-                                 text=f"{self.country_name.get()}\n "
-                                      f"- Rank #{int(self.rank[self.rank.Country == self.country_name.get()].Rank)} "
-                                      f"out of {self.num_country} countries in {self.year.get()}")
         self.description_frame.grid(row=5, column=0, padx=10, sticky="NSEW")
         self.message.grid(row=0, column=0, padx=10, sticky="NSEW")
 
         # configure each row and column
         self.config_row_col()
 
+    def close(self):
+        """Stop the pending work, give the figures back to the pool and close the window."""
+        self.scheduler.cancel_all()
+        self.cancel_data_task()
+        self.playback.stop()
+        self.figure_pool.release(self.fig_line, self.fig_canvas_line)
+        self.figure_pool.release(self.fig_bar, self.fig_canvas_bar)
+        self.root.destroy()
+
     def config_row_col(self):
         (columns, rows) = self.grid_size()
         for i in range(rows):
@@ -166,15 +201,21 @@ class DetailPlot(ttk.Frame):
         for i in range(columns):
             self.columnconfigure(i, weight=1)
 
+    @instrumentation.timed('update_rank', 'ranking')
     def update_rank(self):
-        """Update the current data to the correct year and sort by value
-        to get the current rank of each countries.
-        """
-        rank = self.life_exp_data[
-            (self.life_exp_data.Year == self.year.get()) &
-            (self.life_exp_data.Sex == "Both sexes")]
-        self.rank = rank.sort_values(by="Value", ascending=False)
-        self.rank['Rank'] = np.arange(1,  self.num_country+1)
+        """Show the rank of the selected country in the selected year among the first
+        sex shown, both sexes when it is."""
+        year = self.year.get()
+        sex = self.sex_filters[0]
+        rank = self.rank_cube.rank_of(self.country_name.get(), year, sex)
+        count = self.rank_cube.count(year, sex)
+        if count:
+            rank_text = f"{f'Rank #{rank}' if rank else 'No data'} out of {count} countries"
+        else:
+            # the slider also stops at the years no country has data in
+            rank_text = "No data of any country"
+        self.message.config(text=f"{self.country_name.get()}\n - {rank_text} in {year} "
+                                 f"({sex})")
 
     def show_bar_graph(self):
         """Hide line(overall) graph and show bar(specific year) graph."""
@@ -184,25 +225,26 @@ class DetailPlot(ttk.Frame):
                                                  padx=10, pady=10)
         self.year_slider.grid(row=0, column=2, rowspan=7, sticky="NS", padx=10, pady=10)
         self.config_row_col()
+        self.draw_visible_plot()
 
     def show_line_graph(self):
         """Hide bar(specific year) graph and show bar(overall) graph."""
+        self.playback.stop()
         self.fig_canvas_bar.get_tk_widget().grid_forget()
         self.year_slider.grid_forget()
         self.fig_canvas_line.get_tk_widget().grid(row=0, column=1, rowspan=7, columnspan=2,
                                                   sticky=tk.NSEW, padx=10, pady=10)
         self.config_row_col()
+        self.draw_visible_plot()
 
     def update_sex(self):
         """Update sex filters and its color in the plot accordingly.
         If only one sex is chosen, that box will be disabled so at least
         one box is check. Everytime the box is check, the plot is updated.
         """
-        female = self.female.get()
-        male = self.male.get()
-        total = self.total.get()
-        all_box = [self.female_box, self.male_box, self.total_box]
-        new_sex_filters = [fil for fil in [female, male, total] if fil != '']
+        all_box = list(self.sex_boxes.values())
+        # in the order of the sexes, so each one keeps its place and color
+        new_sex_filters = [sex for sex in self.sexes if self.sex_variables[sex].get() != '']
         if len(new_sex_filters) == 1:
             for box in all_box:
                 if box.state() == ('selected',):
@@ -211,70 +253,164 @@ class DetailPlot(ttk.Frame):
             for box in all_box:
                 if box.state() == ('disabled', 'selected'):
                     box.config(state=tk.NORMAL)
-        new_sex_filters.sort()  # so it is in a certain order appropriate for assigning color
         self.sex_filters = new_sex_filters
         # update colors used in plot
-        colors_in_plot = []
-        for sex in self.sex_filters:
-            colors_in_plot.append(self.colors[sex])
-        self.colors_in_plot = colors_in_plot
-        self.update_plots()
+        self.colors_in_plot = [self.colors.get(sex, OTHER_COLOR) for sex in self.sex_filters]
+        self.update_plots_later()
 
     def update_data(self):
-        """Create the life exp data in an attribute with the current country filters."""
-        # get the dataframe of one country
-        one_country = self.life_exp_data[self.life_exp_data.Country == self.country_name.get()]
-        # pivot table so it can be graphed easily
-        self.one_country = one_country.pivot_table(columns="Sex", values="Value",
-                                                   index="Year")
+        """Create the life exp data in an attribute with the current country filters.
+
+        The table only changes when the country does and comes from the shared store.
+        """
+        if self.data_country != self.country_name.get():
+            self.one_country = self.series_store.series(self.country_name.get())
+            self.data_country = self.country_name.get()
+
+    def init_plots(self):
+        """Create the artists of both plots once. Later updates only change their data,
+        titles and visibility instead of rebuilding the whole chart."""
+        self.axes_line.set_xticks(np.arange(self.earliest_year, self.latest_year, 5))
+        self.axes_line.tick_params(axis='x', labelrotation=90)
+        self.axes_line.set_xlim(self.earliest_year, self.latest_year)
+        self.axes_line.set_ylim(self.min_value, self.max_value)
+        self.axes_line.set_xlabel("Year")
+        self.axes_line.set_ylabel(self.indicator.label)
+        self.axes_line.grid(True)
+        self.lines = {}
+        for sex in self.sexes:
+            color = self.colors.get(sex, OTHER_COLOR)
+            (self.lines[sex],) = self.axes_line.plot([], [], color=color, label=sex)
+
+        self.axes_year.set_ylim(self.min_value, self.max_value)
+        self.axes_year.set_xlabel("Sex")
+        self.axes_year.set_ylabel(self.indicator.label)
+        self.axes_year.grid(True)
+        self.axes_year.set_axisbelow(True)
+        self.bars = None
+        self.bar_sexes = None
+        self.bar_labels = []
+        # plots whose data changed since they were last drawn
+        self.stale_plots = {'line', 'bar'}
 
     def update_plots(self, event=None):
-        """Update the current plots of both graph."""
+        """Update the current plots of both graph.
+
+        Only the visible plot is drawn now, the hidden one is drawn when it is shown.
+        """
+        self.playback.stop()
         self.root.title(self.country_name.get())
         self.update_rank()
-        self.message.config(text=f"{self.country_name.get()}\n - "
-                                 f"Rank #{int(self.rank[self.rank.Country == self.country_name.get()].Rank)} "
-                                 f"out of {len(self.rank.Country)} countries in {self.year.get()}")
-        self.plot_line()
-        self.plot_bar()
+        if self.task_runner is not None and self.data_country != self.country_name.get():
+            self.prepare_data()
+            return
+        self.update_data()
+        self.stale_plots = {'line', 'bar'}
+        self.draw_visible_plot()
+
+    def prepare_data(self):
+        """Build the table of the selected country in a worker thread,
+        the plots are updated when it is ready."""
+        self.cancel_data_task()
+        country = self.country_name.get()
+        self.data_task = self.task_runner.submit(
+            self.series_store.series, country,
+            on_done=lambda table: self.data_ready(country, table))
+
+    def data_ready(self, country, table):
+        """Use the table built by the worker thread and update the plots."""
+        self.data_task = None
+        self.one_country = table
+        self.data_country = country
+        self.update_plots()
 
+    def cancel_data_task(self, event=None):
+        """Cancel the table that is being built, it is no longer needed."""
+        if self.data_task is not None:
+            self.data_task.cancel()
+            self.data_task = None
+
+    def update_year(self, event=None):
+        """Update the rank and the bar graph when the year slider moves,
+        the line graph doesn't depend on the year.
+
+        A frame of the bar graph rendered ahead is shown instead of drawing the graph
+        when there is one, the frames of the other years are rendered in the background.
+        """
+        self.update_rank()
+        self.stale_plots.add('bar')
+        if self.selected_option.get() == 'bar':
+            if self.playback.show_cached(self.year.get()):
+                return
+            self.playback.hide()
+            self.playback.prerender()
+        self.draw_visible_plot()
+
+    def resize_bar(self, event):
+        """The frames don't fit a resized canvas, draw the bar graph itself again."""
+        if self.playback.image_item is not None:
+            self.playback.stop()
+            self.draw_visible_plot()
+
+    def draw_visible_plot(self):
+        """Draw the plot that is shown if its data has changed."""
+        if self.selected_option.get() == 'line':
+            if 'line' in self.stale_plots:
+                self.plot_line()
+        elif 'bar' in self.stale_plots:
+            self.plot_bar()
+
+    @instrumentation.timed('plot_line', 'render')
     def plot_line(self):
         """Plot the line graph showing life expectancy of each sex in the selected country from
          the earliest year to the latest year provided in the dataset in the left canvas.
         """
-        self.axes_line.clear()
         self.update_data()
-        plt.rcParams['axes.titlepad'] = 12
-        self.one_country[self.sex_filters].plot(xticks=np.arange(self.earliest_year,
-                                                                 self.latest_year, 5),
-                                                ylabel="Life expectancy (years)",
-                                                xlabel="Year",
-                                                xlim=(self.earliest_year, self.latest_year),
-                                                ylim=(self.min_value, self.max_value),
-                                                title=f"Life Expectancy in\n "
-                                                      f"{self.country_name.get()}\n "
-                                                      f"from {self.earliest_year} "
-                                                      f"to {self.latest_year}",
-                                                color=self.colors_in_plot,
-                                                rot=90,
-                                                grid=True,
-                                                ax=self.axes_line)
-        self.fig_canvas_line.draw()
+        for sex, line in self.lines.items():
+            if sex in self.one_country.columns:
+                line.set_data(self.one_country.index, self.one_country[sex])
+            else:
+                line.set_data([], [])
+            line.set_visible(sex in self.sex_filters)
+        self.axes_line.legend(handles=[self.lines[sex] for sex in self.sex_filters])
+        self.axes_line.set_title(f"{self.indicator.name} in\n "
+                                 f"{self.country_name.get()}\n "
+                                 f"from {self.earliest_year} "
+                                 f"to {self.latest_year}", pad=12)
+        self.fig_canvas_line.draw_idle()
+        self.stale_plots.discard('line')
 
+    @instrumentation.timed('plot_bar', 'render')
     def plot_bar(self):
         """Plot the bar graph showing life expectancy of each sex in project demo
         specific country with the selected year in the right canvas.
+
+        The bars are only made again when the sex filters change, otherwise only
+        their heights and labels are updated.
         """
-        self.axes_year.clear()
         self.update_data()
         # Get data of project demo specific year from the pivot table of dataframe of one country
-        self.one_country[self.sex_filters].loc[self.year.get()].plot.bar(
-             ylabel="Life expectancy (years)", ylim=(self.min_value, self.max_value),
-             xlabel="Sex",
-             title=f"Life Expectancy in \n"
-                   f"{self.country_name.get()} "
-                   f"in {self.year.get()}",
-             grid=True, rot=0, color=self.colors_in_plot, edgecolor="black",
-             ax=self.axes_year)
-        self.axes_year.bar_label(self.axes_year.containers[0], fmt="%.2f")
-        self.fig_canvas_bar.draw()
+        values = self.one_country.reindex(index=[self.year.get()],
+                                          columns=self.sex_filters).iloc[0]
+        heights = values.fillna(0).to_numpy()
+        if self.bar_sexes != self.sex_filters:
+            if self.bars is not None:
+                self.bars.remove()
+            positions = np.arange(len(self.sex_filters))
+            self.bars = self.axes_year.bar(positions, heights, color=self.colors_in_plot,
+                                           edgecolor="black")
+            self.axes_year.set_xticks(positions, self.sex_filters)
+            self.bar_sexes = list(self.sex_filters)
+        else:
+            for rect, height in zip(self.bars, heights):
+                rect.set_height(height)
+        for label in self.bar_labels:
+            label.remove()
+        self.bar_labels = self.axes_year.bar_label(
+            self.bars, labels=["No data" if np.isnan(value)
+                               else f"{value:.{self.indicator.digits}f}" for value in values])
+        self.axes_year.set_title(f"{self.indicator.name} in \n"
+                                 f"{self.country_name.get()} "
+                                 f"in {self.year.get()}")
+        self.fig_canvas_bar.draw_idle()
+        self.stale_plots.discard('bar')
@@ -1,41 +1,43 @@
-"""This module contains DownloadData class."""
+"""This module contains DownloadData class.
+
+pandas, numpy and the pages are only imported by the worker thread that prepares
+the data, so the loading window can appear before they are loaded.
+"""
 import tkinter as tk
 from tkinter import ttk
-import io
-from threading import Thread
-import requests
-import pandas as pd
-from ranking_page import RankingPage
+from http_cache import HttpCache
+from task_runner import TaskRunner
 
-# Get life expectancy value of each country.
-# The dataset contains other kind of geographic area too(need to be eliminated).
-LIFE_EXPECTANCY_URL = "https://sdmx.data.unicef.org/ws/public/sdmxapi/rest/data/UNICEF,DM" \
-                      ",1.0/.DM_LIFE_EXP...?format=csv&labels=both"
-# Use ref_area to compare with alpha-code of countries from below source
-COUNTRY_NAME_URL = "https://gist.githubusercontent.com/tadast/8827699/raw/f5cac3d42d16b783" \
-                   "48610fc4ec301e9234f82821/countries_codes_and_coordinates.csv"
+# Milliseconds between two refreshes of the progress bar while the data is prepared.
+PROGRESS_INTERVAL = 100
 
 
 class DownloadData(ttk.Frame):
     """This class responsible for downloading data from an online source and
      create a loading bar to inform the progress to users.
      """
-    def __init__(self, parent):
+    def __init__(self, parent, cache=None):
         super().__init__(parent)
         parent.title('Life Exp')
         parent.grid_rowconfigure(0, weight=1)
         parent.grid_columnconfigure(0, weight=1)
         self.root = parent
+        # raw responses are reused from the disk between launches
+        self.cache = cache if cache is not None else HttpCache()
+        self.task_runner = TaskRunner(self, max_workers=1)
         self.init_components()
         self.show_progress_bar()
 
     def init_components(self):
         """Create all the components in this frame."""
-        progress_label = ttk.Label(self, text="Downloading data...")
+        self.progress_label = ttk.Label(self, text="Downloading data...")
         self.progress_bar = ttk.Progressbar(self, orient='horizontal',
-                                            mode='indeterminate', length=280)
-        progress_label.grid(row=0, column=0, padx=5, pady=5, sticky="EW")
+                                            mode='indeterminate', length=280,
+                                            maximum=100)
+        self.progress_label.grid(row=0, column=0, padx=5, pady=5, sticky="EW")
         self.progress_bar.grid(row=1, column=0, padx=5, pady=5, sticky="EW")
+        # only shown when the download fails
+        self.button_retry = ttk.Button(self, text="Retry", command=self.retry)
 
         (cols, rows) = self.grid_size()
         for i in range(cols):
@@ -45,67 +47,80 @@ class DownloadData(ttk.Frame):
 
     def show_progress_bar(self):
         """Tell the user the application is preparing the data
-        and disable start button."""
-        self.task_thread = Thread(target=self.download_and_clean_data)
-        self.task_thread.start()
-        self.progress_bar.start()
-        self.after(1, self.check_progress)
+        and start preparing it in a worker thread."""
+        # made by the worker thread once the dataset module is imported
+        self.progress = None
+        self.task = self.task_runner.submit(self.download_and_clean_data,
+                                            on_done=self.show_ranking_page,
+                                            on_error=self.show_error)
         self.progress_bar.start()
+        self.after(PROGRESS_INTERVAL, self.check_progress)
 
     def check_progress(self):
-        """Check task regularly whether the task has completed.
+        """Refresh the progress bar regularly until the task has finished."""
+        if not self.task.future.done():
+            self.show_progress()
+            self.after(PROGRESS_INTERVAL, self.check_progress)
+
+    def show_ranking_page(self, data):
+        """Show the frame that plot the data when it is ready."""
+        engine, indicator_data = data
+        # already imported by the worker thread
+        from ranking_page import RankingPage  # pylint: disable=import-outside-toplevel
+        self.progress_bar.stop()
+        self.grid_forget()
+        ranking_frame = RankingPage(self.root, indicator_data.data, indicator_data.rank_cube,
+                                    indicator_data.series_store, indicator_data.analytics,
+                                    engine, indicator_data.indicator)
+        ranking_frame.grid(row=0, column=0, sticky=tk.NSEW)
+
+    def show_error(self, error):
+        """Tell the user the data couldn't be prepared and let them try again."""
+        self.progress_bar.stop()
+        self.progress_bar.config(mode='determinate', value=0)
+        self.progress_label.config(text=f"Downloading failed: {error}", wraplength=280)
+        self.button_retry.grid(row=2, column=0, padx=5, pady=5)
+
+    def retry(self):
+        """Start preparing the data again after an error."""
+        self.button_retry.grid_forget()
+        self.progress_bar.config(mode='indeterminate')
+        self.progress_label.config(text="Downloading data...")
+        self.show_progress_bar()
+
+    def show_progress(self):
+        """Show the current progress in the progress bar and the label.
 
-        If it has completed, enable the start button and show the frame that plot the data.
+        The bar becomes determinate as soon as the size of every download is known.
         """
-        if self.task_thread.is_alive():
-            self.after(1, self.check_progress)
+        if self.progress is None:
+            return
+        if self.progress.is_determinate():
+            if str(self.progress_bar['mode']) != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate')
+            self.progress_bar['value'] = 100 * self.progress.fraction()
+        if self.progress.phase == "Downloading":
+            self.progress_label.config(text=f"Downloading data... "
+                                            f"{self.progress.received() / 1e6:.1f} MB")
         else:
-            self.progress_bar.stop()
-            self.grid_forget()
-            ranking_frame = RankingPage(self.root, self.life_exp_data)
-            ranking_frame.grid(row=0, column=0, sticky=tk.NSEW)
+            self.progress_label.config(text=f"{self.progress.phase} data...")
 
     def download_and_clean_data(self):
         """Download data from sources and organize the data to make it
-        suitable for the program use."""
-        life_expectancy_data = download_csv_from_url(LIFE_EXPECTANCY_URL)
-        # Get the necessary columns from the life_expectancy dataset
-        life_expectancy = life_expectancy_data[["REF_AREA", "Geographic area",
-                                                "Sex", "TIME_PERIOD", "OBS_VALUE"]]
-
-        # Get the necessary columns from the country_info dataset
-        country_info = download_csv_from_url(COUNTRY_NAME_URL)
-        country_info = country_info[['Alpha-3 code']]\
-            .apply(lambda n: n.str.strip('" '))
-        country_info = country_info.rename(columns={"Alpha-3 code": "REF_AREA"})
-        # Get the dataframe of life expectancy in each countries
-        life_expectancy = life_expectancy[life_expectancy.REF_AREA.isin(
-            list(country_info["REF_AREA"]))]
-        # Rename columns and reverb "Total" to "Both sexes"
-        life_expectancy = life_expectancy.rename(columns={"Geographic area": "Country",
-                                                          "TIME_PERIOD": "Year",
-                                                          "OBS_VALUE": "Value"})
-        life_expectancy = life_expectancy.replace('Total', "Both sexes")
-        # eliminate "Other, non specified"
-        life_expectancy = life_expectancy.loc[life_expectancy.Country != "Other, non specified"]
-        country_list = life_expectancy.Country
-        # remove bracket off the country name, the text in the brackets is incomplete.
-        new_country_list = []
-        for country_name in country_list:
-            new_name = country_name
-            for cha in country_name:
-                if cha == "(":
-                    k = country_name.index(cha)
-                    new_name = country_name[:k]
-                    break
-            new_country_list.append(new_name)
-        life_expectancy.Country = new_country_list
-        # Save in the attribute
-        self.life_exp_data = life_expectancy
+        suitable for the program use.
 
-
-def download_csv_from_url(url):
-    """Return the dataframe of csv file from the given url."""
-    csv_file = requests.get(url).content
-    csv_data = pd.read_csv(io.StringIO(csv_file.decode('utf-8')))
-    return csv_data
+        It runs in a worker thread and returns the indicator engine and the IndicatorData
+        of the default indicator, the other indicators are loaded when they are selected.
+        The heavy modules are imported here, not when the application starts.
+        """
+        # pylint: disable=import-outside-toplevel
+        from dataset import DownloadProgress, source_urls
+        from indicator_engine import IndicatorEngine
+        from indicators import DEFAULT_INDICATOR, INDICATORS
+        engine = IndicatorEngine(self.cache)
+        self.progress = DownloadProgress(source_urls(INDICATORS[DEFAULT_INDICATOR]))
+        result = (engine, engine.get(DEFAULT_INDICATOR, self.progress))
+        # import the ranking page while still in the worker thread
+        import ranking_page  # noqa: F401
+        return result
@@ -0,0 +1,63 @@
+"""This module contains FigurePool class."""
+import os
+import instrumentation
+
+# Number of figures that can be shown at the same time, each detail window uses two.
+MAX_LIVE_FIGURES = int(os.environ.get('LIFE_EXP_MAX_FIGURES', 40))
+# Number of released figures kept for reuse.
+MAX_IDLE_FIGURES = 4
+
+
+class FigurePoolFull(Exception):
+    """Raised when a figure is requested while MAX_LIVE_FIGURES are shown."""
+
+
+class FigurePool:
+    """This class hands out matplotlib figures with a tkinter canvas and takes them back
+    when their window closes.
+
+    A released figure is cleared and kept for the next window instead of being
+    garbage, its canvas widget is destroyed because tkinter widgets can't move to
+    another window. matplotlib is only imported when the first figure is made.
+    """
+    def __init__(self, max_live=MAX_LIVE_FIGURES, max_idle=MAX_IDLE_FIGURES):
+        self.max_live = max_live
+        self.max_idle = max_idle
+        self.live = 0
+        self._idle = []
+
+    def can_acquire(self, count=1):
+        """Return True if count more figures can be shown."""
+        return self.live + count <= self.max_live
+
+    def acquire(self, master, layout=None):
+        """Return a figure and a FigureCanvasTkAgg showing it in the master widget."""
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        if not self.can_acquire():
+            raise FigurePoolFull(f"Only {self.max_live} figures can be shown at the same time.")
+        figure = self._idle.pop() if self._idle else Figure()
+        figure.set_layout_engine(layout)
+        canvas = FigureCanvasTkAgg(figure, master=master)
+        if instrumentation.is_enabled():
+            # time the real rendering, which draw_idle does later
+            canvas.draw = instrumentation.timed('canvas draw', 'render')(canvas.draw)
+        self.live += 1
+        return figure, canvas
+
+    def release(self, figure, canvas):
+        """Destroy the canvas and keep the cleared figure for reuse."""
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.backend_bases import FigureCanvasBase
+        # a draw scheduled by draw_idle would run on the destroyed widget
+        if getattr(canvas, '_idle_draw_id', None):
+            canvas.get_tk_widget().after_cancel(canvas._idle_draw_id)  # pylint: disable=protected-access
+        canvas.get_tk_widget().destroy()
+        # the figure must not keep the destroyed canvas alive
+        FigureCanvasBase(figure)
+        figure.clear()
+        figure.set_layout_engine('none')
+        self.live -= 1
+        if len(self._idle) < self.max_idle:
+            self._idle.append(figure)
@@ -0,0 +1,182 @@
+"""This module contains HttpCache class."""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Where raw responses are kept between launches, can be changed by environment variables.
+CACHE_DIR = os.environ.get('LIFE_EXP_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'life_exp'))
+# Seconds before a cached response has to be revalidated with the server.
+CACHE_TTL = int(os.environ.get('LIFE_EXP_CACHE_TTL', 7 * 24 * 60 * 60))
+# Total size of all cached bodies and snapshots before the least recently used ones
+# are removed.
+CACHE_MAX_BYTES = int(os.environ.get('LIFE_EXP_CACHE_MAX_MB', 200)) * 1024 * 1024
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when the requested url has never been cached."""
+
+
+class CacheEntry:
+    """A cached response: the path of the body on disk and its metadata."""
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def age(self):
+        """Seconds since the entry was last confirmed by the server."""
+        return time.time() - self.meta.get('checked', 0)
+
+
+class HttpCache:
+    """This class keeps raw http responses on disk so they can be reused
+    by later launches of the application.
+
+    Each url is stored as two files named after the hash of the url, the body
+    itself and a json file with the validators (ETag/Last-Modified) the server sent.
+    The snapshots saved in subdirectories (snapshot.py) count towards max_bytes too.
+    """
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES,
+                 offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, url):
+        """Return the path of the body and the metadata file of the url."""
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.json'
+
+    def get(self, url):
+        """Return the CacheEntry of the url or None if it is not cached."""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        # the modified time of the body is used to find the least recently used entry
+        os.utime(body_path)
+        return CacheEntry(body_path, meta)
+
+    def is_fresh(self, entry):
+        """Return True if the entry is young enough to be used without asking the server."""
+        return entry.age < self.ttl
+
+    @staticmethod
+    def validators(entry):
+        """Return the headers for a conditional GET of the cached entry."""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.meta.get('etag'):
+            headers['If-None-Match'] = entry.meta['etag']
+        if entry.meta.get('last_modified'):
+            headers['If-Modified-Since'] = entry.meta['last_modified']
+        return headers
+
+    def revalidated(self, url, entry, headers):
+        """The server answered 304, mark the entry as checked now."""
+        entry.meta['checked'] = time.time()
+        entry.meta['etag'] = headers.get('ETag', entry.meta.get('etag'))
+        entry.meta['last_modified'] = headers.get('Last-Modified',
+                                                  entry.meta.get('last_modified'))
+        self._write_meta(url, entry.meta)
+
+    def store(self, url, chunks, headers):
+        """Save the body of a response, given as an iterable of bytes chunks,
+        while passing every chunk on to the caller.
+
+        The body is written to a temporary file first and only replaces the cached
+        copy once the caller has consumed the whole body, so an interrupted download
+        never replaces a good cached copy.
+        """
+        body_path, _ = self._paths(url)
+        tmp_path = body_path + '.tmp'
+        size = 0
+        digest = hashlib.sha256()
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as body_file:
+                for chunk in chunks:
+                    body_file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        os.replace(tmp_path, body_path)
+        meta = {'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'size': size,
+                'sha256': digest.hexdigest(),
+                'checked': time.time()}
+        self._write_meta(url, meta)
+        self.evict(keep=body_path)
+
+    def put(self, url, body, headers=None):
+        """Save a body made here instead of received, e.g. merged observations."""
+        for _ in self.store(url, [body], headers or {}):
+            pass
+
+    def _write_meta(self, url, meta):
+        """Write the metadata file of the url."""
+        _, meta_path = self._paths(url)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, meta_path)
+
+    def evict(self, keep=None):
+        """Remove the least recently used bodies and snapshots until the cache fits in
+        max_bytes. keep is the path of a body or a snapshot directory that stays."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+                meta_path = path[:-len('.body')] + '.json'
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+            total -= size
+
+    def entries(self):
+        """Yield (last used, size, path) of every cached body and snapshot directory.
+
+        A snapshot is a directory with a meta.json, which is touched when it is used,
+        it is removed as a whole. Snapshots being written (.tmp) are left alone.
+        """
+        for root, directories, files in os.walk(self.directory):
+            if root == self.directory:
+                for name in files:
+                    if name.endswith('.body'):
+                        path = os.path.join(root, name)
+                        stat = os.stat(path)
+                        yield stat.st_mtime, stat.st_size, path
+            elif 'meta.json' in files:
+                directories.clear()
+                try:
+                    used = os.stat(os.path.join(root, 'meta.json')).st_mtime
+                    size = sum(os.path.getsize(os.path.join(root, name)) for name in files)
+                except OSError:
+                    # replaced by a newer snapshot in the meantime
+                    continue
+                yield used, size, root
+            directories[:] = [name for name in directories if not name.endswith('.tmp')]
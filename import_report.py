@@ -0,0 +1,42 @@
+"""Print how long importing each module of the application takes, so slow imports
+added to the startup path are easy to notice.
+
+Run it with python import_report.py [module ...], every module is imported in a new
+interpreter with python -X importtime.
+"""
+import subprocess
+import sys
+
+# Modules imported before the loading window appears and the ones loaded later.
+DEFAULT_MODULES = ['download_data', 'dataset', 'ranking_page', 'detail']
+# Number of the slowest imported modules listed for each module.
+TOP_MODULES = 10
+
+
+def import_times(module):
+    """Return (name, self time, cumulative time) in microseconds of every module
+    imported by importing the module in a new interpreter."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, check=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_time), int(cumulative)))
+    return times
+
+
+def report(modules, top=TOP_MODULES):
+    """Print the total import time of each module and its slowest imports."""
+    for module in modules:
+        times = import_times(module)
+        total = next((cumulative for name, _, cumulative in times if name == module), 0)
+        print(f"{module}: {total / 1000:.1f} ms, {len(times)} modules imported")
+        for name, self_time, cumulative in sorted(times, key=lambda item: -item[1])[:top]:
+            print(f"    {name:<40} self {self_time / 1000:7.1f} ms   "
+                  f"cumulative {cumulative / 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    report(sys.argv[1:] or DEFAULT_MODULES)
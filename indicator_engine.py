@@ -0,0 +1,112 @@
+"""This module contains IndicatorData and IndicatorEngine classes."""
+import os
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import instrumentation
+from analytics import RankAnalytics
+from dataset import load_indicator_data
+from indicators import DEFAULT_INDICATOR, INDICATORS
+from rank_cube import RankCube
+from series_store import SeriesStore
+
+# Megabytes the loaded indicators may take before the least recently used are dropped.
+INDICATOR_BUDGET_MB = int(os.environ.get('LIFE_EXP_INDICATOR_BUDGET_MB', 512))
+
+
+class IndicatorData:
+    """The cleaned data of one indicator with its rank cube, series store and
+    rank analytics, which is everything the pages need to show it.
+
+    The data has the same compact columns for every indicator (categorical area,
+    country and sex, int16 year, float32 value), the rank cube holds the values as a
+    dense area × year × sex array, so a value is found by (indicator, area, year, sex).
+    """
+    def __init__(self, indicator, data):
+        self.indicator = indicator
+        self.data = data
+        self.rank_cube = RankCube(data)
+        self.series_store = SeriesStore(data)
+        self.analytics = RankAnalytics(self.rank_cube)
+        self.nbytes = self.memory_usage()
+
+    def memory_usage(self):
+        """Return an estimate of the bytes taken by the data and the arrays made from it."""
+        arrays = [self.rank_cube.values, self.rank_cube.order, self.rank_cube.counts,
+                  self.rank_cube.rank]
+        arrays += [array for column, array in self.analytics.columns.items() if column != 'value']
+        arrays += [array for column, array in self.analytics.orders.items() if column != 'value']
+        # a broadcast array takes the memory of the array it was made from
+        total = sum(np.asarray(array.base if array.strides[-1] == 0 else array).nbytes
+                    for array in arrays)
+        # the categories are small, the codes and the numbers are what grows
+        return total + sum(self.data[column].array.nbytes for column in self.data.columns)
+
+
+class IndicatorEngine:
+    """This class holds the data of many indicators at the same time.
+
+    An indicator is only downloaded and prepared the first time it is asked for, so
+    starting the application costs the same however many indicators there are. When
+    the loaded indicators take more than max_bytes the least recently used ones are
+    dropped, asking for them again maps in their snapshot from the cache.
+    """
+    def __init__(self, cache=None, max_bytes=INDICATOR_BUDGET_MB * 1024 * 1024):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self._loaded = OrderedDict()
+        self._lock = Lock()
+        # one lock per indicator, so an indicator asked for twice is loaded once
+        self._loading = {}
+
+    @property
+    def indicators(self):
+        """Return the indicators that can be asked for."""
+        return list(INDICATORS.values())
+
+    @property
+    def size(self):
+        """Return the bytes taken by the loaded indicators."""
+        with self._lock:
+            return sum(data.nbytes for data in self._loaded.values())
+
+    def is_loaded(self, code):
+        """Return True if the indicator can be returned without loading it."""
+        with self._lock:
+            return code in self._loaded
+
+    def get(self, code=DEFAULT_INDICATOR, progress=None):
+        """Return the IndicatorData of the indicator code, loading it if needed.
+
+        It can take seconds, so the pages call it from a worker thread.
+        progress is a DownloadProgress of the source_urls of the indicator.
+        """
+        with self._lock:
+            if code in self._loaded:
+                self._loaded.move_to_end(code)
+                return self._loaded[code]
+            loading = self._loading.setdefault(code, Lock())
+        with loading:
+            with self._lock:
+                if code in self._loaded:
+                    self._loaded.move_to_end(code)
+                    return self._loaded[code]
+            with instrumentation.span(f"load indicator {code}"):
+                indicator = INDICATORS[code]
+                data = IndicatorData(indicator, load_indicator_data(indicator, self.cache,
+                                                                    progress))
+            with self._lock:
+                self._loaded[code] = data
+                self.evict(keep=code)
+        return data
+
+    def evict(self, keep=None):
+        """Drop the least recently used indicators until the others fit in max_bytes,
+        it is called with the lock held."""
+        total = sum(data.nbytes for data in self._loaded.values())
+        for code in list(self._loaded):
+            if total <= self.max_bytes:
+                break
+            if code == keep:
+                continue
+            total -= self._loaded.pop(code).nbytes
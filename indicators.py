@@ -0,0 +1,58 @@
+"""This module contains Indicator class and the registry of the indicators that can be
+ranked and charted.
+
+Every indicator is a series of a UNICEF SDMX dataflow with one value per area, year
+and sex, so they are all downloaded, cleaned and ranked the same way as life expectancy.
+More indicators are added with register().
+"""
+
+
+class Indicator:
+    """An SDMX series: its dataflow, its code in the key and how it is shown.
+
+    key_tail is the part of the key after the indicator, one '.' and value for each
+    dimension that follows it, an empty value matches all.
+    """
+    def __init__(self, code, name, unit, dataflow="UNICEF,DM,1.0", key_tail="...", digits=2):
+        self.code = code
+        self.name = name
+        self.unit = unit
+        self.dataflow = dataflow
+        self.key_tail = key_tail
+        self.digits = digits
+
+    @property
+    def label(self):
+        """The name with the unit, for the axes and the headings."""
+        return f"{self.name} ({self.unit})"
+
+    def __repr__(self):
+        return f"Indicator({self.code!r})"
+
+
+# The key of the DM dataflow is REF_AREA.INDICATOR.SEX.AGE.RESIDENCE and the key of
+# the CME dataflow is REF_AREA.INDICATOR.SEX.WEALTH_QUINTILE, _T is the total.
+LIFE_EXPECTANCY = Indicator("DM_LIFE_EXP", "Life expectancy", "years")
+INDICATORS = {indicator.code: indicator for indicator in [
+    LIFE_EXPECTANCY,
+    Indicator("CME_MRY0T4", "Under-five mortality", "deaths per 1,000 live births",
+              "UNICEF,CME,1.0", ".._T", digits=1),
+    Indicator("CME_MRM0", "Neonatal mortality", "deaths per 1,000 live births",
+              "UNICEF,CME,1.0", ".._T", digits=1),
+    Indicator("DM_POP_TOT", "Population", "thousands", key_tail=".._T._T", digits=0),
+]}
+DEFAULT_INDICATOR = LIFE_EXPECTANCY.code
+
+
+def register(indicator):
+    """Add an indicator to the registry, or replace the one with the same code."""
+    INDICATORS[indicator.code] = indicator
+    return indicator
+
+
+def by_name(name):
+    """Return the indicator with the given name, or None."""
+    for indicator in INDICATORS.values():
+        if indicator.name == name:
+            return indicator
+    return None
@@ -0,0 +1,124 @@
+"""This module contains functions for timing the stages of the application and
+exporting the timings as a trace.
+
+It is off by default, every timer then costs a single flag check. It is switched on
+by the LIFE_EXP_TRACE environment variable or the --trace option of main.py, their
+value is the path the trace is written to when the application exits. The trace is in
+the Chrome trace format (chrome://tracing, Perfetto) unless LIFE_EXP_TRACE_FORMAT
+or --trace-format is 'json'.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+# Number of the latest timings kept in memory.
+MAX_EVENTS = 100_000
+
+_enabled = False
+_events = deque(maxlen=MAX_EVENTS)
+_counters = Counter()
+_lock = threading.Lock()
+_start = time.perf_counter_ns()
+
+
+def enable(path=None, trace_format='chrome'):
+    """Start recording timings, and write them to path when the application exits."""
+    global _enabled  # pylint: disable=global-statement
+    _enabled = True
+    if path:
+        atexit.register(export_trace, path, trace_format)
+
+
+def is_enabled():
+    """Return True if timings are being recorded."""
+    return _enabled
+
+
+def record(name, category, start, end):
+    """Record a timing, start and end are time.perf_counter_ns() values."""
+    with _lock:
+        _events.append((name, category, start, end - start, threading.get_ident()))
+        _counters[name] += 1
+
+
+def count(name, amount=1):
+    """Add to a counter, e.g. the number of bytes downloaded."""
+    if _enabled:
+        with _lock:
+            _counters[name] += amount
+
+
+def timed(name, category='stage'):
+    """Decorator that records how long each call of the function takes."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, category, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+class span:  # pylint: disable=invalid-name
+    """Context manager that records how long the block inside it takes."""
+    def __init__(self, name, category='stage'):
+        self.name = name
+        self.category = category
+        self.start = 0
+
+    def __enter__(self):
+        if _enabled:
+            self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _enabled and self.start:
+            record(self.name, self.category, self.start, time.perf_counter_ns())
+
+
+def recent(number):
+    """Return the latest timings as (name, category, milliseconds), the newest last."""
+    with _lock:
+        events = list(_events)[-number:]
+    return [(name, category, duration / 1e6) for name, category, _, duration, _ in events]
+
+
+def counters():
+    """Return a copy of the counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def export_trace(path, trace_format='chrome'):
+    """Write the recorded timings to path in the Chrome trace format or plain json."""
+    with _lock:
+        events = list(_events)
+        counts = dict(_counters)
+    pid = os.getpid()
+    if trace_format == 'chrome':
+        trace = {'traceEvents': [{'name': name, 'cat': category, 'ph': 'X',
+                                  'ts': (start - _start) / 1000, 'dur': duration / 1000,
+                                  'pid': pid, 'tid': thread}
+                                 for name, category, start, duration, thread in events],
+                 'otherData': {'counters': counts}}
+    else:
+        trace = {'events': [{'name': name, 'category': category,
+                             'start_ms': (start - _start) / 1e6, 'duration_ms': duration / 1e6,
+                             'thread': thread}
+                            for name, category, start, duration, thread in events],
+                 'counters': counts}
+    with open(path, 'w', encoding='utf-8') as trace_file:
+        json.dump(trace, trace_file)
+
+
+if os.environ.get('LIFE_EXP_TRACE'):
+    enable(os.environ['LIFE_EXP_TRACE'], os.environ.get('LIFE_EXP_TRACE_FORMAT', 'chrome'))
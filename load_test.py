@@ -0,0 +1,171 @@
+"""Measure how many requests a second the query server answers and how long they take.
+
+Run it with python load_test.py [URL] [--connections 64] [--duration 10]
+[--revalidate] [--seed 0], URL is the address of a running query_server.py
+(http://127.0.0.1:8080 by default). Every connection sends one request after the other
+on a kept open connection until the duration is over. The requests are a mix of
+rankings of random years, sexes and orders, series of random countries and searches of
+the beginning of their names. With --revalidate the ETag of every response is sent back
+in If-None-Match, like a dashboard that polls does.
+
+The clients run in this process on one asyncio event loop, on a single machine they
+share the cores with the server, which the numbers include.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+# Share of the rankings, series and searches in the requests.
+MIX = {'ranking': 0.5, 'series': 0.35, 'search': 0.15}
+# Number of different requests the mix is made of.
+NUMBER_OF_TARGETS = 2000
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Connection:
+    """A kept open http/1.1 connection to the server."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, target, headers=None):
+        """Send a GET request and return (status, headers, body) of the response,
+        the connection is opened again if the server closed it."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"GET {target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("The server closed the connection.")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            response_headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def make_targets(ranking, number, rng):
+    """Return the request targets of the mix made from the years, sexes and countries
+    of a ranking response."""
+    years, sexes = ranking['years'], ranking['sexes']
+    countries = [(row['code'], row['country']) for row in ranking['rows']]
+    targets = []
+    for kind in rng.choices(list(MIX), weights=list(MIX.values()), k=number):
+        if kind == 'ranking':
+            targets.append(f"/ranking?year={rng.choice(years)}&sex={quote(rng.choice(sexes))}"
+                           f"&order={rng.choice(['desc', 'asc'])}")
+        elif kind == 'series':
+            targets.append(f"/series/{rng.choice(countries)[0]}")
+        else:
+            name = rng.choice(countries)[1]
+            targets.append(f"/search?q={quote(name[:rng.randint(1, len(name))])}")
+    return targets
+
+
+async def client(host, port, targets, deadline, revalidate, results, rng):
+    """Send requests until the deadline and append (seconds, status) of each to results."""
+    connection = Connection(host, port)
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            target = rng.choice(targets)
+            headers = {'If-None-Match': etags[target]} if target in etags else None
+            start = time.perf_counter()
+            try:
+                status, response_headers, _ = await connection.request(target, headers)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                results.append((time.perf_counter() - start, None))
+                continue
+            results.append((time.perf_counter() - start, status))
+            if revalidate and 'etag' in response_headers:
+                etags[target] = response_headers['etag']
+    finally:
+        connection.close()
+
+
+def percentile(ordered, percent):
+    """Return the value below which the percent of the ordered values are."""
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def run(url, connections, duration, revalidate, seed):
+    """Load the server at url and return a dict of the results."""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    probe = Connection(host, port)
+    status, _, body = await probe.request('/ranking')
+    probe.close()
+    if status != 200:
+        raise RuntimeError(f"The server answered /ranking with {status}: {body[:200]!r}")
+    rng = random.Random(seed)
+    targets = make_targets(json.loads(body), NUMBER_OF_TARGETS, rng)
+    results = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, targets, deadline, revalidate, results,
+                                  random.Random(rng.random()))
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds * 1000 for seconds, status in results if status is not None)
+    statuses = Counter(status for _, status in results)
+    return {'requests': len(results), 'seconds': elapsed,
+            'requests_per_second': len(results) / elapsed,
+            'errors': statuses.pop(None, 0),
+            'statuses': dict(statuses),
+            'latency_ms': {f'p{percent:g}': percentile(latencies, percent)
+                           for percent in PERCENTILES} | {'max': latencies[-1] if latencies
+                                                          else float('nan')}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the query server.")
+    parser.add_argument('url', nargs='?', default='http://127.0.0.1:8080')
+    parser.add_argument('--connections', type=int, default=64,
+                        help="number of clients sending requests at the same time")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('--revalidate', action='store_true',
+                        help="send the ETags back, so unchanged responses are 304")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the request mix")
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    args = parser.parse_args(argv)
+    result = asyncio.run(run(args.url, args.connections, args.duration, args.revalidate,
+                             args.seed))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['requests']} requests in {result['seconds']:.1f} s "
+              f"from {args.connections} connections: "
+              f"{result['requests_per_second']:.0f} requests/s, {result['errors']} errors")
+        print("statuses " + ', '.join(f"{status}: {number}"
+                                      for status, number in sorted(result['statuses'].items())))
+        print("latency  " + ', '.join(f"{name} {value:.2f} ms"
+                                      for name, value in result['latency_ms'].items()))
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
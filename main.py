@@ -1,6 +1,22 @@
 """Run the app here."""
+import argparse
 import tkinter as tk
+import instrumentation
 from download_data import DownloadData
+from http_cache import HttpCache
+
+parser = argparse.ArgumentParser(description="Life expectancy ranking of countries.")
+parser.add_argument('--offline', action='store_true',
+                    help="start from the cached data without using the network")
+parser.add_argument('--trace', metavar='PATH',
+                    help="record the timings of the app and write them to PATH on exit")
+parser.add_argument('--trace-format', choices=('chrome', 'json'), default='chrome',
+                    help="chrome (open in chrome://tracing or Perfetto) or plain json")
+parser.add_argument('--trace-overlay', action='store_true',
+                    help="show the latest timings in a small window")
+args = parser.parse_args()
+if args.trace or args.trace_overlay:
+    instrumentation.enable(args.trace, args.trace_format)
 
 root = tk.Tk()
 screen_width = root.winfo_screenwidth()
@@ -11,6 +27,9 @@ center_x = int(screen_width / 2 - W_WIDTH / 2)
 center_y = int(screen_height / 2 - W_HEIGHT / 2)
 # place the window at the center
 root.geometry(f'{W_WIDTH}x{W_HEIGHT}+{center_x}+{center_y}')
-download_frame = DownloadData(root)
+download_frame = DownloadData(root, HttpCache(offline=args.offline))
 download_frame.grid(row=0, column=0, sticky=tk.NSEW)
+if args.trace_overlay:
+    from trace_overlay import TraceOverlay  # pylint: disable=ungrouped-imports
+    TraceOverlay(root)
 root.mainloop()
@@ -0,0 +1,64 @@
+"""Open and close detail windows many times and print the resident memory,
+to confirm that closing a window gives its memory back.
+
+Run it with python memory_check.py [cycles], it needs a display and the data
+in the cache (start main.py once first).
+"""
+import os
+import resource
+import sys
+import tkinter as tk
+from dataset import load_life_exp_data
+from detail import DetailPlot
+from figure_pool import FigurePool
+from http_cache import HttpCache
+from rank_cube import RankCube
+from series_store import SeriesStore
+
+# Number of windows opened and closed when no number is given.
+DEFAULT_CYCLES = 300
+# The memory is printed every REPORT_EVERY cycles.
+REPORT_EVERY = 50
+
+
+def rss_bytes():
+    """Return the current resident memory of the process in bytes."""
+    try:
+        with open('/proc/self/statm', encoding='utf-8') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # no /proc, use the peak instead, which is kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def check_memory(cycles=DEFAULT_CYCLES):
+    """Open and close cycles detail windows, return the memory after each report."""
+    life_exp_data = load_life_exp_data(HttpCache(offline=True))
+    rank_cube = RankCube(life_exp_data)
+    series_store = SeriesStore(life_exp_data)
+    figure_pool = FigurePool()
+    countries = list(rank_cube.countries)
+    year = int(rank_cube.years[-1])
+
+    root = tk.Tk()
+    root.withdraw()
+    reports = []
+    for cycle in range(1, cycles + 1):
+        top = tk.Toplevel(root)
+        detail_frame = DetailPlot(top, life_exp_data, countries[cycle % len(countries)], year,
+                                  rank_cube, series_store, figure_pool=figure_pool)
+        detail_frame.grid(row=0, column=0, sticky=tk.NSEW)
+        root.update()
+        detail_frame.close()
+        root.update()
+        if cycle % REPORT_EVERY == 0:
+            reports.append(rss_bytes())
+            print(f"{cycle:5d} windows: {reports[-1] / 1e6:.1f} MB, "
+                  f"{figure_pool.live} figures live")
+    root.destroy()
+    return reports
+
+
+if __name__ == '__main__':
+    check_memory(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CYCLES)
@@ -0,0 +1,268 @@
+"""This module contains FrameCache, FrameRenderer and Playback classes."""
+import os
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import instrumentation
+
+# Frames shown per second while playing.
+FPS = 30
+# Megabytes of rendered frames kept for all the detail windows.
+FRAME_CACHE_MB = int(os.environ.get('LIFE_EXP_FRAME_CACHE_MB', 256))
+
+
+class FrameCache:
+    """This class keeps rendered frames of the bar graph, keyed by
+    (indicator, country, sex filters, size, year), and drops the least recently used ones
+    when they take more than max_bytes."""
+    def __init__(self, max_bytes=FRAME_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the frame of the key, or None if it isn't rendered."""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def put(self, key, frame):
+        """Keep a PIL image as the frame of the key."""
+        nbytes = frame.width * frame.height * len(frame.getbands())
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = frame
+            self.size += nbytes
+            while self.size > self.max_bytes and len(self._frames) > 1:
+                _, old = self._frames.popitem(last=False)
+                self.size -= old.width * old.height * len(old.getbands())
+
+
+class FrameRenderer:
+    """This class renders the bar graph of a detail window for any year with Agg,
+    the same way DetailPlot.plot_bar draws it.
+
+    Everything but the bars, their labels and the title is drawn once, every frame
+    restores that background and only draws the artists that change.
+    """
+    def __init__(self, size, dpi, sexes, colors, limits, indicator):
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        self.size = size
+        self.indicator = indicator
+        self.figure = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_ylim(*limits)
+        self.axes.set_xlabel("Sex")
+        self.axes.set_ylabel(indicator.label)
+        self.axes.grid(True)
+        self.axes.set_axisbelow(True)
+        positions = np.arange(len(sexes))
+        self.bars = self.axes.bar(positions, np.zeros(len(sexes)), color=colors,
+                                  edgecolor="black")
+        self.axes.set_xticks(positions, sexes)
+        self.title = self.axes.set_title(" \n ")
+        for artist in [*self.bars, self.title]:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def render(self, country, year, values):
+        """Return the frame of the year as a PIL image, values are the bar heights."""
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+        self.canvas.restore_region(self.background)
+        for rect, value in zip(self.bars, values):
+            rect.set_height(0 if np.isnan(value) else value)
+        labels = self.axes.bar_label(self.bars, labels=[
+            "No data" if np.isnan(value) else f"{value:.{self.indicator.digits}f}"
+            for value in values])
+        self.title.set_text(f"{self.indicator.name} in \n{country} in {year}")
+        for artist in [*self.bars, *labels, self.title]:
+            self.axes.draw_artist(artist)
+        frame = Image.frombuffer('RGBA', self.size, bytes(self.canvas.buffer_rgba()),
+                                 'raw', 'RGBA', 0, 1)
+        for label in labels:
+            label.remove()
+        return frame
+
+
+class Playback:
+    """This class plays the bar graph of a detail window from the earliest year to
+    the latest one.
+
+    The frames are rendered ahead in a worker thread into a cache that is shared by
+    the windows. The ui thread only pastes the cached frames on the bar canvas, on
+    the image of the canvas, at a steady frame rate. Moving the year slider shows the
+    cached frame of the year when there is one instead of drawing the graph again.
+    """
+    _executor = ThreadPoolExecutor(max_workers=1)
+    shared_cache = FrameCache()
+
+    def __init__(self, detail, frame_cache=None):
+        self.detail = detail
+        self.frame_cache = frame_cache if frame_cache is not None else self.shared_cache
+        self.playing = False
+        self.after_id = None
+        self.next_tick = 0.0
+        # the job rendering the frames of the current key and the event that stops it
+        self.job = None
+        self.job_key = None
+        self.job_cancel = threading.Event()
+        self.photo = None
+        self.image_item = None
+
+    def base_key(self):
+        """Return the part of the frame key that doesn't depend on the year."""
+        return (self.detail.indicator.code, self.detail.country_name.get(),
+                tuple(self.detail.sex_filters),
+                self.detail.fig_canvas_bar.get_width_height(physical=True))
+
+    def years(self):
+        """Return the years of the data from the selected one to the latest and then the
+        rest, which is the order the frames are needed in."""
+        years = [int(year) for year in self.detail.rank_cube.years]
+        start = int(np.searchsorted(years, self.detail.year.get()))
+        return years[start:] + years[:start]
+
+    def next_year(self, year):
+        """Return the first year of the data after the year, or None after the latest."""
+        years = self.detail.rank_cube.years
+        index = int(np.searchsorted(years, year, side='right'))
+        return int(years[index]) if index < len(years) else None
+
+    def prerender(self):
+        """Start rendering the frames of the selected country and sexes that
+        aren't in the cache yet."""
+        key = self.base_key()
+        if key == self.job_key and self.job is not None and not self.job.done():
+            return
+        self.cancel_job()
+        missing = [year for year in self.years() if (*key, year) not in self.frame_cache]
+        if not missing:
+            return
+        self.detail.update_data()
+        table = self.detail.one_country.reindex(columns=self.detail.sex_filters)
+        self.job_key = key
+        self.job_cancel = threading.Event()
+        self.job = self._executor.submit(
+            self.render_frames, key, missing, table, self.job_cancel,
+            self.detail.fig_bar.dpi, list(self.detail.colors_in_plot),
+            (self.detail.min_value, self.detail.max_value), self.detail.indicator)
+
+    def render_frames(self, key, years, table, cancel, dpi, colors, limits, indicator):
+        """Render the frames of the years into the cache, it runs in the worker thread."""
+        _, country, sexes, size = key
+        renderer = FrameRenderer(size, dpi, list(sexes), colors, limits, indicator)
+        for year in years:
+            if cancel.is_set():
+                return
+            values = table.reindex(index=[year]).iloc[0].to_numpy()
+            with instrumentation.span('render frame', 'render'):
+                self.frame_cache.put((*key, year), renderer.render(country, year, values))
+
+    def cancel_job(self):
+        """Stop rendering frames that aren't needed anymore."""
+        self.job_cancel.set()
+        self.job = None
+        self.job_key = None
+
+    def toggle(self):
+        """Play, or pause if it is playing."""
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def play(self):
+        """Start playing from the selected year, or from the earliest year
+        if the latest one is selected."""
+        if self.detail.selected_option.get() != 'bar':
+            self.detail.selected_option.set('bar')
+            self.detail.show_bar_graph()
+        # a year between the years of the data has no frame, so it starts from the next one
+        years = self.detail.rank_cube.years
+        if self.detail.year.get() >= years[-1]:
+            self.detail.year.set(int(years[0]))
+        elif self.detail.year.get() not in years:
+            self.detail.year.set(self.next_year(self.detail.year.get()))
+        self.prerender()
+        self.playing = True
+        self.detail.button_play.config(text="Pause")
+        self.next_tick = time.perf_counter()
+        self.tick()
+
+    def pause(self):
+        """Stop playing and leave the last shown frame on the canvas."""
+        self.playing = False
+        if self.after_id is not None:
+            self.detail.after_cancel(self.after_id)
+            self.after_id = None
+        self.detail.button_play.config(text="Play")
+
+    def tick(self):
+        """Show the frame of the selected year and move on to the next year.
+        If the frame isn't rendered yet, the year is shown on a later tick."""
+        self.after_id = None
+        year = self.detail.year.get()
+        if self.show_cached(year):
+            instrumentation.count('frames shown')
+            self.detail.update_rank()
+            year = self.next_year(year)
+            if year is None:
+                self.pause()
+                return
+            self.detail.year.set(year)
+        else:
+            instrumentation.count('frames late')
+        # the next tick is planned from the previous one so the frame rate doesn't drift
+        self.next_tick = max(self.next_tick + 1 / FPS, time.perf_counter())
+        delay = int((self.next_tick - time.perf_counter()) * 1000)
+        self.after_id = self.detail.after(max(1, delay), self.tick)
+
+    def show_cached(self, year):
+        """Paste the frame of the year on the bar canvas and return True,
+        or return False if it isn't rendered."""
+        frame = self.frame_cache.get((*self.base_key(), year))
+        if frame is None:
+            return False
+        # pylint: disable=import-outside-toplevel
+        from PIL import ImageTk
+        widget = self.detail.fig_canvas_bar.get_tk_widget()
+        if self.photo is None or (self.photo.width(), self.photo.height()) != frame.size:
+            self.photo = ImageTk.PhotoImage(frame)
+            if self.image_item is not None:
+                widget.delete(self.image_item)
+            self.image_item = None
+        else:
+            self.photo.paste(frame)
+        if self.image_item is None:
+            self.image_item = widget.create_image(0, 0, anchor=tk.NW, image=self.photo)
+        # the graph under the frame shows another year now
+        self.detail.stale_plots.add('bar')
+        return True
+
+    def hide(self):
+        """Remove the frame from the canvas so the graph itself is seen again."""
+        if self.image_item is not None:
+            self.detail.fig_canvas_bar.get_tk_widget().delete(self.image_item)
+            self.image_item = None
+
+    def stop(self):
+        """Stop playing, remove the frame and stop rendering."""
+        if self.playing:
+            self.pause()
+        self.hide()
+        self.cancel_job()
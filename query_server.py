@@ -0,0 +1,420 @@
+"""A local read-only http server answering queries on the cleaned data as json, for
+the dashboards that want the rankings and the series the application shows.
+
+Run it with python query_server.py [--host 127.0.0.1] [--port 8080] [--offline]
+[--indicator CODE] [--warm]. The data is downloaded, cleaned and ranked like the
+application does it (indicator_engine.py), other indicators are loaded the first time
+they are asked for. Every query is a GET:
+
+    /indicators                      the indicators that can be asked for
+    /ranking?year=&sex=&order=&sort= the ranking of the countries in a year, order is
+                                     desc (highest first, the default) or asc, sort is
+                                     one of the columns of the ranking page
+    /series/<country>                the values and ranks of a country in every year,
+                                     the country is its code, name or an alias
+    /search?q=&limit=                the country matching the query, the names starting
+                                     with it and, if none do, the most similar names
+
+Every query also takes indicator=CODE, life expectancy by default. A response is made
+once and kept with the sha256 of its body as ETag, a client sending it back in
+If-None-Match gets 304 without a body. The server runs on one asyncio event loop, the
+connections are kept open between requests, so it answers many clients at the same time
+from one thread. load_test.py measures it.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import traceback
+from collections import OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+import requests
+import instrumentation
+from analytics import COLUMNS
+from http_cache import CacheMiss, HttpCache
+from indicator_engine import IndicatorEngine
+from indicators import DEFAULT_INDICATOR, INDICATORS
+from search_index import SearchIndex
+
+# Number of responses kept, the least recently used are made again when asked for.
+RESPONSE_CACHE_SIZE = 4096
+# Seconds an idle connection is kept open.
+IDLE_TIMEOUT = 30
+# Connections waiting to be accepted.
+BACKLOG = 1024
+# Longest request line or header line and the largest number of headers.
+MAX_LINE = 8192
+MAX_HEADERS = 100
+# Default and largest number of names a search returns.
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+
+
+class QueryError(Exception):
+    """Raised for a query that can't be answered, with the http status to send."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def number(value, digits=3):
+    """Return the value rounded for json, an int if digits is 0, or None if it is NaN."""
+    if value != value:
+        return None
+    return int(value) if digits == 0 else round(value, digits)
+
+
+def dump(data):
+    """Return the data as compact json bytes."""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class QueryApi:
+    """This class answers the queries from the indicators of an IndicatorEngine.
+
+    A response is kept as (status, body, etag) under the query with its defaults filled
+    in, so the same query written another way is answered from the same response. When
+    an indicator is loaded again, e.g. after it was evicted and its data has been
+    updated, its responses are dropped.
+    """
+    def __init__(self, engine, max_size=RESPONSE_CACHE_SIZE):
+        self.engine = engine
+        self.max_size = max_size
+        self._responses = OrderedDict()
+        # code -> the IndicatorData the responses were made from and its search index
+        self._data = {}
+        self._search = {}
+
+    async def indicator_data(self, code):
+        """Return the IndicatorData of the indicator code, loading it in a worker thread
+        so the other clients are answered in the meantime.
+
+        An indicator that can't be loaded raises QueryError, 503 when it isn't cached
+        and the server is offline and 502 when the download failed.
+        """
+        if code not in INDICATORS:
+            raise QueryError(404, f"Unknown indicator {code}, the indicators are "
+                                  f"{', '.join(INDICATORS)}.")
+        try:
+            if self.engine.is_loaded(code):
+                data = self.engine.get(code)
+            else:
+                data = await asyncio.get_running_loop().run_in_executor(None, self.engine.get,
+                                                                        code)
+        except CacheMiss as error:
+            raise QueryError(503, f"{INDICATORS[code].name} isn't cached and the server "
+                                  f"is offline.") from error
+        except requests.RequestException as error:
+            raise QueryError(502, f"{INDICATORS[code].name} can't be downloaded: "
+                                  f"{error}") from error
+        if self._data.get(code) is not data:
+            self._data[code] = data
+            self._search[code] = SearchIndex(data.rank_cube.countries, data.rank_cube.codes)
+            for key in [key for key in self._responses if key[1] == code]:
+                del self._responses[key]
+        return data
+
+    async def respond(self, target):
+        """Return (status, body, etag) of the request target, e.g. /ranking?year=2020."""
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path.rstrip('/') == '/indicators':
+                return self.memoized(('indicators', None), self.indicators)
+            code = params.get('indicator', DEFAULT_INDICATOR)
+            if url.path == '/ranking':
+                data = await self.indicator_data(code)
+                key = ('ranking', code) + self.ranking_query(data, params)
+                return self.memoized(key, self.ranking, data, *key[2:])
+            if url.path.startswith('/series/'):
+                data = await self.indicator_data(code)
+                country = unquote(url.path[len('/series/'):])
+                position = self.country_position(code, country)
+                return self.memoized(('series', code, position), self.series, data, position)
+            if url.path == '/search':
+                data = await self.indicator_data(code)
+                key = ('search', code, params.get('q', ''),
+                       self.integer(params, 'limit', SEARCH_LIMIT, 1, MAX_SEARCH_LIMIT))
+                return self.memoized(key, self.search, code, *key[2:])
+            raise QueryError(404, f"No such query {url.path}.")
+        except QueryError as error:
+            return error.status, dump({'error': str(error)}), None
+
+    def memoized(self, key, make, *args):
+        """Return the response kept under the key, or make it with make(*args)."""
+        response = self._responses.get(key)
+        if response is not None:
+            self._responses.move_to_end(key)
+            instrumentation.count('query cache hits')
+            return response
+        with instrumentation.span(f"query {key[0]}"):
+            body = dump(make(*args))
+        response = 200, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._responses[key] = response
+        if len(self._responses) > self.max_size:
+            self._responses.popitem(last=False)
+        return response
+
+    @staticmethod
+    def integer(params, name, default, low, high):
+        """Return the integer parameter, or raise QueryError if it isn't between low and high."""
+        if name not in params:
+            return default
+        try:
+            value = int(params[name])
+        except ValueError:
+            raise QueryError(400, f"{name} must be a number.") from None
+        if not low <= value <= high:
+            raise QueryError(400, f"{name} must be between {low} and {high}.")
+        return value
+
+    def ranking_query(self, data, params):
+        """Return (year, sex, sort, ascending, limit) of the ranking parameters with the
+        defaults of the ranking page, the latest year and both sexes sorted by value."""
+        rank_cube = data.rank_cube
+        years = rank_cube.years
+        year = self.integer(params, 'year', int(years[-1]), int(years[0]), int(years[-1]))
+        if year not in years:
+            raise QueryError(400, f"There is no data of {year}.")
+        sex = params.get('sex', 'Both sexes' if 'Both sexes' in rank_cube.sexes
+                         else rank_cube.sexes[-1])
+        if sex not in rank_cube.sexes:
+            raise QueryError(400, f"sex must be one of {', '.join(rank_cube.sexes)}.")
+        sort = params.get('sort', 'value')
+        if sort not in COLUMNS:
+            raise QueryError(400, f"sort must be one of {', '.join(COLUMNS)}.")
+        order = params.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            raise QueryError(400, "order must be asc or desc.")
+        limit = self.integer(params, 'limit', len(rank_cube.countries), 1,
+                             len(rank_cube.countries))
+        return year, sex, sort, order == 'asc', limit
+
+    def country_position(self, code, country):
+        """Return the index of the country given by its code, name or an alias."""
+        search_index = self._search[code]
+        found = search_index.lookup(country)
+        if found is None:
+            suggestions = search_index.fuzzy(country)
+            raise QueryError(404, f"Unknown country {country}." + (
+                f" Did you mean {', '.join(suggestions)}?" if suggestions else ""))
+        return search_index.codes.index(found)
+
+    def indicators(self):
+        return [{'code': indicator.code, 'name': indicator.name, 'unit': indicator.unit,
+                 'digits': indicator.digits} for indicator in self.engine.indicators]
+
+    @staticmethod
+    def ranking(data, year, sex, sort, ascending, limit):
+        """Return the rows of the ranking table of the ranking page."""
+        rank_cube, analytics = data.rank_cube, data.analytics
+        ranked = analytics.ranking(sort, year, sex, ascending)[:limit]
+        columns = analytics.rows(ranked, year, sex)
+        y, s = rank_cube.position(year, sex)
+        rows = [{'rank': rank, 'code': code, 'country': country.strip()}
+                for rank, code, country in zip(rank_cube.rank[ranked, y, s].tolist(),
+                                               rank_cube.codes[ranked],
+                                               rank_cube.countries[ranked])]
+        for column, values in columns.items():
+            # the rank changes are whole places
+            digits = 0 if column in ('change', 'change_n') else \
+                1 if column == 'percentile' else 3
+            for row, value in zip(rows, values):
+                row[column] = number(value, digits)
+        return {'indicator': data.indicator.code, 'year': year, 'sex': sex, 'sort': sort,
+                'order': 'asc' if ascending else 'desc', 'count': rank_cube.count(year, sex),
+                'years': rank_cube.years.tolist(), 'sexes': rank_cube.sexes, 'rows': rows}
+
+    @staticmethod
+    def series(data, position):
+        """Return the values and the ranks of the country in every year for each sex,
+        None where it has no value."""
+        rank_cube = data.rank_cube
+        values = rank_cube.values[position]
+        ranks = rank_cube.rank[position]
+        return {'indicator': data.indicator.code, 'code': rank_cube.codes[position],
+                'country': rank_cube.countries[position].strip(),
+                'years': rank_cube.years.tolist(),
+                'values': {sex: [number(value) for value in values[:, s].tolist()]
+                           for s, sex in enumerate(rank_cube.sexes)},
+                'ranks': {sex: [rank or None for rank in ranks[:, s].tolist()]
+                          for s, sex in enumerate(rank_cube.sexes)}}
+
+    def search(self, code, query, limit):
+        """Return the country matching the query and the names it could mean."""
+        search_index = self._search[code]
+        found = search_index.lookup(query) if query else None
+        suggestions = search_index.suggest(query, limit) if query else []
+        similar = [] if suggestions or not query else search_index.fuzzy(query, limit)
+        return {'query': query, 'match': found,
+                'suggestions': [name.strip() for name in suggestions],
+                'similar': [name.strip() for name in similar]}
+
+    def warm(self, data):
+        """Make the responses of the rankings of every year and sex sorted by value and
+        of the series of every country of the IndicatorData ahead of the first client."""
+        code = data.indicator.code
+        limit = len(data.rank_cube.countries)
+        for year in data.rank_cube.years.tolist():
+            for sex in data.rank_cube.sexes:
+                for ascending in (False, True):
+                    key = ('ranking', code, year, sex, 'value', ascending, limit)
+                    self.memoized(key, self.ranking, data, *key[2:])
+        for position in range(len(data.rank_cube.countries)):
+            self.memoized(('series', code, position), self.series, data, position)
+
+
+class QueryServer:
+    """This class serves a QueryApi over http/1.1 with keep-alive on asyncio streams."""
+    def __init__(self, api, host='127.0.0.1', port=8080):
+        self.api = api
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        """Start accepting connections and return the port, which is chosen by the
+        system if port is 0."""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port,
+                                                 backlog=BACKLOG, limit=MAX_LINE)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection until it is closed or idle."""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(response_head(400, 0, None, False))
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+                    else connection == 'keep-alive'
+                instrumentation.count('query requests')
+                if method not in ('GET', 'HEAD'):
+                    body = dump({'error': "Only GET and HEAD are allowed."})
+                    status, etag = 405, None
+                else:
+                    try:
+                        status, body, etag = await self.api.respond(target)
+                    except Exception:  # pylint: disable=broad-except
+                        # the client still gets an answer, the error is printed for the operator
+                        traceback.print_exc()
+                        body = dump({'error': "The query failed on the server."})
+                        status, etag = 500, None
+                if etag is not None and etag_matches(headers.get('if-none-match'), etag):
+                    head = response_head(304, None, etag, keep_alive)
+                else:
+                    head = response_head(status, len(body), etag, keep_alive)
+                    if method == 'GET':
+                        head += body
+                writer.write(head)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+async def read_request(reader):
+    """Return (method, target, version, headers) of the next request with the header
+    names in lower case, or None if the connection was closed. A body is skipped."""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, version = line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n'):
+            break
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        if len(headers) >= MAX_HEADERS:
+            raise ValueError("Too many headers.")
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length:
+        await reader.readexactly(length)
+    return method, target, version, headers
+
+
+def etag_matches(if_none_match, etag):
+    """Return True if the If-None-Match header has the etag or is *."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def response_head(status, length, etag, keep_alive):
+    """Return the status line and the headers of a json response, a 304 has no length."""
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             # clients may keep the response but must ask whether it is still valid
+             "Cache-Control: no-cache",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if length is not None:
+        lines += ["Content-Type: application/json; charset=utf-8", f"Content-Length: {length}"]
+    if etag is not None:
+        lines.append(f"ETag: {etag}")
+    if status == 405:
+        lines.append("Allow: GET, HEAD")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def serve(host, port, engine, indicator=DEFAULT_INDICATOR, warm=False):
+    """Load the indicator, then answer queries until the task is cancelled."""
+    api = QueryApi(engine)
+    data = await api.indicator_data(indicator)
+    if warm:
+        api.warm(data)
+    server = QueryServer(api, host, port)
+    await server.start()
+    print(f"Serving {indicator} on http://{host}:{server.port}", flush=True)
+    await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the rankings and the series of "
+                                                 "the indicators as json.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--offline', action='store_true',
+                        help="use the cached data without using the network")
+    parser.add_argument('--indicator', choices=list(INDICATORS), default=DEFAULT_INDICATOR,
+                        help="code of the indicator loaded before serving")
+    parser.add_argument('--warm', action='store_true',
+                        help="make the responses of every ranking and series before serving")
+    args = parser.parse_args(argv)
+    engine = IndicatorEngine(HttpCache(offline=args.offline))
+    try:
+        asyncio.run(serve(args.host, args.port, engine, args.indicator, args.warm))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
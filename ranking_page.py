@@ -2,15 +2,51 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter.messagebox import showinfo
-import numpy as np
-from ttkwidgets.autocomplete import AutocompleteCombobox
-from detail import DetailPlot
+import importlib
+import math
+import instrumentation
+from analytics import RankAnalytics
+from figure_pool import FigurePool
+from indicators import LIFE_EXPECTANCY, by_name
+from rank_cube import RankCube
+from scheduler import EventCoalescer
+from search_box import SearchCombobox
+from search_index import SearchIndex
+from task_runner import TaskRunner
+from series_store import SeriesStore
+
+# Milliseconds after the page appears before the modules of the detail window are loaded.
+PREWARM_DELAY = 500
+# Column of the analytics each table column is sorted by.
+SORT_KEYS = {'rank': 'value', 'life_exp': 'value', 'change': 'change', 'change_n': 'change_n',
+             'delta': 'delta', 'gap': 'gap', 'percentile': 'percentile'}
+# Shown in the table where a value is unknown, e.g. the change of the first year.
+NO_DATA = '–'
+
+
+def format_change(value):
+    """Return a change of rank as +3, -2 or 0."""
+    if math.isnan(value):
+        return NO_DATA
+    return f"{int(value):+d}" if value else "0"
+
+
+def format_number(value, signed=False, digits=2):
+    """Return a number of years or a percentile with the given number of digits."""
+    if math.isnan(value):
+        return NO_DATA
+    return f"{value:+.{digits}f}" if signed else f"{value:.{digits}f}"
 
 
 class RankingPage(ttk.Frame):
     """This class is responsible for create ui for showing rank
-    of life expectancy of countries."""
-    def __init__(self, parent, life_exp_data):
+    of life expectancy of countries.
+
+    With an IndicatorEngine the indicator can be changed, the data of the selected
+    indicator is loaded by a worker thread the first time and the table then shows it.
+    """
+    def __init__(self, parent, life_exp_data, rank_cube=None, series_store=None,
+                 analytics=None, engine=None, indicator=LIFE_EXPECTANCY):
         super().__init__(parent)
         # resize root window - make it bigger
         screen_width = parent.winfo_screenwidth()
@@ -23,23 +59,53 @@ class RankingPage(ttk.Frame):
         parent.grid_rowconfigure(0, weight=1)
         parent.grid_columnconfigure(0, weight=1)
         self.root = parent
+        # the indicator shown and the engine that loads the other ones
+        self.indicator = indicator
+        self.engine = engine
+        self.indicator_task = None
 
         # Store life_exp_data so it is ready to use
         self.life_exp_data = life_exp_data
+        # the rank of every country in every year is computed once
+        self.rank_cube = rank_cube if rank_cube is not None else RankCube(life_exp_data)
+        # every detail window reads the tables of the countries from the same store
+        self.series_store = series_store if series_store is not None \
+            else SeriesStore(life_exp_data)
+        # rank changes, gaps and percentiles of every year and sex, sorted once
+        self.analytics = analytics if analytics is not None else RankAnalytics(self.rank_cube)
         # Create all necessary variables for the widgets
         self.user_input = tk.StringVar()
         self.ascending = tk.BooleanVar()
         self.ascending.set(False)
         self.year = tk.IntVar()
-        all_year = list(set(self.life_exp_data.Year))
-        all_year.sort()
-        latest_year = all_year[-1]
+        latest_year = self.rank_cube.years[-1]
         self.year.set(latest_year)
+        self.sex = tk.StringVar()
+        self.sex.set("Both sexes" if "Both sexes" in self.rank_cube.sexes
+                     else self.rank_cube.sexes[-1])
+        self.indicator_name = tk.StringVar()
+        self.indicator_name.set(indicator.name)
+        # column of the analytics the table is sorted by
+        self.sort_column = 'value'
 
         # calculate number of countries in dataset
-        self.num_country = len(set(self.life_exp_data.Country))
+        self.num_country = len(self.rank_cube.countries)
+
+        # find countries by name, code or alias without going through the table
+        self.search_index = SearchIndex(self.rank_cube.countries, self.rank_cube.codes)
+
+        # heavy work for the detail windows is done in worker threads
+        self.task_runner = TaskRunner(self)
+        # every detail and comparison window takes its figures from this pool
+        self.figure_pool = FigurePool()
+
+        # quick changes of year or sort option only update the table once
+        self.scheduler = EventCoalescer(self)
+        self.update_table_later = self.scheduler.register('table', self.update_table)
 
         self.create_widgets()
+        # matplotlib is only needed for the detail windows, load it once the page is idle
+        self.after(PREWARM_DELAY, self.prewarm_detail)
 
     def create_widgets(self):
         """Create all components in the page."""
@@ -47,24 +113,36 @@ class RankingPage(ttk.Frame):
                                  command=lambda: showinfo(
                                     title="Tips",
                                     message="Double click in the table to see "
-                                            "details of each country"
+                                            "details of each country.\n"
+                                            "Select several countries with Ctrl+click "
+                                            "and press Compare to see them together.\n"
+                                            "Click a heading to sort the table by it, "
+                                            "click it again to reverse the order."
                                  )
                                  )
 
         # Create frame for selecting year
         frame_year = ttk.LabelFrame(self)
         label_select_year = ttk.Label(frame_year, text="Select year:")
-        cb_year = ttk.Combobox(frame_year, state="readonly", textvariable=self.year)
-        cb_year.bind('<<ComboboxSelected>>', self.update_table)
-        all_year = list(set(self.life_exp_data.Year))
-        all_year.sort()
-        cb_year['values'] = all_year
+        self.cb_year = ttk.Combobox(frame_year, state="readonly", textvariable=self.year)
+        self.cb_year.bind('<<ComboboxSelected>>', self.update_table_later)
+        self.cb_year['values'] = list(self.rank_cube.years)
+        label_select_sex = ttk.Label(frame_year, text="Sex:")
+        self.cb_sex = ttk.Combobox(frame_year, state="readonly", textvariable=self.sex)
+        self.cb_sex.bind('<<ComboboxSelected>>', self.update_table_later)
+        self.cb_sex['values'] = self.rank_cube.sexes
+        label_select_indicator = ttk.Label(frame_year, text="Indicator:")
+        cb_indicator = ttk.Combobox(frame_year, state="readonly", width=28,
+                                    textvariable=self.indicator_name)
+        cb_indicator.bind('<<ComboboxSelected>>', self.select_indicator)
+        cb_indicator['values'] = [indicator.name for indicator in self.engine.indicators] \
+            if self.engine is not None else [self.indicator.name]
 
         # title of the table
         self.title_style = ttk.Style(self)
         self.title_style.configure("Title.TLabel", font=('Helvetica', 16))
-        self.label_table_title = ttk.Label(self, text=f"Life expectancy rank of "
-                                                      f"{len(set(self.life_exp_data.Country))} "
+        count = self.rank_cube.count(self.year.get(), self.sex.get())
+        self.label_table_title = ttk.Label(self, text=f"{self.indicator.name} rank of {count} "
                                                       f"countries in {self.year.get()}",
                                            style="Title.TLabel")
 
@@ -72,26 +150,28 @@ class RankingPage(ttk.Frame):
         frame_sort = ttk.LabelFrame(self, text="Sort Options")
         radio_high_low = ttk.Radiobutton(frame_sort, text="Highest to Lowest",
                                          value=False, variable=self.ascending,
-                                         command=self.update_table)
+                                         command=self.update_table_later)
         radio_low_high = ttk.Radiobutton(frame_sort, text="Lowest to Highest",
                                          value=True, variable=self.ascending,
-                                         command=self.update_table)
+                                         command=self.update_table_later)
 
-        # process data
-        rank = self.life_exp_data[(self.life_exp_data.Year == self.year.get()) &
-                                  (self.life_exp_data.Sex == "Both sexes")]
-        rank = rank.sort_values(by="Value", ascending=self.ascending.get())
-        rank['Rank'] = np.arange(1, self.num_country + 1)
-
-        # Create treeview showing rand of each countries
-        data_in_table = zip(rank.Rank, rank.Country, rank.Value.map('{:,.2f}'.format))
-        columns = ('rank', 'country', 'life_exp')
-        self.table = ttk.Treeview(self, columns=columns, show='headings')
-        self.table.heading('rank', text='Rank#')
-        self.table.heading('country', text='Country')
-        self.table.heading('life_exp', text='Average Life expectancy (years) (Both sexes)')
-        for data in data_in_table:
-            self.table.insert('', tk.END, values=data)
+        # Create treeview showing rank of each countries and how it moved
+        self.headings = self.indicator_headings()
+        self.table = ttk.Treeview(self, columns=tuple(self.headings), show='headings')
+        for column, text in self.headings.items():
+            if column in SORT_KEYS:
+                self.table.heading(column, text=text,
+                                   command=lambda column=column: self.sort_by(column))
+            else:
+                self.table.heading(column, text=text)
+        for column in ('change', 'change_n', 'delta', 'gap', 'percentile'):
+            self.table.column(column, width=130, anchor=tk.E)
+        # values of every item in the table by its iid, the alpha-3 code of the country
+        self.row_values = {}
+        # iids in the order they are shown and the (year, sex, column, ascending) they show
+        self.row_order = []
+        self.shown = None
+        self.update_table()
         self.table.bind('<Double-1>', self.show_detail)
         self.table.grid(row=3, column=0, columnspan=3, sticky='nsew', padx=2)
         self.table.rowconfigure(1, weight=1)
@@ -104,20 +184,23 @@ class RankingPage(ttk.Frame):
         # create frame for searching countries widgets
         frame_search = ttk.LabelFrame(self)
         label_country = ttk.Label(frame_search, text="Search Country: ")
-        country_list = list(set(self.life_exp_data.Country))
-        country_list.sort()
-        self.cb_country = AutocompleteCombobox(frame_search, textvariable=self.user_input,
-                                               completevalues=country_list)
+        self.cb_country = SearchCombobox(frame_search, search_index=self.search_index,
+                                         textvariable=self.user_input)
         button_search = ttk.Button(frame_search, text="Search", command=self.alert)
         self.label_alert = ttk.Label(self)
 
-        # Create quit button
+        # Create compare and quit buttons
+        button_compare = ttk.Button(self, text="Compare selected", command=self.show_comparison)
         button_quit = ttk.Button(self, text="Quit", command=self.root.destroy)
 
         # grid all components
         frame_year.grid(row=0, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         label_select_year.grid(row=0, column=0, padx=5, pady=5)
-        cb_year.grid(row=0, column=1, sticky='ew', padx=5, pady=5)
+        self.cb_year.grid(row=0, column=1, sticky='ew', padx=5, pady=5)
+        label_select_sex.grid(row=0, column=2, padx=5, pady=5)
+        self.cb_sex.grid(row=0, column=3, sticky='ew', padx=5, pady=5)
+        label_select_indicator.grid(row=0, column=4, padx=5, pady=5)
+        cb_indicator.grid(row=0, column=5, sticky='ew', padx=5, pady=5)
         help_button.grid(row=0, column=2, sticky="E", padx=5, pady=5)
         self.label_table_title.grid(row=1, column=0, columnspan=3, padx=5, pady=5)
 
@@ -133,6 +216,7 @@ class RankingPage(ttk.Frame):
         button_search.grid(row=0, column=2, padx=5, pady=5)
         self.label_alert.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky="W")
 
+        button_compare.grid(row=6, column=0, padx=10, pady=10, sticky="W")
         button_quit.grid(row=6, column=2, padx=10, pady=10, sticky="E")
 
         # configure each row and column
@@ -142,62 +226,205 @@ class RankingPage(ttk.Frame):
         for i in range(columns):
             self.columnconfigure(i, weight=1)
 
+    def indicator_headings(self):
+        """Return the text of the heading of each column for the shown indicator."""
+        return {'rank': 'Rank#', 'country': 'Country',
+                'life_exp': self.indicator.label,
+                'change': 'Rank change (1 year)',
+                'change_n': f'Rank change ({self.analytics.lookback} years)',
+                'delta': f'Change ({self.indicator.unit})',
+                'gap': f'Gender gap F-M ({self.indicator.unit})',
+                'percentile': 'Percentile'}
+
+    def select_indicator(self, event=None):
+        """Load the selected indicator in a worker thread and show it when it is ready."""
+        indicator = by_name(self.indicator_name.get())
+        if indicator is None or self.engine is None or indicator.code == self.indicator.code:
+            return
+        if self.indicator_task is not None:
+            self.indicator_task.cancel()
+        if not self.engine.is_loaded(indicator.code):
+            self.label_alert.config(text=f"Loading {indicator.name}...")
+        self.indicator_task = self.task_runner.submit(self.engine.get, indicator.code,
+                                                      on_done=self.show_indicator,
+                                                      on_error=self.show_indicator_error)
+
+    def show_indicator(self, indicator_data):
+        """Show the ranking of a loaded indicator in the table, keeping the selected
+        year and sex when the indicator has them."""
+        self.indicator_task = None
+        self.indicator = indicator_data.indicator
+        self.life_exp_data = indicator_data.data
+        self.rank_cube = indicator_data.rank_cube
+        self.series_store = indicator_data.series_store
+        self.analytics = indicator_data.analytics
+        self.num_country = len(self.rank_cube.countries)
+        self.search_index = SearchIndex(self.rank_cube.countries, self.rank_cube.codes)
+        self.cb_country.search_index = self.search_index
+        self.cb_country.set_completion_list(list(self.search_index.names))
+        self.cb_year['values'] = list(self.rank_cube.years)
+        if self.year.get() not in self.rank_cube.years:
+            self.year.set(self.rank_cube.years[-1])
+        self.cb_sex['values'] = self.rank_cube.sexes
+        if self.sex.get() not in self.rank_cube.sexes:
+            self.sex.set(self.rank_cube.sexes[-1])
+        self.headings = self.indicator_headings()
+        self.label_alert.config(text="")
+        self.shown = None
+        self.update_table()
+        self.show_sort_heading()
+
+    def show_indicator_error(self, error):
+        """Tell the user the indicator couldn't be loaded and select the shown one again."""
+        self.indicator_task = None
+        self.indicator_name.set(self.indicator.name)
+        self.label_alert.config(text=f"Loading the indicator failed: {error}")
+
     def alert(self):
         """In form user that the their searched country is highlighted
         or not found their country.
         """
-        found = False
-        for iid in self.table.get_children():
-            if self.table.item(iid)['values'][1].lower() == self.user_input.get().lower().strip():
-                self.table.focus(iid)
-                self.table.selection_set(iid)
-                found = True
-        if found:
+        iid = self.search_index.lookup(self.user_input.get())
+        if iid is not None and iid in self.row_set:
+            self.table.focus(iid)
+            self.table.selection_set(iid)
+            self.table.see(iid)
             self.label_alert.config(text="Your selected country is highlighted. "
                                          "If not seen, scroll up or down.")
+        elif iid is not None:
+            self.label_alert.config(text=f"There is no data of the country "
+                                         f"in {self.year.get()}.")
+        elif not self.user_input.get().strip():
+            self.label_alert.config(text="Please fill in the country name "
+                                         "that you want to find.")
         else:
-            if not self.user_input.get():
-                self.label_alert.config(text="Please fill in the country name "
-                                             "that you want to find.")
+            suggestions = self.search_index.fuzzy(self.user_input.get())
+            if suggestions:
+                self.label_alert.config(text=f"Country Not found. Did you mean "
+                                             f"{' or '.join(suggestions)}?")
             else:
                 self.label_alert.config(text="Country Not found. Please try again "
                                              "or choose from the country list "
                                              "provided in the combobox.")
 
+    @instrumentation.timed('update_table', 'ranking')
     def update_table(self, event=None):
-        """When users select other year or new sort option, update the table
-        according to the life exp data."""
+        """When users select other year, sex or sort option, update the table
+        according to the life exp data.
+
+        The order comes from the columns sorted when the data was loaded. The items are
+        kept between updates, only the values that changed are set again and the items
+        are put in the new order with a single call.
+        """
+        year = self.year.get()
+        sex = self.sex.get()
+        ascending = self.ascending.get()
         # update the title
-        self.label_table_title.config(text=f"Life expectancy rank of {self.num_country} "
-                                           f"countries in {self.year.get()}")
+        self.label_table_title.config(text=f"{self.indicator.name} rank of "
+                                           f"{self.rank_cube.count(year, sex)} "
+                                           f"countries in {year} ({sex})")
+        shown = (year, sex, self.sort_column, ascending)
+        if self.shown == shown:
+            return
+
         # process data
-        rank = self.life_exp_data[(self.life_exp_data.Year == self.year.get()) &
-                                  (self.life_exp_data.Sex == "Both sexes")]
-        rank = rank.sort_values(by="Value", ascending=self.ascending.get())
-        if not self.ascending.get():
-            rank['Rank'] = np.arange(1, self.num_country+1)
+        ranked = self.analytics.ranking(self.sort_column, year, sex, ascending)
+        columns = self.analytics.rows(ranked, year, sex)
+        y, s = self.rank_cube.position(year, sex)
+        iids = self.rank_cube.codes[ranked]
+        digits = self.indicator.digits
+        rows = zip(self.rank_cube.rank[ranked, y, s].tolist(), self.rank_cube.countries[ranked],
+                   map(f'{{:,.{digits}f}}'.format, columns['value']),
+                   map(format_change, columns['change']),
+                   map(format_change, columns['change_n']),
+                   [format_number(value, signed=True, digits=digits)
+                    for value in columns['delta']],
+                   [format_number(value, digits=digits) for value in columns['gap']],
+                   [format_number(value, digits=1) for value in columns['percentile']])
+        for iid, data in zip(iids, rows):
+            if self.row_values.get(iid) == data:
+                continue
+            if iid in self.row_values:
+                self.table.item(iid, values=data)
+            else:
+                self.table.insert('', tk.END, iid=iid, values=data)
+            self.row_values[iid] = data
+        # reorder the items, the countries without data in this year are detached
+        self.row_order = list(iids)
+        self.row_set = set(self.row_order)
+        self.table.set_children('', *self.row_order)
+        if self.shown is None or self.shown[2:] != shown[2:]:
+            self.show_sort_heading()
+        self.shown = shown
+
+    def sort_by(self, column):
+        """Sort the table by the column of the clicked heading,
+        clicking it again reverses the order."""
+        if SORT_KEYS[column] == self.sort_column:
+            self.ascending.set(not self.ascending.get())
         else:
-            rank['Rank'] = np.arange(self.num_country, 0, -1)
+            self.sort_column = SORT_KEYS[column]
+            self.ascending.set(False)
+        self.update_table_later()
 
-        # update treeview
-        data_in_table = zip(rank.Rank, rank.Country, rank.Value.map('{:,.2f}'.format))
+    def show_sort_heading(self):
+        """Mark the heading of the column the table is sorted by with an arrow."""
+        arrow = ' \u25b2' if self.ascending.get() else ' \u25bc'
+        for column, text in self.headings.items():
+            if column != 'rank' and SORT_KEYS.get(column) == self.sort_column:
+                text += arrow
+            self.table.heading(column, text=text)
 
-        # delete all existing items
-        for item in self.table.get_children():
-            self.table.delete(item)
+    def prewarm_detail(self):
+        """Import matplotlib in a worker thread, then the detail module
+        in the main thread, so the first detail window opens quickly."""
+        self.task_runner.submit(importlib.import_module, 'matplotlib.figure',
+                                on_done=lambda module: self.detail_plot_class())
 
-        # insert all new items
-        for data in data_in_table:
-            self.table.insert('', tk.END, values=data)
+    @staticmethod
+    def detail_plot_class():
+        """Return the DetailPlot class, importing its module the first time."""
+        return importlib.import_module('detail').DetailPlot
 
     def show_detail(self, event):
         """When user click at a country in treeview, this method is called.
         It create new toplevel window showing details of that country."""
         for item_selected in self.table.selection():
+            # each detail window shows two figures
+            if not self.figure_pool.can_acquire(2):
+                self.show_too_many_windows()
+                return
             item = self.table.item(item_selected)
             country_name = item['values'][1]
             top = tk.Toplevel(master=self.root)
             top.title(country_name)
             top.geometry('1000x500')
-            detail_frame = DetailPlot(top, self.life_exp_data, country_name, self.year.get())
+            detail_plot = self.detail_plot_class()
+            detail_frame = detail_plot(top, self.life_exp_data, country_name, self.year.get(),
+                                       self.rank_cube, self.series_store, self.task_runner,
+                                       self.figure_pool, self.indicator)
             detail_frame.grid(row=0, column=0, sticky=tk.NSEW)
+
+    def show_comparison(self):
+        """Create a toplevel window comparing all the selected countries in one figure."""
+        countries = [self.table.item(iid)['values'][1] for iid in self.table.selection()]
+        if len(countries) < 2:
+            showinfo(title="Compare", message="Select at least two countries in the table "
+                                              "with Ctrl+click to compare them.")
+            return
+        if not self.figure_pool.can_acquire():
+            self.show_too_many_windows()
+            return
+        top = tk.Toplevel(master=self.root)
+        top.title("Compare " + ", ".join(countries))
+        top.geometry('1300x550')
+        comparison_plot = importlib.import_module('comparison').ComparisonPlot
+        comparison_frame = comparison_plot(top, self.rank_cube, countries, self.year.get(),
+                                           self.figure_pool, self.indicator, self.sex.get())
+        comparison_frame.grid(row=0, column=0, sticky=tk.NSEW)
+
+    def show_too_many_windows(self):
+        """Tell the user to close some windows before opening a new one."""
+        showinfo(title="Too many windows",
+                 message=f"At most {self.figure_pool.max_live} figures can be shown at the "
+                         f"same time. Please close some windows first.")
@@ -0,0 +1,88 @@
+"""This module contains EventCoalescer class."""
+import time
+import instrumentation
+
+# Milliseconds to wait for more events before a debounced handler runs.
+DEBOUNCE_DELAY = 50
+# Minimum milliseconds between two runs of a throttled handler, about 30 runs a second.
+THROTTLE_DELAY = 33
+
+
+class EventCoalescer:
+    """This class turns bursts of ui events into a single call of their handler
+    using the after() method of a widget.
+
+    Only the arguments of the latest event are used, work that has been superseded
+    by a newer event is cancelled before it runs. A handler is either debounced,
+    run once the events stop for its delay, or throttled, run at most once per delay
+    while the events keep coming.
+    """
+    def __init__(self, widget):
+        self.widget = widget
+        self._handlers = {}
+        self._pending = {}
+        self._args = {}
+        self._last_run = {}
+        # time of the first event of each burst, for measuring the latency of the handlers
+        self._first_event = {}
+        # pending work must not run after the widget is destroyed
+        widget.bind('<Destroy>', self._on_destroy, add='+')
+
+    def register(self, name, callback, delay=DEBOUNCE_DELAY, mode='debounce'):
+        """Register a handler and return a function that can be used as
+        a widget command or event binding in place of the callback."""
+        if mode not in ('debounce', 'throttle'):
+            raise ValueError(f"Unknown mode {mode}, use 'debounce' or 'throttle'.")
+        self._handlers[name] = (callback, delay, mode)
+        self._last_run[name] = 0.0
+
+        def handler(*args):
+            self.submit(name, *args)
+        return handler
+
+    def submit(self, name, *args):
+        """Record a new event for the handler and schedule it."""
+        _, delay, mode = self._handlers[name]
+        self._args[name] = args
+        if instrumentation.is_enabled():
+            self._first_event.setdefault(name, time.perf_counter_ns())
+        if mode == 'debounce':
+            self.cancel(name)
+            self._pending[name] = self.widget.after(delay, self._run, name)
+        elif name not in self._pending:
+            elapsed = (time.perf_counter() - self._last_run[name]) * 1000
+            wait = max(0, int(delay - elapsed))
+            self._pending[name] = self.widget.after(wait, self._run, name)
+
+    def cancel(self, name):
+        """Cancel the pending call of the handler if there is one."""
+        after_id = self._pending.pop(name, None)
+        if after_id is not None:
+            self.widget.after_cancel(after_id)
+
+    def cancel_all(self):
+        """Cancel every pending call."""
+        for name in list(self._pending):
+            self.cancel(name)
+
+    def flush(self, name):
+        """Run the pending call of the handler now."""
+        if name in self._pending:
+            self.cancel(name)
+            self._run(name)
+
+    def _run(self, name):
+        """Call the handler with the arguments of its latest event."""
+        self._pending.pop(name, None)
+        self._last_run[name] = time.perf_counter()
+        callback = self._handlers[name][0]
+        callback(*self._args.pop(name, ()))
+        first_event = self._first_event.pop(name, None)
+        if first_event is not None:
+            # idle callbacks run after the redraws the handler scheduled
+            self.widget.after_idle(lambda: instrumentation.record(
+                f"event {name}", 'event', first_event, time.perf_counter_ns()))
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            self.cancel_all()
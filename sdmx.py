@@ -0,0 +1,57 @@
+"""This module contains functions for building the SDMX queries of the indicators
+and merging the observations of incremental queries.
+
+A query asks the server for the countries it lists only, instead of every area,
+and can be limited to a range of periods (startPeriod/endPeriod) or to the
+observations changed after a time (updatedAfter).
+"""
+import os
+import time
+from urllib.parse import urlencode
+import pandas as pd
+from indicators import LIFE_EXPECTANCY
+
+# The SDMX REST api of UNICEF, can be changed to use a local stand-in server.
+SDMX_BASE = os.environ.get('LIFE_EXP_SDMX_BASE',
+                           "https://sdmx.data.unicef.org/ws/public/sdmxapi/rest")
+# Columns that identify an observation, a newer observation replaces an older one.
+OBSERVATION_KEY = ["REF_AREA", "Sex", "TIME_PERIOD"]
+# Seconds subtracted from the time of the last check, so clock differences between
+# the server and this machine can't make an update get lost.
+UPDATE_OVERLAP = 24 * 60 * 60
+
+
+def data_url(countries=None, start_period=None, end_period=None, updated_after=None,
+             base=None, indicator=LIFE_EXPECTANCY):
+    """Return the url of the csv of the indicator of the countries, all areas if
+    countries is None. updated_after is a time in seconds since the epoch."""
+    area = '+'.join(sorted(set(countries))) if countries is not None else ''
+    params = {'format': 'csv', 'labels': 'both'}
+    if start_period is not None:
+        params['startPeriod'] = start_period
+    if end_period is not None:
+        params['endPeriod'] = end_period
+    if updated_after is not None:
+        params['updatedAfter'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(updated_after))
+    return f"{base or SDMX_BASE}/data/{indicator.dataflow}/{area}.{indicator.code}" \
+           f"{indicator.key_tail}?{urlencode(params, safe=',:')}"
+
+
+def merge_observations(held, changes, columns):
+    """Return the held observations with the changed ones added or replacing
+    the held observations of the same area, sex and period.
+
+    columns maps the names of the columns to their dtypes, as in read_csv.
+    """
+    if changes.empty:
+        return held
+    merged = pd.concat([held.astype(str_columns(columns)), changes.astype(str_columns(columns))],
+                       ignore_index=True)
+    merged = merged.drop_duplicates(subset=OBSERVATION_KEY, keep='last')
+    return merged.astype(columns).reset_index(drop=True)
+
+
+def str_columns(columns):
+    """Return the dtypes with the categories as strings, so frames with different
+    categories can be joined."""
+    return {name: (str if kind == "category" else kind) for name, kind in columns.items()}
@@ -0,0 +1,29 @@
+"""This module contains SearchCombobox class."""
+import tkinter as tk
+from ttkwidgets.autocomplete import AutocompleteCombobox
+
+
+class SearchCombobox(AutocompleteCombobox):
+    """An AutocompleteCombobox whose suggestions come from a SearchIndex,
+    so typing doesn't compare the text with every country name."""
+    def __init__(self, master=None, search_index=None, **kwargs):
+        self.search_index = search_index
+        super().__init__(master, completevalues=list(search_index.names), **kwargs)
+
+    def autocomplete(self, delta=0):
+        """Complete the typed text with the names starting with it,
+        delta of 1 or -1 cycles through them."""
+        if delta:  # need to delete selection otherwise we would fix the current position
+            self.delete(self.position, tk.END)
+        else:  # set position to end so selection starts where textentry ended
+            self.position = len(self.get())
+        hits = self.search_index.suggest(self.get())
+        # if we have a new hit list, keep this in mind
+        if hits != self._hits:
+            self._hit_index = 0
+            self._hits = hits
+        if self._hits:
+            self._hit_index = (self._hit_index + delta) % len(self._hits)
+            self.delete(0, tk.END)
+            self.insert(0, self._hits[self._hit_index])
+            self.select_range(self.position, tk.END)
@@ -0,0 +1,101 @@
+"""This module contains SearchIndex class."""
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+# Other names people use for some countries, mapped to their alpha-3 code.
+ALIASES = {
+    "usa": "USA", "us": "USA", "america": "USA", "united states of america": "USA",
+    "uk": "GBR", "britain": "GBR", "great britain": "GBR", "england": "GBR",
+    "russia": "RUS", "south korea": "KOR", "korea": "KOR", "north korea": "PRK",
+    "iran": "IRN", "vietnam": "VNM", "viet nam": "VNM", "syria": "SYR", "laos": "LAO",
+    "bolivia": "BOL", "venezuela": "VEN", "tanzania": "TZA", "moldova": "MDA",
+    "czech republic": "CZE", "czechia": "CZE", "ivory coast": "CIV", "turkey": "TUR",
+    "holland": "NLD", "burma": "MMR", "swaziland": "SWZ", "cape verde": "CPV",
+    "macedonia": "MKD", "micronesia": "FSM", "palestine": "PSE", "drc": "COD",
+    "congo kinshasa": "COD", "congo brazzaville": "COG", "east timor": "TLS",
+}
+# Minimum similarity of a name to be suggested for a misspelled query.
+FUZZY_THRESHOLD = 0.3
+# Names sharing the most pieces with a misspelled query that are scored, the others
+# share too few to be among the most similar.
+FUZZY_CANDIDATES = 50
+
+
+def normalize(text):
+    """Return the text in lower case without accents, punctuation or repeated spaces."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(cha for cha in text if not unicodedata.combining(cha))
+    text = "".join(cha if cha.isalnum() else " " for cha in text.lower())
+    return " ".join(text.split())
+
+
+def trigrams(text):
+    """Return the set of three letter pieces of the normalized text."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """This class finds countries by name, alpha-3 code or alias without going
+    through the table.
+
+    Exact matches are a dictionary lookup, completions use a sorted list of names and
+    misspelled names are matched by the three letter pieces they share with the query.
+    """
+    def __init__(self, names, codes, aliases=None):
+        self.names = [str(name) for name in names]
+        self.codes = list(codes)
+        aliases = ALIASES if aliases is None else aliases
+        # normalized name, code or alias -> position of the country
+        self._exact = {}
+        for i, (name, code) in enumerate(zip(self.names, self.codes)):
+            self._exact[normalize(name)] = i
+            if code:
+                self._exact.setdefault(normalize(code), i)
+        position_of_code = {code: i for i, code in enumerate(self.codes)}
+        for alias, code in aliases.items():
+            if code in position_of_code:
+                self._exact.setdefault(normalize(alias), position_of_code[code])
+        # normalized names in order, for finding every name starting with a prefix
+        self._sorted = sorted((normalize(name), i) for i, name in enumerate(self.names))
+        self._sorted_keys = [key for key, _ in self._sorted]
+        # three letter piece -> positions of the countries whose name has it
+        self._trigrams = defaultdict(list)
+        self._trigram_count = []
+        for i, name in enumerate(self.names):
+            pieces = trigrams(normalize(name))
+            self._trigram_count.append(len(pieces))
+            for piece in pieces:
+                self._trigrams[piece].append(i)
+
+    def lookup(self, query):
+        """Return the code of the country matching the query exactly or None."""
+        position = self._exact.get(normalize(query))
+        return None if position is None else self.codes[position]
+
+    def suggest(self, prefix, limit=None):
+        """Return the names that start with the prefix in alphabetical order."""
+        key = normalize(prefix)
+        start = bisect_left(self._sorted_keys, key)
+        end = start
+        while end < len(self._sorted_keys) and self._sorted_keys[end].startswith(key):
+            end += 1
+            if limit is not None and end - start >= limit:
+                break
+        return [self.names[i] for _, i in self._sorted[start:end]]
+
+    def fuzzy(self, query, limit=3):
+        """Return the names most similar to a misspelled query, the most similar first."""
+        pieces = trigrams(normalize(query))
+        shared = Counter()
+        for piece in pieces:
+            shared.update(self._trigrams.get(piece, ()))
+        scores = []
+        for i, count in shared.most_common(FUZZY_CANDIDATES):
+            # Dice coefficient of the two sets of pieces
+            score = 2 * count / (len(pieces) + self._trigram_count[i])
+            if score >= FUZZY_THRESHOLD:
+                scores.append((score, self.names[i]))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in scores[:limit]]
@@ -0,0 +1,47 @@
+"""This module contains SeriesStore class."""
+from collections import OrderedDict
+from threading import Lock
+
+# Number of country pivot tables kept in memory at the same time.
+SERIES_CACHE_SIZE = 32
+
+
+class SeriesStore:
+    """This class gives the year × sex table of each country to every detail window.
+
+    A table is built at most once while it stays in the cache, only the
+    SERIES_CACHE_SIZE most recently used tables are kept so the memory stays flat.
+    The statistics of the whole dataset are computed once when the store is made.
+    """
+    def __init__(self, life_exp_data, max_size=SERIES_CACHE_SIZE):
+        self.life_exp_data = life_exp_data
+        self.max_size = max_size
+        self._series = OrderedDict()
+        self._lock = Lock()
+
+        # Store info used in plot
+        self.latest_year = int(life_exp_data.Year.max())
+        self.earliest_year = int(life_exp_data.Year.min())
+        self.min_value = float(life_exp_data.Value.min())
+        self.max_value = float(life_exp_data.Value.max())
+        self.countries = sorted(set(life_exp_data.Country))
+        self.num_country = len(self.countries)
+        # row positions of each country, so a country is sliced without a full scan
+        self._rows = life_exp_data.groupby("Country", observed=True, sort=False).indices
+
+    def series(self, country):
+        """Return the table of the country with a row for each year and a column for each sex."""
+        with self._lock:
+            if country in self._series:
+                self._series.move_to_end(country)
+                return self._series[country]
+        one_country = self.life_exp_data.iloc[self._rows[country]]
+        # pivot table so it can be graphed easily
+        table = one_country.pivot_table(columns="Sex", values="Value", index="Year",
+                                        observed=True)
+        with self._lock:
+            self._series[country] = table
+            self._series.move_to_end(country)
+            while len(self._series) > self.max_size:
+                self._series.popitem(last=False)
+        return table
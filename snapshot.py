@@ -0,0 +1,81 @@
+"""This module contains functions for saving the cleaned life exp data as a snapshot
+that later launches can map into memory instead of downloading and parsing again."""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Change it whenever the cleaning changes, so snapshots of the old data are not used.
+SNAPSHOT_VERSION = 1
+# Columns stored as an array of numbers.
+NUMERIC_COLUMNS = ("Year", "Value")
+# Columns stored as an array of codes and a list of categories.
+CATEGORY_COLUMNS = ("REF_AREA", "Country", "Sex")
+
+
+def source_key(cache, urls):
+    """Return a key made from the cached bodies of the urls, or None if one of them
+    isn't cached or has to be revalidated with the server first."""
+    digest = hashlib.sha256(f"version {SNAPSHOT_VERSION}".encode('utf-8'))
+    for url in urls:
+        entry = cache.get(url)
+        if entry is None or not (cache.offline or cache.is_fresh(entry)):
+            return None
+        # bodies cached before the hash was stored are identified by their validators
+        fingerprint = entry.meta.get('sha256') or json.dumps(
+            [entry.meta.get('etag'), entry.meta.get('last_modified'), entry.meta.get('size')])
+        digest.update(f"{url} {fingerprint}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def save_snapshot(life_exp_data, key, directory):
+    """Save the cleaned data in the directory with the key of its sources.
+
+    Each column is a .npy file, the categories and the key are in meta.json.
+    """
+    tmp_directory = directory + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    meta = {'version': SNAPSHOT_VERSION, 'key': key, 'rows': len(life_exp_data),
+            'categories': {}}
+    for column in NUMERIC_COLUMNS:
+        np.save(os.path.join(tmp_directory, f"{column}.npy"),
+                life_exp_data[column].to_numpy())
+    for column in CATEGORY_COLUMNS:
+        values = pd.Categorical(life_exp_data[column])
+        np.save(os.path.join(tmp_directory, f"{column}.npy"), values.codes)
+        meta['categories'][column] = [str(name) for name in values.categories]
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+
+
+def load_snapshot(key, directory):
+    """Return the data saved in the directory if it was made from the same sources,
+    otherwise None. The arrays are memory-mapped, so they are only read when used."""
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != SNAPSHOT_VERSION or meta.get('key') != key:
+        return None
+    columns = {}
+    try:
+        for column in CATEGORY_COLUMNS:
+            codes = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+            columns[column] = pd.Categorical.from_codes(
+                codes, categories=meta['categories'][column], validate=False)
+        for column in NUMERIC_COLUMNS:
+            columns[column] = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if any(len(values) != meta['rows'] for values in columns.values()):
+        return None
+    # the cache removes the snapshots that weren't used for the longest time first
+    os.utime(os.path.join(directory, 'meta.json'))
+    return pd.DataFrame(columns, columns=["REF_AREA", "Country", "Sex", "Year", "Value"],
+                        copy=False)
@@ -0,0 +1,316 @@
+"""A local stand-in for the SDMX server and the country codes gist, serving recorded
+responses, so the download code can be tried and measured without the network.
+
+Run it with python stub_server.py [DIRECTORY] [--port 8000]. The directory holds the
+recorded responses (benchmarks/fixtures by default):
+
+    life_expectancy.csv       the csv of every area, as the SDMX server sends it
+    country_codes.csv         the csv of the gist
+    updates/<time>.csv        observations updated at that time, e.g.
+                              updates/2024-05-01T00:00:00.csv, newer ones win
+    <CODE>.csv                the csv of another indicator, e.g. CME_MRY0T4.csv
+
+Data queries are answered like the SDMX server does: only the areas in the key and
+the periods between startPeriod and endPeriod are sent, with updatedAfter only the
+observations updated after that time, and 404 when nothing matches. Start the app
+with the environment variables the server prints to use it.
+
+Bodies are sent gzip compressed to clients that accept it and parts of them are sent
+for Range requests. To try how the downloads cope with a bad network, --latency
+delays every response, --fail-every N answers every Nth request with 503 and
+--cut-every N breaks the connection halfway through every Nth body.
+"""
+import argparse
+import calendar
+import csv
+import gzip
+import hashlib
+import http.server
+import io
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+from indicators import LIFE_EXPECTANCY
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'benchmarks', 'fixtures')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def parse_time(text):
+    """Return the seconds since the epoch of an SDMX time like 2024-05-01T00:00:00."""
+    return calendar.timegm(time.strptime(text[:19], TIME_FORMAT))
+
+
+class Recording:
+    """The recorded csv of one indicator and the directory of its updates. The csv is
+    read again for each new query and the answers are kept, the updates are small and
+    kept in memory."""
+    def __init__(self, path, updates=None):
+        self.path = path
+        self.recorded_at = os.path.getmtime(self.path)
+        with open(self.path, newline='', encoding='utf-8') as csv_file:
+            self.header = next(csv.reader(csv_file))
+        self.area = self.header.index('REF_AREA')
+        self.sex = self.header.index('SEX')
+        self.period = self.header.index('TIME_PERIOD')
+        self.updates = []
+        if updates is not None and os.path.isdir(updates):
+            for name in sorted(os.listdir(updates)):
+                with open(os.path.join(updates, name), newline='', encoding='utf-8') as csv_file:
+                    reader = csv.reader(csv_file)
+                    next(reader)
+                    updated = parse_time(os.path.splitext(name)[0])
+                    self.updates.extend((updated, row) for row in reader)
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    def rows(self):
+        """Yield (time updated, row) of the recorded observations and then the updates."""
+        with open(self.path, newline='', encoding='utf-8') as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            for row in reader:
+                yield self.recorded_at, row
+        yield from self.updates
+
+    def query(self, areas=None, start_period=None, end_period=None, updated_after=None):
+        """Return the csv of the matching observations as bytes, or None if there are none.
+        A later update of an observation replaces the earlier one."""
+        key = (frozenset(areas or ()), start_period, end_period, updated_after)
+        with self._lock:
+            if key not in self._answers:
+                self._answers[key] = self._query(areas, start_period, end_period,
+                                                 updated_after)
+            return self._answers[key]
+
+    def _query(self, areas, start_period, end_period, updated_after):
+        if not (areas or start_period or end_period or updated_after or self.updates):
+            with open(self.path, 'rb') as csv_file:
+                return csv_file.read()
+        latest = {}
+        for updated, row in self.rows():
+            if areas and row[self.area] not in areas:
+                continue
+            period = int(row[self.period])
+            if start_period is not None and period < start_period:
+                continue
+            if end_period is not None and period > end_period:
+                continue
+            latest[row[self.area], row[self.sex], period] = updated, row
+        rows = [row for updated, row in latest.values()
+                if updated_after is None or updated > updated_after]
+        if not rows:
+            return None
+        body = io.StringIO()
+        writer = csv.writer(body, lineterminator='\n')
+        writer.writerow(self.header)
+        writer.writerows(rows)
+        return body.getvalue().encode('utf-8')
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the data queries and the country codes requests from the recording."""
+    # the connections are kept open between requests like by the real servers
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, they mustn't wait for an ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+        number = self.server.count_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.fail_every and number % self.server.fail_every == 0:
+            self.send_status(503, b'Service Unavailable')
+        elif url.path.endswith('country_codes.csv'):
+            self.send_body(self.server.country_codes, number)
+        elif '/data/' in url.path:
+            key = url.path.rsplit('/', 1)[-1].split('.')
+            recording = self.server.recordings.get(key[1] if len(key) > 1 else None)
+            if recording is None:
+                self.send_status(404, b'NoResultsFound')
+                return
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            areas = set(filter(None, key[0].split('+')))
+            body = recording.query(
+                areas,
+                int(params['startPeriod'][:4]) if 'startPeriod' in params else None,
+                int(params['endPeriod'][:4]) if 'endPeriod' in params else None,
+                parse_time(params['updatedAfter']) if 'updatedAfter' in params else None)
+            if body is None:
+                self.send_status(404, b'NoResultsFound')
+            else:
+                self.send_body(body, number)
+        else:
+            self.send_status(404, b'Not found')
+
+    def send_body(self, body, number):
+        """Send the body, compressed if the client accepts gzip, or 304 if the client
+        has the same one, or the part of it asked for by a Range header."""
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        encoding = None
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = self.server.compressed(etag, body)
+            # the compressed body is another representation with its own validator
+            etag, encoding = etag + '-gzip', 'gzip'
+        etag = f'"{etag}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.server.record(self.path, 304, 0)
+            self.end_headers()
+            return
+        status, start = 200, 0
+        requested = self.headers.get('Range', '')
+        if requested.startswith('bytes=') and requested.endswith('-') \
+                and self.headers.get('If-Range', etag) == etag:
+            start = int(requested[len('bytes='):-1])
+            if start < len(body):
+                status = 206
+            else:
+                start = 0
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body) - start))
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        self.end_headers()
+        end = len(body)
+        if self.server.cut_every and number % self.server.cut_every == 0:
+            # send half of the body and break the connection
+            end = start + (end - start) // 2
+            self.close_connection = True
+        # recorded before it is sent, so a client never sees an unrecorded answer
+        self.server.record(self.path, status, end - start)
+        self.wfile.write(body[start:end])
+
+    def send_status(self, status, message):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(message)))
+        self.server.record(self.path, status, len(message))
+        self.end_headers()
+        self.wfile.write(message)
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """The stand-in server, it keeps (path, status, bytes sent) of every request.
+
+    latency is the seconds every response is delayed, every fail_every-th request is
+    answered with 503 and every cut_every-th body is broken off halfway, 0 turns them off.
+    """
+    daemon_threads = True
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, port=0, latency=0.0, fail_every=0,
+                 cut_every=0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        # the recording of each indicator code
+        self.recordings = {LIFE_EXPECTANCY.code: Recording(
+            os.path.join(directory, 'life_expectancy.csv'), os.path.join(directory, 'updates'))}
+        for name in os.listdir(directory):
+            code, extension = os.path.splitext(name)
+            if extension == '.csv' and code.isupper():
+                self.recordings[code] = Recording(os.path.join(directory, name))
+        with open(os.path.join(directory, 'country_codes.csv'), 'rb') as codes_file:
+            self.country_codes = codes_file.read()
+        self.requests = []
+        self._compressed = {}
+        self._lock = threading.Lock()
+        self.inject(latency, fail_every, cut_every)
+
+    def inject(self, latency=0.0, fail_every=0, cut_every=0):
+        """Change the faults and count the requests from 1 again, without
+        arguments the server works normally."""
+        with self._lock:
+            self.latency = latency
+            self.fail_every = fail_every
+            self.cut_every = cut_every
+            self._count = 0
+
+    @property
+    def recording(self):
+        """The recording of life expectancy."""
+        return self.recordings[LIFE_EXPECTANCY.code]
+
+    @property
+    def sdmx_base(self):
+        """The url to use as LIFE_EXP_SDMX_BASE."""
+        return f"http://127.0.0.1:{self.server_port}/rest"
+
+    @property
+    def country_url(self):
+        """The url to use as LIFE_EXP_COUNTRY_URL."""
+        return f"http://127.0.0.1:{self.server_port}/country_codes.csv"
+
+    def handle_error(self, request, client_address):
+        # clients that gave up waiting close their connection, that isn't an error here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self):
+        """Return the number of the request being answered, starting from 1."""
+        with self._lock:
+            self._count += 1
+            return self._count
+
+    def compressed(self, etag, body):
+        """Return the gzip compressed body, each body is only compressed once."""
+        with self._lock:
+            if etag not in self._compressed:
+                self._compressed[etag] = gzip.compress(body, compresslevel=6, mtime=0)
+            return self._compressed[etag]
+
+    def record(self, path, status, sent):
+        with self._lock:
+            self.requests.append((path, status, sent))
+
+    def bytes_sent(self):
+        """Return the number of body bytes sent so far."""
+        with self._lock:
+            return sum(sent for _, _, sent in self.requests)
+
+    def start(self):
+        """Serve in a background thread and return the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded SDMX responses.")
+    parser.add_argument('directory', nargs='?', default=DEFAULT_DIRECTORY)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds every response is delayed")
+    parser.add_argument('--fail-every', type=int, default=0, metavar='N',
+                        help="answer every Nth request with 503")
+    parser.add_argument('--cut-every', type=int, default=0, metavar='N',
+                        help="break every Nth body off halfway")
+    args = parser.parse_args()
+    server = StubServer(args.directory, args.port, args.latency, args.fail_every,
+                        args.cut_every)
+    print(f"export LIFE_EXP_SDMX_BASE={server.sdmx_base}")
+    print(f"export LIFE_EXP_COUNTRY_URL={server.country_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
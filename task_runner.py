@@ -0,0 +1,113 @@
+"""This module contains TaskRunner and Task classes."""
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+# Virtual event a worker sends to wake up the tkinter main loop when a task has finished.
+WAKEUP_EVENT = '<<TaskFinished>>'
+# Milliseconds between checks of the result queue while tasks are running, in case
+# a wakeup event can't be sent (e.g. before the main loop has started).
+POLL_INTERVAL = 100
+
+
+class Task:
+    """A function running in a worker thread and the callbacks that receive its result."""
+    def __init__(self, on_done=None, on_error=None):
+        self.on_done = on_done
+        self.on_error = on_error
+        self.future = None
+        self._cancelled = Event()
+
+    def cancel(self):
+        """Cancel the task, its callbacks won't be called and it won't start if it hasn't yet."""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancelled(self):
+        """Return True if the task was cancelled, long functions can check it to stop early."""
+        return self._cancelled.is_set()
+
+
+class TaskRunner:
+    """This class runs functions in worker threads and hands their results or
+    exceptions back to the tkinter main loop.
+
+    Workers never touch a widget, they put the outcome in a thread-safe queue and send
+    a virtual event to the widget, which then calls the callbacks in the main thread.
+    The queue is also checked every POLL_INTERVAL ms, but only while tasks are running.
+    """
+    def __init__(self, widget, max_workers=2):
+        self.widget = widget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._results = queue.Queue()
+        self._running = 0
+        self._poll_id = None
+        widget.bind(WAKEUP_EVENT, self._drain, add='+')
+        widget.bind('<Destroy>', self._on_destroy, add='+')
+
+    def submit(self, function, *args, on_done=None, on_error=None, **kwargs):
+        """Run function(*args, **kwargs) in a worker thread and return its Task.
+
+        on_done(result) or on_error(exception) is called in the main thread when it finishes.
+        """
+        task = Task(on_done, on_error)
+        task.future = self._executor.submit(self._work, task, function, args, kwargs)
+        # a task cancelled before it started never reaches _work, count it as finished
+        task.future.add_done_callback(
+            lambda future: future.cancelled() and self._results.put((task, None, None)))
+        self._running += 1
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(POLL_INTERVAL, self._poll)
+        return task
+
+    def _work(self, task, function, args, kwargs):
+        """Run the function in the worker thread and queue its outcome."""
+        if task.cancelled():
+            self._results.put((task, None, None))
+            return
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:  # the error is given to on_error in the main thread
+            self._results.put((task, None, error))
+        else:
+            self._results.put((task, result, None))
+        try:
+            self.widget.event_generate(WAKEUP_EVENT, when='tail')
+        except (RuntimeError, tk.TclError):
+            # the main loop isn't running yet or the widget is gone, polling picks it up
+            pass
+
+    def _poll(self):
+        """Check the queue while tasks are running."""
+        self._poll_id = None
+        self._drain()
+        if self._running:
+            self._poll_id = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def _drain(self, event=None):
+        """Call the callbacks of every finished task in the main thread."""
+        while True:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._running -= 1
+            if task.cancelled():
+                continue
+            if error is not None:
+                if task.on_error is not None:
+                    task.on_error(error)
+                else:
+                    self.widget.report_callback_exception(type(error), error,
+                                                          error.__traceback__)
+            elif task.on_done is not None:
+                task.on_done(result)
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            if self._poll_id is not None:
+                self.widget.after_cancel(self._poll_id)
+                self._poll_id = None
+            self._executor.shutdown(wait=False, cancel_futures=True)
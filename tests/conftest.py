@@ -0,0 +1,33 @@
+"""Fixtures shared by the tests: a StubServer serving a copy of the recorded responses."""
+import os
+import shutil
+import pytest
+import sdmx
+import transport
+from stub_server import DEFAULT_DIRECTORY, StubServer, parse_time
+
+# The recordings are dated long ago, only the updates added by a test are newer
+# than an updatedAfter query.
+RECORDED_AT = parse_time('2024-01-01T00:00:00')
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    """A StubServer of a copy of benchmarks/fixtures that the data queries are sent to,
+    the retries and resumes don't wait."""
+    directory = tmp_path / 'recorded'
+    shutil.copytree(DEFAULT_DIRECTORY, directory)
+    for name in os.listdir(directory):
+        os.utime(directory / name, (RECORDED_AT, RECORDED_AT))
+    server = StubServer(str(directory)).start()
+    monkeypatch.setattr(sdmx, 'SDMX_BASE', server.sdmx_base)
+    monkeypatch.setattr(transport, 'BACKOFF', 0.0)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def recorded_csv():
+    """The bytes of the recorded life expectancy csv."""
+    with open(os.path.join(DEFAULT_DIRECTORY, 'life_expectancy.csv'), 'rb') as csv_file:
+        return csv_file.read()
@@ -0,0 +1,66 @@
+"""Tests of the columns and the sorting of the RankAnalytics."""
+import math
+import pytest
+from analytics import RankAnalytics
+from rank_cube import RankCube
+from tests.test_rank_cube import make_data
+
+DATA = make_data([
+    ('AAA', 2000, 'Both sexes', 80.0), ('AAB', 2000, 'Both sexes', 78.0),
+    ('AAC', 2000, 'Both sexes', 75.0),
+    # AAA and AAC are tied in 2001, AAD has no value in 2000
+    ('AAA', 2001, 'Both sexes', 79.0), ('AAB', 2001, 'Both sexes', 81.0),
+    ('AAC', 2001, 'Both sexes', 79.0), ('AAD', 2001, 'Both sexes', 70.0),
+    ('AAA', 2001, 'Female', 83.0), ('AAA', 2001, 'Male', 75.0),
+])
+
+
+def countries(analytics, indexes):
+    return [str(country)[-3:] for country in analytics.rank_cube.countries[indexes]]
+
+
+def column(analytics, name, year, code):
+    index = list(analytics.rank_cube.codes).index(code)
+    return analytics.rows([index], year)[name][0]
+
+
+def test_columns_of_ties_and_new_countries():
+    analytics = RankAnalytics(RankCube(DATA))
+    # ranks 1 2 3 in 2000, 2 1 2 4 in 2001
+    assert [column(analytics, 'change', 2001, code) for code in ('AAA', 'AAB', 'AAC')] \
+        == [-1, 1, 1]
+    assert [column(analytics, 'delta', 2001, code) for code in ('AAA', 'AAB', 'AAC')] \
+        == [-1, 3, 4]
+    assert [column(analytics, 'percentile', 2001, code)
+            for code in ('AAA', 'AAB', 'AAC', 'AAD')] == pytest.approx([200 / 3, 100, 200 / 3, 0])
+    assert math.isnan(column(analytics, 'change', 2001, 'AAD'))
+    assert math.isnan(column(analytics, 'delta', 2001, 'AAD'))
+    assert column(analytics, 'gap', 2001, 'AAA') == 8
+    assert math.isnan(column(analytics, 'gap', 2001, 'AAB'))
+
+
+def test_missing_previous_year_is_nan():
+    data = make_data([('AAA', 2000, 'Both sexes', 80.0), ('AAB', 2000, 'Both sexes', 78.0),
+                      ('AAA', 2002, 'Both sexes', 70.0), ('AAB', 2002, 'Both sexes', 82.0)])
+    analytics = RankAnalytics(RankCube(data), lookback=2)
+    # 2001 isn't in the data, so nothing is compared with it
+    assert math.isnan(column(analytics, 'change', 2002, 'AAA'))
+    assert math.isnan(column(analytics, 'delta', 2002, 'AAB'))
+    # the lookback reaches 2000
+    assert column(analytics, 'change_n', 2002, 'AAA') == -1
+    assert column(analytics, 'change_n', 2002, 'AAB') == 1
+
+
+def test_sorting_puts_nan_last_in_both_directions():
+    analytics = RankAnalytics(RankCube(DATA))
+    assert countries(analytics, analytics.ranking('delta', 2001)) == \
+        ['AAC', 'AAB', 'AAA', 'AAD']
+    assert countries(analytics, analytics.ranking('delta', 2001, ascending=True)) == \
+        ['AAA', 'AAB', 'AAC', 'AAD']
+    assert countries(analytics, analytics.ranking('change', 2001))[-1] == 'AAD'
+    assert countries(analytics, analytics.ranking('change', 2001, ascending=True)) == \
+        ['AAA', 'AAC', 'AAB', 'AAD']
+    # AAD has no value in 2000 and isn't listed at all
+    assert countries(analytics, analytics.ranking('change', 2000)) == ['AAA', 'AAB', 'AAC']
+    assert countries(analytics, analytics.ranking('value', 2001, ascending=True)) == \
+        ['AAD', 'AAC', 'AAA', 'AAB']
@@ -0,0 +1,54 @@
+"""Tests of the manifest of the batch export, with the charts written by a stand-in."""
+import os
+import batch_export
+import dataset
+from http_cache import HttpCache
+from indicators import INDICATORS, LIFE_EXPECTANCY
+from stub_server import Recording
+
+
+def write_chart(task):
+    """Write one small file in place of the charts of the country."""
+    path = os.path.join('charts', task['name'], 'line.txt')
+    os.makedirs(os.path.join(task['directory'], 'charts', task['name']), exist_ok=True)
+    with open(os.path.join(task['directory'], path), 'w', encoding='utf-8') as chart_file:
+        chart_file.write(task['country'])
+    return [path]
+
+
+def export(directory, cache, **options):
+    return batch_export.export(str(directory), cache, workers=1, **options)
+
+
+def test_unchanged_outputs_are_skipped_unless_forced(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'COUNTRY_NAME_URL', stub.country_url)
+    # the worker process is forked, so it renders with the stand-in as well
+    monkeypatch.setattr(batch_export, 'render_country', write_chart)
+    cache = HttpCache(str(tmp_path / 'cache'))
+    output = tmp_path / 'export'
+
+    exported, skipped = export(output, cache)
+    assert skipped == 0 and exported > 1
+    directory = output / LIFE_EXPECTANCY.code
+    assert (directory / 'rankings.csv').exists() and (directory / batch_export.MANIFEST).exists()
+
+    assert export(output, cache) == (0, exported)
+    os.remove(directory / 'rankings.json')
+    assert export(output, cache) == (1, exported - 1)
+    assert export(output, cache, force=True) == (exported, 0)
+
+
+def test_indicators_dont_share_the_manifest(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'COUNTRY_NAME_URL', stub.country_url)
+    monkeypatch.setattr(batch_export, 'render_country', write_chart)
+    cache = HttpCache(str(tmp_path / 'cache'))
+    output = tmp_path / 'export'
+    other = INDICATORS['DM_POP_TOT']
+    # the other indicator has the same observations, its outputs are still exported
+    # instead of being skipped as unchanged
+    stub.recordings[other.code] = Recording(stub.recording.path)
+
+    exported, _ = export(output, cache)
+    assert export(output, cache, indicator=other) == (exported, 0)
+    assert export(output, cache) == (0, exported)
+    assert sorted(os.listdir(output)) == [LIFE_EXPECTANCY.code, other.code]
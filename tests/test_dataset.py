@@ -0,0 +1,155 @@
+"""Tests of the cached downloads and the incremental refresh of the observations."""
+import csv
+import time
+import pandas as pd
+import pytest
+import requests
+import dataset
+import sdmx
+import transport
+from http_cache import CacheMiss, HttpCache
+
+COLUMNS = dataset.LIFE_EXPECTANCY_COLUMNS
+
+
+def country_codes(stub, cache):
+    return dataset.country_alpha_codes(dataset.download_csv_from_url(
+        stub.country_url, cache, columns=dataset.COUNTRY_NAME_COLUMNS))
+
+
+def recorded_row(recording, area, sex, period):
+    """Return the recorded csv row of the observation as a list."""
+    with open(recording.path, newline='', encoding='utf-8') as csv_file:
+        for row in csv.reader(csv_file):
+            if row[recording.area] == area and row[recording.sex] == sex \
+                    and row[recording.period] == str(period):
+                return row
+    raise LookupError((area, sex, period))
+
+
+def observation(data, area, sex, period):
+    return data[(data.REF_AREA == area) & (data.Sex == sex) & (data.TIME_PERIOD == period)]
+
+
+def test_merge_observations_replaces_held_and_adds_new():
+    held = pd.DataFrame({'REF_AREA': ['AAA', 'AAA', 'AAB'], 'Geographic area': ['A', 'A', 'B'],
+                         'Sex': ['Total', 'Female', 'Total'], 'TIME_PERIOD': [2000, 2000, 2000],
+                         'OBS_VALUE': [70.0, 72.0, 60.0]}).astype(COLUMNS)
+    changes = pd.DataFrame({'REF_AREA': ['AAA', 'AAB'], 'Geographic area': ['A', 'B'],
+                            'Sex': ['Female', 'Total'], 'TIME_PERIOD': [2000, 2001],
+                            'OBS_VALUE': [73.5, 61.0]}).astype(COLUMNS)
+    merged = sdmx.merge_observations(held, changes, COLUMNS)
+    assert len(merged) == 4
+    assert not merged.duplicated(sdmx.OBSERVATION_KEY).any()
+    assert observation(merged, 'AAA', 'Female', 2000).OBS_VALUE.tolist() == [73.5]
+    assert observation(merged, 'AAB', 'Total', 2001).OBS_VALUE.tolist() == [61.0]
+    assert dict(merged.dtypes) == dict(held.dtypes)
+
+
+def test_updated_after_replaces_duplicates_and_appends_new_years(stub, tmp_path):
+    cache = HttpCache(str(tmp_path / 'cache'), ttl=0)
+    codes = country_codes(stub, cache)
+    held = dataset.download_observations(codes, cache)
+    recording = stub.recording
+    changed = recorded_row(recording, 'AAA', 'F', 2000)
+    changed[recording.header.index('OBS_VALUE')] = '99.9'
+    added = recorded_row(recording, 'AAA', '_T', 2021)
+    added[recording.period] = '2022'
+    recording.updates.extend([(time.time() + 60, changed), (time.time() + 60, added)])
+
+    stub.requests.clear()
+    merged = dataset.download_observations(codes, cache)
+
+    assert len(stub.requests) == 1 and 'updatedAfter=' in stub.requests[0][0]
+    assert len(merged) == len(held) + 1
+    assert not merged.duplicated(sdmx.OBSERVATION_KEY).any()
+    assert observation(merged, 'AAA', 'Female', 2000).OBS_VALUE.tolist() == \
+        [pytest.approx(99.9)]
+    assert merged[merged.TIME_PERIOD == 2022].REF_AREA.tolist() == ['AAA']
+    # the merged observations replace the cached copy
+    cached = dataset.read_csv(cache.get(sdmx.data_url(codes)).path, COLUMNS)
+    pd.testing.assert_frame_equal(cached, merged)
+
+
+def test_updated_after_without_changes_keeps_held_copy(stub, tmp_path):
+    cache = HttpCache(str(tmp_path / 'cache'), ttl=0)
+    codes = country_codes(stub, cache)
+    held = dataset.download_observations(codes, cache)
+    checked = cache.get(sdmx.data_url(codes)).meta['checked']
+    stub.requests.clear()
+
+    again = dataset.download_observations(codes, cache)
+
+    # the server answers 404 when no observation was updated
+    assert [status for _, status, _ in stub.requests] == [404]
+    pd.testing.assert_frame_equal(again, held)
+    assert cache.get(sdmx.data_url(codes)).meta['checked'] > checked
+
+
+def test_busy_server_keeps_held_copy_until_next_refresh(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(transport, 'RETRIES', 0)
+    cache = HttpCache(str(tmp_path / 'cache'), ttl=0)
+    codes = country_codes(stub, cache)
+    held = dataset.download_observations(codes, cache)
+    checked = cache.get(sdmx.data_url(codes)).meta['checked']
+    stub.requests.clear()
+    stub.inject(fail_every=1)
+
+    again = dataset.download_observations(codes, cache)
+
+    # no full download, and the entry stays stale so it is asked for again
+    assert [status for _, status, _ in stub.requests] == [503]
+    pd.testing.assert_frame_equal(again, held)
+    assert cache.get(sdmx.data_url(codes)).meta['checked'] == checked
+
+
+def test_stale_entry_answered_with_304_is_reused(stub, tmp_path):
+    cache = HttpCache(str(tmp_path / 'cache'), ttl=0)
+    first = dataset.download_csv_from_url(stub.country_url, cache,
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+    checked = cache.get(stub.country_url).meta['checked']
+    stub.requests.clear()
+
+    again = dataset.download_csv_from_url(stub.country_url, cache,
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+
+    assert stub.requests == [('/country_codes.csv', 304, 0)]
+    pd.testing.assert_frame_equal(again, first)
+    assert cache.get(stub.country_url).meta['checked'] > checked
+
+
+def test_busy_server_keeps_stale_entry(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(transport, 'RETRIES', 0)
+    cache = HttpCache(str(tmp_path / 'cache'), ttl=0)
+    first = dataset.download_csv_from_url(stub.country_url, cache,
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+    checked = cache.get(stub.country_url).meta['checked']
+    stub.requests.clear()
+    stub.inject(fail_every=1)
+
+    again = dataset.download_csv_from_url(stub.country_url, cache,
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+
+    assert [status for _, status, _ in stub.requests] == [503]
+    pd.testing.assert_frame_equal(again, first)
+    assert cache.get(stub.country_url).meta['checked'] == checked
+    # without a cached copy the error is raised
+    with pytest.raises(requests.HTTPError):
+        dataset.download_csv_from_url(stub.country_url, HttpCache(str(tmp_path / 'empty')),
+                                      columns=dataset.COUNTRY_NAME_COLUMNS)
+
+
+def test_offline_reads_the_cache_without_the_network(stub, tmp_path):
+    directory = str(tmp_path / 'cache')
+    first = dataset.download_csv_from_url(stub.country_url, HttpCache(directory),
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+    stub.requests.clear()
+    offline = HttpCache(directory, ttl=0, offline=True)
+
+    again = dataset.download_csv_from_url(stub.country_url, offline,
+                                          columns=dataset.COUNTRY_NAME_COLUMNS)
+
+    assert stub.requests == []
+    pd.testing.assert_frame_equal(again, first)
+    with pytest.raises(CacheMiss):
+        dataset.download_csv_from_url(sdmx.data_url(['AAA']), offline, columns=COLUMNS)
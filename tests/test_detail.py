@@ -0,0 +1,124 @@
+"""Tests of the year path of the detail window, without a display: the methods of
+DetailPlot run on a stand-in with the state they use and Agg figures."""
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from detail import DetailPlot
+from playback import Playback as FramePlayback
+from indicators import LIFE_EXPECTANCY
+from rank_cube import RankCube
+from series_store import SeriesStore
+from tests.test_rank_cube import DATA, make_data
+
+
+class Variable:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class Label:
+    text = None
+
+    def config(self, text):
+        self.text = text
+
+
+class Playback:
+    def show_cached(self, year):
+        return False
+
+    def hide(self):
+        pass
+
+    def prerender(self):
+        pass
+
+
+class FakeDetail:
+    """What DetailPlot.update_year uses, with the widgets replaced."""
+    update_year = DetailPlot.update_year
+    update_rank = DetailPlot.update_rank
+    update_data = DetailPlot.update_data
+    draw_visible_plot = DetailPlot.draw_visible_plot
+    plot_bar = DetailPlot.plot_bar
+
+    def __init__(self, data, country, year, sex_filters=('Both sexes', 'Female')):
+        self.rank_cube = RankCube(data)
+        self.series_store = SeriesStore(data)
+        self.indicator = LIFE_EXPECTANCY
+        self.country_name = Variable(country)
+        self.year = Variable(year)
+        self.selected_option = Variable('bar')
+        self.message = Label()
+        self.playback = Playback()
+        self.data_country = None
+        self.sex_filters = list(sex_filters)
+        self.colors_in_plot = ["Green", "Red", "Blue"][:len(self.sex_filters)]
+        self.fig_bar = Figure()
+        self.fig_canvas_bar = FigureCanvasAgg(self.fig_bar)
+        self.axes_year = self.fig_bar.add_subplot()
+        self.bars = None
+        self.bar_sexes = None
+        self.bar_labels = []
+        self.stale_plots = set()
+
+
+def bar_texts(detail):
+    return [label.get_text() for label in detail.bar_labels]
+
+
+def test_year_without_data_shows_empty_bars():
+    detail = FakeDetail(DATA, 'Country AAA', 2000)
+    detail.update_year()
+    assert detail.message.text == "Country AAA\n - Rank #1 out of 5 countries in 2000 (Both sexes)"
+
+    detail.year.set(2001)
+    detail.update_year()
+
+    assert detail.message.text == "Country AAA\n - No data of any country in 2001 (Both sexes)"
+    assert [rect.get_height() for rect in detail.bars] == [0, 0]
+    assert bar_texts(detail) == ["No data", "No data"]
+    assert detail.axes_year.get_title().endswith("in 2001")
+
+
+def test_country_without_data_in_the_year():
+    detail = FakeDetail(DATA, 'Country AAE', 2002)
+    detail.update_year()
+    assert detail.message.text == "Country AAE\n - No data out of 4 countries in 2002 (Both sexes)"
+    assert np.allclose([rect.get_height() for rect in detail.bars], [0, 0])
+
+
+def test_rank_of_the_first_sex_shown():
+    data = make_data([('AAA', 2000, 'Female', 80.0), ('AAB', 2000, 'Female', 82.0),
+                      ('AAA', 2000, 'Male', 75.0)])
+    detail = FakeDetail(data, 'Country AAA', 2000, sex_filters=['Female', 'Male'])
+    detail.update_year()
+    assert detail.message.text == "Country AAA\n - Rank #2 out of 2 countries in 2000 (Female)"
+
+    detail.sex_filters = ['Male']
+    detail.update_rank()
+    assert detail.message.text == "Country AAA\n - Rank #1 out of 1 countries in 2000 (Male)"
+
+
+def test_playback_skips_the_years_without_data():
+    detail = FakeDetail(DATA, 'Country AAA', 2001)
+    playback = FramePlayback(detail)
+    assert playback.years() == [2002, 2000]
+    assert (playback.next_year(2000), playback.next_year(2002)) == (2002, None)
+
+    shown = []
+    playback.show_cached = lambda year: shown.append(year) or True
+    detail.after = lambda delay, callback: None
+    detail.after_cancel = lambda after_id: None
+    detail.button_play = Label()
+    detail.year.set(2000)
+    playback.tick()
+    playback.tick()
+    assert shown == [2000, 2002]
+    assert detail.button_play.text == "Play"
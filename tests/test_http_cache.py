@@ -0,0 +1,48 @@
+"""Tests of the size limit of the http cache."""
+import os
+import time
+import numpy as np
+import pandas as pd
+from http_cache import HttpCache
+from snapshot import load_snapshot, save_snapshot
+
+
+def snapshot_data(rows):
+    return pd.DataFrame({'REF_AREA': pd.Categorical(['AAA'] * rows),
+                         'Country': pd.Categorical(['Country AAA'] * rows),
+                         'Sex': pd.Categorical(['Female'] * rows),
+                         'Year': np.arange(rows, dtype=np.int16),
+                         'Value': np.ones(rows, dtype=np.float32)})
+
+
+def set_used(path, seconds_ago):
+    used = time.time() - seconds_ago
+    os.utime(path, (used, used))
+
+
+def test_snapshots_count_towards_the_size_and_are_evicted(tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=10 ** 9)
+    cache.put('http://example.com/a.csv', b'x' * 50_000)
+    old = str(tmp_path / 'snapshots' / 'OLD')
+    new = str(tmp_path / 'snapshots' / 'NEW')
+    save_snapshot(snapshot_data(20_000), 'old', old)
+    save_snapshot(snapshot_data(20_000), 'new', new)
+    assert load_snapshot('new', new) is not None
+    body = cache.get('http://example.com/a.csv').path
+
+    sizes = {path: size for _, size, path in cache.entries()}
+    assert set(sizes) == {body, old, new}
+    set_used(os.path.join(old, 'meta.json'), 300)
+    set_used(body, 200)
+    set_used(os.path.join(new, 'meta.json'), 100)
+    # only the least recently used snapshot has to go
+    cache.max_bytes = sizes[new] + 60_000
+    cache.evict()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(body) and os.path.exists(new)
+    # the body was used before the snapshot was
+    cache.max_bytes = sizes[new]
+    cache.evict()
+    assert cache.get('http://example.com/a.csv') is None
+    assert load_snapshot('new', new) is not None
@@ -0,0 +1,124 @@
+"""Tests of the query server on a free port, with the data served by the stub."""
+import asyncio
+import json
+import pytest
+import dataset
+import query_server
+import transport
+from http_cache import HttpCache
+from indicator_engine import IndicatorEngine
+from load_test import Connection
+
+
+def serve(engine, client):
+    """Run the server of the engine on a free port while client(port) runs."""
+    async def run():
+        server = query_server.QueryServer(query_server.QueryApi(engine), port=0)
+        port = await server.start()
+        try:
+            return await client(port)
+        finally:
+            server.close()
+            # the connections the client closed are done with before the loop stops
+            others = asyncio.all_tasks() - {asyncio.current_task()}
+            if others:
+                await asyncio.wait(others, timeout=1)
+    return asyncio.run(run())
+
+
+async def send(port, request):
+    """Send the raw request and return the whole response the server sends until it
+    closes the connection."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+@pytest.fixture
+def engine(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'COUNTRY_NAME_URL', stub.country_url)
+    return IndicatorEngine(HttpCache(str(tmp_path / 'cache')))
+
+
+def test_etag_is_revalidated_on_a_kept_open_connection(engine):
+    async def client(port):
+        connection = Connection('127.0.0.1', port)
+        status, headers, body = await connection.request('/ranking?limit=3')
+        assert status == 200
+        assert headers['content-type'] == 'application/json; charset=utf-8'
+        assert headers['cache-control'] == 'no-cache'
+        assert headers['connection'] == 'keep-alive'
+        assert int(headers['content-length']) == len(body)
+        assert len(json.loads(body)['rows']) == 3
+        writer = connection.writer
+
+        status, again, _ = await connection.request('/ranking?limit=3&order=desc',
+                                                    {'If-None-Match': headers['etag']})
+        # the same query written another way has the same response
+        assert status == 304
+        assert 'content-length' not in again and again['etag'] == headers['etag']
+        status, _, _ = await connection.request('/ranking?limit=3',
+                                                {'If-None-Match': '"other"'})
+        assert status == 200
+        assert connection.writer is writer
+        connection.close()
+    serve(engine, client)
+
+
+def test_errors_have_their_status(engine, monkeypatch, capsys):
+    def broken(*args):
+        raise RuntimeError("broken")
+
+    async def client(port):
+        connection = Connection('127.0.0.1', port)
+        statuses = {}
+        for target in ('/ranking?year=abc', '/ranking?sort=nothing', '/nothing',
+                       '/ranking?indicator=NOTHING', '/series/Nowhere'):
+            status, headers, body = await connection.request(target)
+            statuses[target] = status
+            assert headers['connection'] == 'keep-alive' and 'error' in json.loads(body)
+        monkeypatch.setattr(query_server.QueryApi, 'ranking', staticmethod(broken))
+        status, _, body = await connection.request('/ranking?year=2000')
+        statuses['broken'] = status
+        assert json.loads(body) == {'error': "The query failed on the server."}
+        connection.close()
+        return statuses
+    assert serve(engine, client) == {'/ranking?year=abc': 400, '/ranking?sort=nothing': 400,
+                                     '/nothing': 404, '/ranking?indicator=NOTHING': 404,
+                                     '/series/Nowhere': 404, 'broken': 500}
+    assert 'RuntimeError: broken' in capsys.readouterr().err
+
+
+def test_methods_and_bad_requests(engine):
+    async def client(port):
+        head = await send(port, b'HEAD /indicators HTTP/1.1\r\nConnection: close\r\n\r\n')
+        post = await send(port, b'POST /indicators HTTP/1.1\r\nContent-Length: 2\r\n'
+                                b'Connection: close\r\n\r\n{}')
+        bad = await send(port, b'GET\r\n\r\n')
+        return head, post, bad
+    head, post, bad = serve(engine, client)
+    assert head.startswith(b'HTTP/1.1 200 OK\r\n') and b'Content-Length: ' in head
+    assert head.endswith(b'\r\n\r\n')
+    assert post.startswith(b'HTTP/1.1 405 ') and b'\r\nAllow: GET, HEAD\r\n' in post
+    # the connection is closed after a request that can't be read
+    assert bad.startswith(b'HTTP/1.1 400 ') and b'Connection: close' in bad
+
+
+def test_data_that_cant_be_loaded(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'COUNTRY_NAME_URL', stub.country_url)
+    async def client(port):
+        connection = Connection('127.0.0.1', port)
+        status, _, body = await connection.request('/ranking')
+        connection.close()
+        return status, json.loads(body)['error']
+
+    offline = IndicatorEngine(HttpCache(str(tmp_path / 'offline'), offline=True))
+    status, error = serve(offline, client)
+    assert status == 503 and "offline" in error
+
+    monkeypatch.setattr(transport, 'RETRIES', 0)
+    stub.inject(fail_every=1)
+    status, error = serve(IndicatorEngine(HttpCache(str(tmp_path / 'cache'))), client)
+    assert status == 502 and "can't be downloaded" in error
@@ -0,0 +1,56 @@
+"""Tests of the ranks of the RankCube."""
+import numpy as np
+import pandas as pd
+from rank_cube import RankCube
+
+
+def make_data(rows):
+    """Return cleaned data made of (code, year, sex, value) rows."""
+    codes, years, sexes, values = zip(*rows)
+    return pd.DataFrame({'REF_AREA': pd.Categorical(codes),
+                         'Country': pd.Categorical([f"Country {code}" for code in codes]),
+                         'Sex': pd.Categorical(sexes),
+                         'Year': np.array(years, dtype=np.int16),
+                         'Value': np.array(values, dtype=np.float32)})
+
+
+DATA = make_data([
+    ('AAA', 2000, 'Both sexes', 80.0), ('AAB', 2000, 'Both sexes', 80.0),
+    ('AAC', 2000, 'Both sexes', 75.0), ('AAD', 2000, 'Both sexes', 75.0),
+    ('AAE', 2000, 'Both sexes', 70.0),
+    # 2001 is missing, AAE has no value in 2002
+    ('AAA', 2002, 'Both sexes', 70.0), ('AAB', 2002, 'Both sexes', 82.0),
+    ('AAC', 2002, 'Both sexes', 76.0), ('AAD', 2002, 'Both sexes', 76.0),
+    ('AAA', 2002, 'Female', 72.0),
+])
+
+
+def test_tied_values_share_the_best_rank():
+    rank_cube = RankCube(DATA)
+    ranks = {country: rank_cube.rank_of(country, 2000)
+             for country in rank_cube.countries}
+    assert ranks == {'Country AAA': 1, 'Country AAB': 1, 'Country AAC': 3,
+                     'Country AAD': 3, 'Country AAE': 5}
+    ranks, countries, values = rank_cube.table(2002)
+    assert ranks.tolist() == [1, 2, 2, 4]
+    assert countries.tolist() == ['Country AAB', 'Country AAC', 'Country AAD', 'Country AAA']
+    assert values.tolist() == [82.0, 76.0, 76.0, 70.0]
+
+
+def test_country_without_value_is_not_ranked():
+    rank_cube = RankCube(DATA)
+    assert rank_cube.rank_of('Country AAE', 2002) == 0
+    assert rank_cube.count(2002) == 4
+    assert rank_cube.count(2002, 'Female') == 1
+    assert rank_cube.rank_of('Country AAB', 2002, 'Female') == 0
+
+
+def test_gap_year_has_no_rank():
+    rank_cube = RankCube(DATA)
+    assert rank_cube.years.tolist() == [2000, 2002]
+    assert not rank_cube.has(2001)
+    assert rank_cube.rank_of('Country AAA', 2001) == 0
+    assert rank_cube.count(2001) == 0
+    # a sex the data doesn't have neither
+    assert rank_cube.count(2000, 'Male') == 0
+    assert rank_cube.rank_of('Country AAA', 2000, 'Male') == 0
@@ -0,0 +1,104 @@
+"""Tests of the EventCoalescer on a stand-in widget whose after() runs on a fake clock."""
+import pytest
+import scheduler
+from scheduler import EventCoalescer
+
+
+class Clock:
+    """A widget's after() and the perf_counter of the scheduler on the same fake time."""
+    def __init__(self):
+        self.now = 0  # milliseconds
+        self.calls = {}
+        self.next_id = 0
+        self.bindings = []
+
+    def perf_counter(self):
+        return self.now / 1000
+
+    def perf_counter_ns(self):
+        return self.now * 1_000_000
+
+    def after(self, delay, callback, *args):
+        self.next_id += 1
+        self.calls[self.next_id] = (self.now + delay, callback, args)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        del self.calls[after_id]
+
+    def after_idle(self, callback):
+        self.after(0, callback)
+
+    def bind(self, sequence, callback, add=None):
+        self.bindings.append((sequence, callback, add))
+
+    def advance(self, milliseconds):
+        """Move the time on, running the calls that are due in their order."""
+        end = self.now + milliseconds
+        while True:
+            due = [(when, after_id) for after_id, (when, _, _) in self.calls.items()
+                   if when <= end]
+            if not due:
+                break
+            when, after_id = min(due)
+            _, callback, args = self.calls.pop(after_id)
+            self.now = max(self.now, when)
+            callback(*args)
+        self.now = end
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+    # the clock starts long after the handlers last ran
+    clock.now = 10_000
+    return clock
+
+
+def test_debounce_runs_once_with_the_latest_event(clock):
+    runs = []
+    handler = EventCoalescer(clock).register('table', runs.append, delay=50)
+    for value in range(5):
+        handler(value)
+        clock.advance(20)
+    assert runs == []
+    clock.advance(30)
+    assert runs == [4]
+    clock.advance(1000)
+    assert runs == [4]
+
+
+def test_throttle_runs_at_most_once_per_delay(clock):
+    runs = []
+    handler = EventCoalescer(clock).register('year', runs.append, delay=33, mode='throttle')
+    handler(0)
+    clock.advance(0)
+    # the first event of a burst runs at once
+    assert runs == [0]
+    for value in range(1, 11):
+        clock.advance(10)
+        handler(value)
+    clock.advance(100)
+    # an event every 10 ms runs the handler every 33 ms with the latest one, the last
+    # event is not lost
+    assert runs == [0, 3, 6, 9, 10]
+    assert len(clock.calls) == 0
+
+
+def test_flush_and_destroy(clock):
+    runs = []
+    coalescer = EventCoalescer(clock)
+    handler = coalescer.register('plots', runs.append)
+    handler(1)
+    coalescer.flush('plots')
+    assert runs == [1] and not clock.calls
+
+    handler(2)
+    (_, on_destroy, _), = clock.bindings
+    on_destroy(type('Event', (), {'widget': clock}))
+    clock.advance(1000)
+    assert runs == [1]
+
+    with pytest.raises(ValueError):
+        coalescer.register('other', runs.append, mode='sometimes')
@@ -0,0 +1,40 @@
+"""Tests of the exact, prefix and fuzzy matches of the SearchIndex."""
+import search_index
+from search_index import SearchIndex
+
+NAMES = ["New Zealand", "Netherlands", "Niger", "Nigeria", "Côte d'Ivoire",
+         "United States", "United Kingdom", "Zambia"]
+CODES = ["NZL", "NLD", "NER", "NGA", "CIV", "USA", "GBR", "ZMB"]
+
+
+def test_exact_match_by_name_code_or_alias():
+    index = SearchIndex(NAMES, CODES)
+    assert index.lookup("cote d ivoire") == "CIV"
+    assert index.lookup("nga") == "NGA"
+    assert index.lookup("Holland") == "NLD"
+    assert index.lookup("Nige") is None
+
+
+def test_prefix_suggestions_are_alphabetical():
+    index = SearchIndex(NAMES, CODES)
+    assert index.suggest("ni") == ["Niger", "Nigeria"]
+    assert index.suggest("united", limit=1) == ["United Kingdom"]
+    assert index.suggest("N") == ["Netherlands", "New Zealand", "Niger", "Nigeria"]
+    # a part of a name that it doesn't start with is not a completion
+    assert index.suggest("zealand") == []
+
+
+def test_fuzzy_ranks_the_most_similar_first():
+    index = SearchIndex(NAMES, CODES)
+    assert index.fuzzy("nnigeria") == ["Nigeria", "Niger"]
+    assert index.fuzzy("zealand")[0] == "New Zealand"
+    assert index.fuzzy("untied kingdom", limit=1) == ["United Kingdom"]
+    assert index.fuzzy("qqqq") == []
+
+
+def test_fuzzy_scores_only_the_best_candidates(monkeypatch):
+    names = [f"Land {i:03}" for i in range(200)] + ["Landia"]
+    index = SearchIndex(names, [f"L{i:02}" for i in range(len(names))])
+    assert index.fuzzy("landia", limit=1) == ["Landia"]
+    monkeypatch.setattr(search_index, 'FUZZY_CANDIDATES', 1)
+    assert index.fuzzy("landia", limit=5) == ["Landia"]
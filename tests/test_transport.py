@@ -0,0 +1,63 @@
+"""Tests of the retries, the resumes and the decompression of the http transport."""
+import gzip
+import pytest
+import sdmx
+import transport
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'identity'])
+def test_broken_body_is_resumed_byte_identical(stub, recorded_csv, encoding):
+    stub.inject(fail_every=3, cut_every=2)
+    # the first request is answered normally
+    transport.get(stub.country_url).close()
+
+    response = transport.get(sdmx.data_url(), {'Accept-Encoding': encoding})
+    body = b''.join(transport.iter_body(response))
+
+    assert body == recorded_csv
+    # the body is cut, the resume gets a 503 and is tried again, that part is cut
+    # as well and the second resume gets the rest
+    assert [status for _, status, _ in stub.requests] == [200, 200, 503, 206, 206]
+    stats = response.stats
+    assert (stats.status, stats.attempts, stats.resumes) == (200, 4, 2)
+    assert stats.encoding == (None if encoding == 'identity' else 'gzip')
+    assert stats.body_bytes == len(recorded_csv)
+    assert stats.wire_bytes == sum(sent for _, status, sent in stub.requests[1:]
+                                   if status != 503)
+
+
+def test_changed_body_is_not_resumed(stub):
+    stub.inject(cut_every=1)
+    response = transport.get(stub.country_url)
+
+    def progress(received, total):
+        if received:
+            # the body changes on the server before the rest is asked for
+            stub.country_codes = b'Alpha-3 code\nZZZ\n'
+
+    with pytest.raises(transport.ResumeError):
+        b''.join(transport.iter_body(response, progress))
+    # the If-Range validator doesn't match, so the whole new body is sent instead of a part
+    assert [status for _, status, _ in stub.requests] == [200, 200]
+
+
+def test_busy_server_is_tried_again(stub, monkeypatch):
+    monkeypatch.setattr(transport, 'RETRIES', 2)
+    stub.inject(fail_every=1)
+    response = transport.get(stub.country_url)
+    assert (response.status_code, response.stats.attempts) == (503, 3)
+
+    stub.inject(fail_every=2)
+    transport.get(stub.country_url).close()
+    response = transport.get(stub.country_url)
+    assert (response.status_code, response.stats.attempts) == (200, 2)
+    assert b''.join(transport.iter_body(response)) == stub.country_codes
+
+
+def test_decoder_output_is_bounded():
+    body = b'0' * (10 * transport.CHUNK_SIZE)
+    decoder = transport.Decoder('gzip')
+    pieces = list(decoder.decompress(gzip.compress(body)))
+    pieces.append(decoder.flush())
+    assert b''.join(pieces) == body
+    assert max(len(piece) for piece in pieces) <= transport.CHUNK_SIZE
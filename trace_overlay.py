@@ -0,0 +1,38 @@
+"""This module contains TraceOverlay class."""
+import tkinter as tk
+from tkinter import ttk
+import instrumentation
+
+# Number of timings shown in the overlay.
+OVERLAY_EVENTS = 20
+# Milliseconds between two refreshes of the overlay.
+OVERLAY_INTERVAL = 500
+
+
+class TraceOverlay(tk.Toplevel):
+    """A small window that stays on top and shows the latest timings."""
+    def __init__(self, parent, number=OVERLAY_EVENTS):
+        super().__init__(parent)
+        self.title('Timings')
+        self.attributes('-topmost', True)
+        self.number = number
+        self.listbox = tk.Listbox(self, width=50, height=number, font=('Courier', 10))
+        self.listbox.grid(row=0, column=0, sticky=tk.NSEW)
+        self.label_counters = ttk.Label(self)
+        self.label_counters.grid(row=1, column=0, sticky="W", padx=5, pady=5)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.refresh()
+
+    def refresh(self):
+        """Show the latest timings and refresh again later."""
+        self.listbox.delete(0, tk.END)
+        for name, category, milliseconds in reversed(instrumentation.recent(self.number)):
+            self.listbox.insert(tk.END, f"{milliseconds:9.2f} ms  {category:<8} {name}")
+        counters = instrumentation.counters()
+        self.label_counters.config(
+            text=f"Downloaded {counters.get('bytes downloaded', 0) / 1e6:.1f} MB in "
+                 f"{counters.get('http requests', 0)} requests, "
+                 f"{counters.get('http retries', 0)} retries, "
+                 f"{counters.get('http resumes', 0)} resumed")
+        self.after(OVERLAY_INTERVAL, self.refresh)
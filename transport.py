@@ -0,0 +1,279 @@
+"""This module contains the http transport of the downloads.
+
+Every request goes through one requests.Session, so the connections (and their TLS
+handshakes) are reused, and asks for a gzip or deflate compressed body. Requests have
+connect and read timeouts, and connection errors, timeouts and busy servers (429, 5xx)
+are retried after an exponential backoff with jitter. A body whose connection breaks
+is resumed with a Range request from the byte it stopped at, when the server accepts
+ranges and sent a validator that makes sure the rest is of the same body.
+
+The timing and the bytes of the latest requests are kept, see recent_stats().
+"""
+import os
+import random
+import threading
+import time
+import zlib
+from collections import deque
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+import instrumentation
+
+# Seconds to wait for a connection and then between two reads of the response.
+CONNECT_TIMEOUT = float(os.environ.get('LIFE_EXP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('LIFE_EXP_READ_TIMEOUT', 30))
+# Number of times a request is tried again, and a broken body is resumed.
+RETRIES = int(os.environ.get('LIFE_EXP_RETRIES', 4))
+# Seconds of the longest first wait before trying again, it doubles with every retry.
+BACKOFF = 0.5
+BACKOFF_MAX = 8.0
+# Statuses of servers that are busy or failing for a moment.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Connections kept open to each host.
+POOL_SIZE = 4
+# Size of the pieces the bodies are read in.
+CHUNK_SIZE = 64 * 1024
+# Number of requests whose stats are kept.
+MAX_STATS = 200
+
+_session = None
+_session_lock = threading.Lock()
+_stats = deque(maxlen=MAX_STATS)
+_stats_lock = threading.Lock()
+
+
+class ResumeError(requests.RequestException):
+    """Raised when the rest of a broken body can't be downloaded, e.g. because
+    the body has changed on the server in the meantime."""
+
+
+class RequestStats:
+    """The timing and the size of one request, including its retries and resumes.
+
+    wire_bytes is what was received, body_bytes the body after decompressing it.
+    The times are time.perf_counter() values, first_byte is when the headers arrived.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.attempts = 0
+        self.resumes = 0
+        self.encoding = None
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.started = time.perf_counter()
+        self.first_byte = None
+        self.finished = None
+
+    @property
+    def seconds(self):
+        """Seconds from the first attempt to the end of the body, or until now."""
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self):
+        """Return the stats as a dict with the times in milliseconds."""
+        first_byte = None if self.first_byte is None else (self.first_byte - self.started) * 1000
+        return {'url': self.url, 'status': self.status, 'attempts': self.attempts,
+                'resumes': self.resumes, 'encoding': self.encoding,
+                'wire_bytes': self.wire_bytes, 'body_bytes': self.body_bytes,
+                'first_byte_ms': first_byte, 'total_ms': self.seconds * 1000,
+                'done': self.finished is not None}
+
+
+def session():
+    """Return the session shared by the downloads, made the first time."""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            # retries are done here, so they can be counted and jittered
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                                  max_retries=0)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return _session
+
+
+def recent_stats(number=MAX_STATS):
+    """Return the stats of the latest requests as dicts, the newest last."""
+    with _stats_lock:
+        return [stats.as_dict() for stats in list(_stats)[-number:]]
+
+
+def backoff(attempt, retry_after=None):
+    """Return the seconds to wait before the retry after the given failed attempt,
+    a random time up to the doubled backoff ("full jitter"), so clients that failed
+    together don't all come back at the same moment."""
+    if retry_after is not None and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF * 2 ** attempt))
+
+
+def get(url, headers=None, stats=None):
+    """Send a GET request and return the streamed response once its headers arrive.
+
+    Connection errors, timeouts and the RETRY_STATUSES are tried again up to RETRIES
+    times, the last response or error is returned or raised. The body is read with
+    iter_body.
+    """
+    if stats is None:
+        stats = RequestStats(url)
+        with _stats_lock:
+            _stats.append(stats)
+    attempt = 0
+    while True:
+        stats.attempts += 1
+        try:
+            response = session().get(url, headers=headers, stream=True,
+                                     timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= RETRIES:
+                stats.finished = time.perf_counter()
+                raise
+            wait = backoff(attempt)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= RETRIES:
+                break
+            wait = backoff(attempt, response.headers.get('Retry-After'))
+            release(response)
+        instrumentation.count('http retries')
+        time.sleep(wait)
+        attempt += 1
+    if stats.first_byte is None:
+        # a resumed body keeps the status and the encoding of its first response
+        stats.status = response.status_code
+        stats.encoding = response.headers.get('Content-Encoding')
+        stats.first_byte = time.perf_counter()
+    if response.status_code >= 300:
+        release(response)
+    stats.finished = time.perf_counter()
+    response.stats = stats
+    instrumentation.count('http requests')
+    return response
+
+
+def release(response):
+    """Read the small body of a 304 or an error, which gives the connection back
+    to the pool instead of closing it."""
+    try:
+        response.content  # pylint: disable=pointless-statement
+    except requests.RequestException:
+        response.close()
+
+
+def iter_body(response, progress=None):
+    """Yield the decompressed body of a response from get() chunk by chunk.
+
+    progress(received, total) is called after each chunk with the bytes received
+    and the Content-Length, which counts the compressed bytes. If the connection
+    breaks, the rest is downloaded with a Range request when the server allows it,
+    otherwise the error is raised.
+    """
+    if progress is None:
+        def progress(received, total):
+            pass
+    stats = response.stats
+    total = response.headers.get('Content-Length')
+    total = int(total) if total is not None else None
+    decoder = Decoder(response.headers.get('Content-Encoding'))
+    received = 0
+    progress(received, total)
+    while True:
+        try:
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                received += len(chunk)
+                stats.wire_bytes += len(chunk)
+                instrumentation.count('bytes downloaded', len(chunk))
+                progress(received, total)
+                for data in decoder.decompress(chunk):
+                    stats.body_bytes += len(data)
+                    yield data
+            break
+        except (urllib3.exceptions.HTTPError, OSError) as error:
+            response.close()
+            if stats.resumes >= RETRIES:
+                raise requests.ConnectionError(error) from error
+            response = resume(response, received, error)
+    data = decoder.flush()
+    if data:
+        stats.body_bytes += len(data)
+        yield data
+    stats.finished = time.perf_counter()
+
+
+def resume(response, received, error):
+    """Request the body of a broken response from the byte received on and return
+    the new response, or raise if the server can't send exactly that part."""
+    stats = response.stats
+    validator = range_validator(response)
+    if validator is None:
+        raise requests.ConnectionError(error) from error
+    time.sleep(backoff(stats.resumes))
+    stats.resumes += 1
+    instrumentation.count('http resumes')
+    headers = {name: value for name, value in response.request.headers.items()
+               if name not in ('If-None-Match', 'If-Modified-Since')}
+    headers['Range'] = f'bytes={received}-'
+    # the server sends the whole new body instead of a part if the body has changed
+    headers['If-Range'] = validator
+    part = get(response.url, headers, stats)
+    content_range = part.headers.get('Content-Range', '')
+    if part.status_code != 206 or not content_range.startswith(f'bytes {received}-'):
+        part.close()
+        raise ResumeError(f"{response.url} changed or can't be resumed "
+                          f"(status {part.status_code}).") from error
+    return part
+
+
+def range_validator(response):
+    """Return the validator to send in If-Range to resume the response,
+    or None if the server doesn't accept ranges or didn't send one."""
+    if response.headers.get('Accept-Ranges') != 'bytes':
+        return None
+    etag = response.headers.get('ETag')
+    # weak validators can't be used for ranges
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+class Decoder:
+    """Decompresses a body given in pieces as it was sent, the raw bytes are kept
+    as they came so a broken body can be resumed at a byte of them."""
+    def __init__(self, encoding):
+        self.encoding = (encoding or 'identity').strip().lower()
+        if self.encoding == 'gzip':
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._zlib = zlib.decompressobj()
+            self._first = True
+        elif self.encoding == 'identity':
+            self._zlib = None
+        else:
+            raise requests.ContentDecodingError(f"Unsupported encoding {encoding}.")
+
+    def decompress(self, chunk):
+        """Yield the decompressed bytes of the next piece of the body in pieces of at
+        most CHUNK_SIZE bytes, so a well compressed piece doesn't take much memory."""
+        if self._zlib is None:
+            yield chunk
+            return
+        if self.encoding == 'deflate' and self._first:
+            self._first = False
+            try:
+                data = self._zlib.decompress(chunk, CHUNK_SIZE)
+            except zlib.error:
+                # some servers send raw deflate data without the zlib header
+                self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+                data = self._zlib.decompress(chunk, CHUNK_SIZE)
+        else:
+            data = self._zlib.decompress(chunk, CHUNK_SIZE)
+        while data:
+            yield data
+            data = self._zlib.decompress(self._zlib.unconsumed_tail, CHUNK_SIZE)
+
+    def flush(self):
+        """Return the last decompressed bytes once the whole body is received."""
+        return self._zlib.flush() if self._zlib is not None else b''